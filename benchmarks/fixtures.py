@@ -0,0 +1,160 @@
+'''
+Deterministic synthetic fixtures of the benchmarks: media files generated
+with FFmpeg, speech with a known transcript and SRT files with thousands of
+cues.
+'''
+import os
+import random
+import subprocess
+
+import numpy as np
+
+from transcripter import subtitles
+
+# Speech-like noise: pink noise bursts of SPEECH_DURATION seconds separated
+# by PAUSE_DURATION seconds of near silence, over a quiet tone.
+SPEECH_DURATION = 2.5
+PAUSE_DURATION = 1.5
+NOISE_SEED = 42
+WORDS = [
+    "the", "shot", "needs", "more", "anticipation", "before", "jump",
+    "rig", "render", "farm", "layout", "camera", "timing", "is", "too",
+    "fast", "on", "this", "frame", "we", "should", "fix", "the", "arc",
+    "of", "hand", "and", "keep", "pose", "clean", "for", "review",
+]
+# Transcript of the synthesized speech fixture
+SPEECH_TEXT = (
+    "The first shot of the sequence needs more anticipation before the "
+    "jump. The camera moves too fast on the last frames, so we should "
+    "slow it down and keep the pose of the hand clean. Send the new "
+    "layout to the render farm tonight, the director wants to review it "
+    "tomorrow morning.")
+
+
+def generate_media(output_dir, duration, with_video=True):
+    """
+    Generates a media file of duration seconds and returns its path. Files
+    are reused when they already exist, the content only depends on the
+    duration.
+    """
+    extension = "mp4" if with_video else "wav"
+    media_file = os.path.join(
+        output_dir, f"synthetic_{duration}s.{extension}")
+    if os.path.exists(media_file):
+        return media_file
+
+    period = SPEECH_DURATION + PAUSE_DURATION
+    audio_filter = (
+        f"anoisesrc=color=pink:seed={NOISE_SEED}:amplitude=0.4:"
+        f"duration={duration},"
+        f"volume='if(lt(mod(t,{period}),{SPEECH_DURATION}),1,0.005)'"
+        ":eval=frame[noise];"
+        f"sine=frequency=220:duration={duration},volume=0.05[tone];"
+        "[noise][tone]amix=inputs=2:duration=shortest[audio]"
+    )
+    command = [
+        os.environ["FFMPEG"], "-y", "-loglevel", "error",
+        "-filter_complex", audio_filter,
+    ]
+    if with_video:
+        command += [
+            "-f", "lavfi",
+            "-i", f"color=c=black:s=128x72:r=5:d={duration}",
+            "-map", "0:v", "-map", "[audio]",
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", "50",
+            "-c:a", "aac",
+        ]
+    else:
+        command += ["-map", "[audio]", "-ac", "1", "-ar", "16000"]
+    os.makedirs(output_dir, exist_ok=True)
+    subprocess.run(command + [media_file], check=True)
+    return media_file
+
+
+def generate_speech(output_dir, text=SPEECH_TEXT):
+    """
+    Synthesizes text to a 16 kHz mono wav file with the flite filter of
+    FFmpeg and returns its path, None if FFmpeg is built without flite.
+    Files are reused when they already exist.
+    """
+    speech_file = os.path.join(output_dir, "speech.wav")
+    text_file = os.path.join(output_dir, "speech.txt")
+    if os.path.exists(speech_file) and os.path.exists(text_file):
+        with open(text_file, "r", encoding="utf-8") as file:
+            if file.read() == text:
+                return speech_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(text_file, "w", encoding="utf-8") as file:
+        file.write(text)
+    command = [
+        os.environ["FFMPEG"], "-y", "-loglevel", "error",
+        "-f", "lavfi",
+        # The path is an option value, its separators need escaping
+        "-i", f"flite=textfile='{text_file.replace(os.sep, '/')}':voice=slt",
+        "-ac", "1", "-ar", "16000",
+        speech_file
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return speech_file
+
+
+# Edge cases of the SRT parser: (content, expected cue texts)
+SRT_PARSER_CASES = [
+    # Cue without text
+    ("1\n00:00:01,000 --> 00:00:02,000\n\n"
+     "2\n00:00:03,000 --> 00:00:04,000\nhello\n\n",
+     ["", "hello"]),
+    # Cue without text nor blank line
+    ("1\n00:00:01,000 --> 00:00:02,000\n"
+     "2\n00:00:03,000 --> 00:00:04,000\nhello\n",
+     ["", "hello"]),
+    # Multi-line text, CRLF line endings and no final newline
+    ("1\r\n00:00:01,000 --> 00:00:02,000\r\nhello\r\nworld\r\n\r\n"
+     "2\r\n00:00:03,000 --> 00:00:04,000\r\nbye",
+     ["hello\nworld", "bye"]),
+    # VTT header and cue settings
+    ("WEBVTT\n\n00:01.000 --> 00:02.000 align:start\nhello\n\n"
+     "00:03.000 --> 00:04.000\nworld\n",
+     ["hello", "world"]),
+]
+
+
+def generate_texts(count, seed=0):
+    """Returns count sentence-like cue texts."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(3, 12))
+        text = " ".join(words).capitalize()
+        texts.append(text + rng.choice([".", ".", ",", "?", ""]))
+    return texts
+
+
+def generate_track(cue_count, seed=0, start=0.0):
+    """Returns a SubtitleTrack of cue_count cues starting at start seconds."""
+    rng = np.random.default_rng(seed)
+    durations = rng.integers(800, 4000, cue_count)
+    gaps = rng.integers(50, 1500, cue_count)
+    starts = int(start * 1000) + np.cumsum(gaps + durations) - durations
+    return subtitles.SubtitleTrack.from_texts(
+        starts, starts + durations, generate_texts(cue_count, seed))
+
+
+def generate_srt_files(output_dir, file_count, cues_per_file):
+    """
+    Writes file_count consecutive SRT files, like the ones of the chunks of
+    a video, and returns their paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    srt_files = []
+    start = 0.0
+    for i in range(file_count):
+        track = generate_track(cues_per_file, seed=i, start=start)
+        start = track.ends[-1] / 1000
+        srt_file = os.path.join(output_dir, f"synthetic_{i:03d}.srt")
+        track.save(srt_file)
+        srt_files.append(srt_file)
+    return srt_files
@@ -0,0 +1,211 @@
+'''
+Parity check of the speech recognition backends: transcribes the same
+speech with every backend, and with batched Whisper decoding, and compares
+the transcripts with the one of the reference backend (openai-whisper) and
+with the reference transcript of the speech.
+
+Run from the project folder:
+
+    python -m benchmarks.parity
+    python -m benchmarks.parity --input interview.wav --reference interview.txt
+
+Without --input, speech synthesized from a known text is transcribed, it
+needs an FFmpeg built with the flite filter. The exit code is 1 when a
+transcript differs from the reference backend or from the reference
+transcript by more than --max-wer (word error rate). When a reference has
+no words, any transcribed word is a difference.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+# Both backends are compared on CPU
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+from benchmarks import fixtures  # noqa: E402
+from benchmarks.run import get_words, word_error_rate  # noqa: E402
+from transcripter import ffmpeg  # noqa: E402
+from transcripter import backends  # noqa: E402
+from transcripter import transcribe  # noqa: E402
+
+REFERENCE_BACKEND = "whisper"
+BATCHED_NAME = "whisper-batched"
+# The same audio is decoded this many times in a batch
+BATCH_SIZE = 2
+# Decoding options shared by both backends
+OPTIONS = {
+    "mode": "transcribe",
+    "language": None,
+    "beam_size": 1,
+    "temperature": 0.0,
+    "word_timestamps": False,
+    "compression_ratio_threshold": 2.4,
+    "prompt": None,
+}
+
+
+def get_available_backends():
+    """Returns the names of the backends whose package is installed."""
+    packages = {"whisper": "whisper", "faster-whisper": "faster_whisper"}
+    available = []
+    for name in backends.BACKENDS:
+        try:
+            __import__(packages[name])
+        except ImportError:
+            print(f"{name}: skipped, its package is not installed")
+            continue
+        available.append(name)
+    return available
+
+
+def get_segments_text(segments):
+    return " ".join(segment["text"].strip() for segment in segments)
+
+
+def transcribe_batched(audio_file, model_size):
+    """Transcribes audio_file with batched Whisper decoding."""
+    chunk_segments = transcribe.transcript_batched(
+        [(audio_file, 0)] * BATCH_SIZE,
+        batch_size=BATCH_SIZE,
+        model_size=model_size,
+        fp16=False,
+        mode=OPTIONS["mode"],
+        language=OPTIONS["language"],
+        beam_size=OPTIONS["beam_size"],
+        temperature=OPTIONS["temperature"],
+        compression_ratio_threshold=OPTIONS["compression_ratio_threshold"],
+        prompt=OPTIONS["prompt"])
+    return chunk_segments[0]
+
+
+def compare_backends(audio_file, model_size, backend_names,
+                     reference_text=None):
+    """
+    Transcribes audio_file with every backend and returns
+    {backend: {"text", "segments", "time", "parity_word_error_rate",
+    "word_error_rate"}}, the word error rates being computed against the
+    reference backend and against reference_text. Rates are None when their
+    reference has no words.
+    """
+    results = {}
+    for name in backend_names:
+        backend = backends.get_backend(name, model_size, device="cpu")
+        backend.load()
+        start_time = time.perf_counter()
+        segments = backend.transcribe(audio_file, OPTIONS)
+        results[name] = {
+            "text": get_segments_text(segments),
+            "segments": len(segments),
+            "time": time.perf_counter() - start_time,
+        }
+    if REFERENCE_BACKEND in backend_names:
+        start_time = time.perf_counter()
+        segments = transcribe_batched(audio_file, model_size)
+        results[BATCHED_NAME] = {
+            "text": get_segments_text(segments),
+            "segments": len(segments),
+            "time": time.perf_counter() - start_time,
+        }
+    reference = results[REFERENCE_BACKEND]["text"]
+    for result in results.values():
+        result["parity_word_error_rate"] = word_error_rate(
+            reference, result["text"])
+        result["word_error_rate"] = (
+            word_error_rate(reference_text, result["text"])
+            if reference_text is not None else None)
+    return results
+
+
+def is_over(reference, hypothesis, max_wer):
+    """
+    Whether hypothesis differs from reference by more than max_wer. Without
+    reference words, any word of the hypothesis is a difference.
+    """
+    wer = word_error_rate(reference, hypothesis)
+    if wer is None:
+        return bool(get_words(hypothesis))
+    return wer > max_wer
+
+
+def format_wer(wer):
+    return "  n/a" if wer is None else f"{wer:.3f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.parity", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--input", nargs="+",
+        help="Audio or video files of speech (default: synthesized speech)")
+    parser.add_argument(
+        "--reference", nargs="+",
+        help="Text files with the transcript of every input, in order")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument(
+        "--max-wer", type=float, default=0.3,
+        help="Allowed word error rate against the references")
+    parser.add_argument(
+        "--work-dir", default=os.path.join(
+            tempfile.gettempdir(), "transcripter_benchmarks"))
+    parser.add_argument("-o", "--output", help="JSON results file")
+    args = parser.parse_args(argv)
+    if args.reference and len(args.reference) != len(args.input or []):
+        parser.error("--reference needs one text file per --input file")
+
+    backend_names = get_available_backends()
+    if REFERENCE_BACKEND not in backend_names:
+        print("Parity check skipped, it needs openai-whisper")
+        return 0
+
+    ffmpeg.setup_ffmpeg()
+    if args.input:
+        input_files = args.input
+        reference_texts = [None] * len(input_files)
+        for i, reference_file in enumerate(args.reference or []):
+            with open(reference_file, "r", encoding="utf-8") as file:
+                reference_texts[i] = file.read()
+    else:
+        speech_file = fixtures.generate_speech(
+            os.path.join(args.work_dir, "speech"))
+        if speech_file is None:
+            print("Parity check skipped, FFmpeg has no flite filter to "
+                  "synthesize speech: give --input and --reference")
+            return 0
+        input_files = [speech_file]
+        reference_texts = [fixtures.SPEECH_TEXT]
+
+    output = {}
+    failed = False
+    for input_file, reference_text in zip(input_files, reference_texts):
+        audio_file = ffmpeg.extract_audio(input_file, args.work_dir)
+        results = compare_backends(
+            audio_file, args.model, backend_names, reference_text)
+        output[input_file] = results
+        print(f">>> {os.path.basename(input_file)}")
+        for name, result in results.items():
+            over = is_over(
+                results[REFERENCE_BACKEND]["text"], result["text"],
+                args.max_wer)
+            if reference_text is not None:
+                over |= is_over(reference_text, result["text"], args.max_wer)
+            failed = failed or over
+            print(
+                f"{name:<20} {result['time']:>8.2f} sec "
+                f"{result['segments']:>4} segments  "
+                f"WER {format_wer(result['word_error_rate'])} "
+                f"(parity {format_wer(result['parity_word_error_rate'])})"
+                f"{'  OVER THRESHOLD' if over else ''}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=4)
+        print(f">>> Results written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+'''
+Stage-level benchmarks of the transcription pipeline on synthetic fixtures.
+
+Run from the project folder:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --threshold 0.2
+
+Each stage is timed separately and repeated. Runs are compared on their
+fastest repetition, the least sensitive to the load of the machine. With
+--baseline, the exit code is 1 when a stage is slower than the baseline by
+more than the threshold.
+'''
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# The ASR benchmark measures the CPU real-time factor
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+from benchmarks import fixtures  # noqa: E402
+from transcripter import ffmpeg  # noqa: E402
+from transcripter import subtitles  # noqa: E402
+
+RESULTS_VERSION = 1
+DURATIONS = [60, 300, 900]
+CHUNK_DURATION = 60
+# Times below this are too noisy to be compared
+MIN_COMPARABLE_TIME = 0.01
+# Words compared by the word error rate, punctuation is ignored
+WORD_PATTERN = re.compile(r"[\w']+")
+BENCHMARKS = []
+
+
+class SkipBenchmark(Exception):
+    """Raised when a benchmark can't run here (missing package or model)."""
+
+
+def benchmark(function):
+    BENCHMARKS.append(function)
+    return function
+
+
+class Timer:
+    """Runs and times the cases of the benchmarks."""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+        # Derived values, not compared with the baseline
+        self.metrics = {}
+
+    def measure(self, name, function, setup=None, audio_duration=None,
+                repeat=None):
+        """
+        Times function, called after setup() on every run, and records the
+        median and fastest times. With audio_duration, also records the
+        real-time factor (processing time / audio duration).
+        """
+        runs = []
+        for _ in range(repeat or self.repeat):
+            if setup:
+                setup()
+            start_time = time.perf_counter()
+            function()
+            runs.append(time.perf_counter() - start_time)
+
+        result = {
+            "median": statistics.median(runs),
+            "min": min(runs),
+            "runs": runs,
+        }
+        if audio_duration:
+            result["rtf"] = result["median"] / audio_duration
+        self.results[name] = result
+        rtf = f" (RTF {result['rtf']:.3f})" if audio_duration else ""
+        print(f"{name:<40} {result['median']:>9.3f} sec{rtf}")
+
+    def record(self, name, **values):
+        """Records values computed from the measures, e.g. a speed-up."""
+        self.metrics[name] = values
+        print(f"{name:<40} " + ", ".join(
+            f"{key} {value:.3f}" for key, value in values.items()))
+
+
+def get_words(text):
+    """Lower case words of text, without punctuation."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word level edit distance divided by the number of reference words.
+    None when the reference has no words, the rate is undefined.
+    """
+    reference = get_words(reference)
+    hypothesis = get_words(hypothesis)
+    if not reference:
+        return None
+    distances = list(range(len(hypothesis) + 1))
+    for i, reference_word in enumerate(reference, start=1):
+        previous, distances[0] = distances[0], i
+        for j, hypothesis_word in enumerate(hypothesis, start=1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1,
+                distances[j - 1] + 1,
+                previous + (reference_word != hypothesis_word))
+    return distances[-1] / len(reference)
+
+
+def reset_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+@benchmark
+def bench_chunking(timer, context):
+    output_dir = os.path.join(context["work_dir"], "chunks")
+    for duration, media_file in context["media"].items():
+        timer.measure(
+            f"split_video_into_chunks/{duration}s",
+            lambda: ffmpeg.split_video_into_chunks(
+                media_file, CHUNK_DURATION, output_dir),
+            setup=lambda: reset_dir(output_dir))
+        for skip_silence in (False, True):
+            name = "split_audio_vad" if skip_silence else "split_audio"
+            timer.measure(
+                f"{name}/{duration}s",
+                lambda: ffmpeg.split_into_chunks(
+                    media_file, CHUNK_DURATION, "audio", skip_silence,
+                    output_dir),
+                setup=lambda: reset_dir(output_dir))
+        timer.measure(
+            f"stream_audio_chunks/{duration}s",
+            lambda: list(ffmpeg.iter_audio_stream_chunks(
+                media_file, CHUNK_DURATION, output_dir)),
+            setup=lambda: reset_dir(output_dir))
+
+
+@benchmark
+def bench_transcription(timer, context):
+    try:
+        import whisper  # noqa: F401
+    except ImportError:
+        raise SkipBenchmark("openai-whisper is not installed")
+    from transcripter import transcribe
+
+    # Whisper is slow on CPU, transcribe the shortest fixture only
+    duration = min(context["media"])
+    audio_file = ffmpeg.extract_audio(
+        context["media"][duration], context["work_dir"])
+    timer.measure(
+        "load_whisper_model/tiny",
+        lambda: transcribe.load_whisper_model("tiny", device="cpu"),
+        repeat=1)
+    transcripts = {}
+    for quantize in (False, True):
+        # Quantized once and saved in the cache folder, not timed
+        transcribe.load_whisper_model("tiny", device="cpu", quantize=quantize)
+
+        def run(quantize=quantize):
+            segments = transcribe.transcribe_segments(
+                audio_file, model_size="tiny", beam_size=1, temperature=0.0,
+                fp16=False, quantize=quantize)
+            transcripts[quantize] = " ".join(
+                segment["text"] for segment in segments or [])
+
+        timer.measure(
+            f"transcribe_tiny_cpu{'_int8' if quantize else ''}/{duration}s",
+            run, audio_duration=duration)
+
+    # Drift of the int8 transcript, against fp32 as the reference
+    timer.record(
+        f"quantization_tiny_cpu/{duration}s",
+        speed_up=(
+            timer.results[f"transcribe_tiny_cpu/{duration}s"]["min"]
+            / timer.results[f"transcribe_tiny_cpu_int8/{duration}s"]["min"]),
+        word_error_rate=word_error_rate(transcripts[False], transcripts[True]))
+
+
+@benchmark
+def bench_subtitles(timer, context):
+    for content, expected_texts in fixtures.SRT_PARSER_CASES:
+        texts = subtitles.SubtitleTrack.parse(content).texts()
+        if texts != expected_texts:
+            raise AssertionError(
+                f"SRT parser returned {texts!r} instead of "
+                f"{expected_texts!r} for {content!r}")
+
+    srt_dir = os.path.join(context["work_dir"], "srt")
+    file_count, cues_per_file = 20, 1000
+    srt_files = fixtures.generate_srt_files(
+        srt_dir, file_count, cues_per_file)
+    video_path = os.path.join(srt_dir, "merged.mp4")
+    cue_count = file_count * cues_per_file
+
+    timer.measure(
+        f"merge_srt_files/{file_count}x{cues_per_file}",
+        lambda: subtitles.merge_srt_files(srt_files, video_path, "en"))
+    merged_srt = subtitles.get_srt_path(video_path, "en")
+    timer.measure(
+        f"parse_srt/{cue_count}",
+        lambda: subtitles.SubtitleTrack.load(merged_srt))
+    track = subtitles.SubtitleTrack.load(merged_srt)
+    timer.measure(f"to_srt/{cue_count}", track.to_srt)
+
+
+@benchmark
+def bench_translation(timer, context):
+    try:
+        import argostranslate  # noqa: F401
+        import langdetect  # noqa: F401
+    except ImportError:
+        raise SkipBenchmark("argostranslate or langdetect is not installed")
+    from transcripter import translate
+
+    if not translate.is_pair_available("en", "fr"):
+        raise SkipBenchmark("the en -> fr Argos model is not installed")
+
+    srt_dir = os.path.join(context["work_dir"], "translate")
+    cue_count = 500
+    os.makedirs(srt_dir, exist_ok=True)
+    input_srt = os.path.join(srt_dir, "input.en.srt")
+    fixtures.generate_track(cue_count).save(input_srt)
+    translate.get_translator("en", "fr")
+    timer.measure(
+        f"translate_srt/{cue_count}",
+        lambda: translate.translate_srt(
+            os.path.join(srt_dir, "input.mp4"), input_srt, "fr",
+            use_translation_memory=False))
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Prints the change of every stage against the baseline and returns the
+    names of the stages slower by more than threshold (0.2 = 20%).
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference or reference["min"] < MIN_COMPARABLE_TIME:
+            continue
+        change = result["min"] / reference["min"] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<40} {reference['min']:>9.3f} -> "
+            f"{result['min']:>9.3f} sec {change:+7.1%}"
+            f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--durations", type=int, nargs="+", default=DURATIONS,
+        help="Durations of the synthetic media files in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--only", nargs="+",
+        help="Run only the benchmarks whose name contains these words")
+    parser.add_argument(
+        "--work-dir", default=os.path.join(
+            tempfile.gettempdir(), "transcripter_benchmarks"),
+        help="Folder of the fixtures, reused between runs")
+    parser.add_argument("-o", "--output", help="JSON results file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="Allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    ffmpeg.setup_ffmpeg()
+    media_dir = os.path.join(args.work_dir, "media")
+    print(">>> Generating fixtures...")
+    context = {
+        "work_dir": args.work_dir,
+        "media": {
+            duration: fixtures.generate_media(media_dir, duration)
+            for duration in sorted(args.durations)},
+    }
+
+    timer = Timer(args.repeat)
+    skipped = {}
+    for function in BENCHMARKS:
+        name = function.__name__[len("bench_"):]
+        if args.only and not any(word in name for word in args.only):
+            continue
+        try:
+            function(timer, context)
+        except SkipBenchmark as e:
+            skipped[name] = str(e)
+            print(f"{name}: skipped, {e}")
+
+    output = {
+        "version": RESULTS_VERSION,
+        "commit": get_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": timer.results,
+        "metrics": timer.metrics,
+        "skipped": skipped,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=4)
+        print(f">>> Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare_results(
+            timer.results, baseline, args.threshold)
+        if regressions:
+            print(f">>> {len(regressions)} stages regressed: "
+                  f"{', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+'''
+Startup budget check: time from a fresh interpreter to the main window
+being shown, and the heavy packages imported by then.
+
+Run from the project folder:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget 1.5 --repeat 5
+
+The exit code is 1 when the fastest start is over the budget or when a
+machine learning package is imported before the window is shown.
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from transcripter import ffmpeg
+from transcripter import constants
+
+# Only needed once a job is launched, imported in the background
+HEAVY_MODULES = [
+    "torch", "whisper", "transformers", "argostranslate", "langdetect",
+    "ctranslate2", "sentencepiece", "stanza"]
+
+# Run in a fresh interpreter, the window is built like main.py does but
+# without the background warm-up. FFMPEG is set in its environment, like
+# the launcher does.
+STARTUP_SCRIPT = '''
+import sys
+import json
+import time
+start_time = time.perf_counter()
+from PySide6 import QtWidgets
+from transcripter import main
+app = QtWidgets.QApplication(sys.argv)
+window = main.VideoTranscriptor()
+window.show()
+app.processEvents()
+print(json.dumps({
+    "time_to_window": time.perf_counter() - start_time,
+    "imported": [m for m in HEAVY_MODULES if m in sys.modules],
+}))
+'''
+
+
+def measure_startup():
+    """
+    Starts the app in a new process and returns the seconds until the
+    window is shown and the heavy modules imported by then.
+    """
+    environment = dict(os.environ)
+    # No display needed
+    environment.setdefault("QT_QPA_PLATFORM", "offscreen")
+    script = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{STARTUP_SCRIPT}"
+    process = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True,
+        env=environment)
+    if process.returncode:
+        raise RuntimeError(
+            f"The app failed to start:\n{process.stderr.strip()}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    return result["time_to_window"], result["imported"]
+
+
+def is_gui_available():
+    try:
+        import PySide6  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.startup", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--budget", type=float, default=constants.STARTUP_BUDGET,
+        help="Seconds allowed until the window is shown")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if not is_gui_available():
+        print("Startup check skipped, PySide6 is not installed")
+        return 0
+    # Outside of the measure, the window reads it when it is built
+    ffmpeg.setup_ffmpeg()
+
+    times = []
+    imported = set()
+    for _ in range(args.repeat):
+        time_to_window, modules = measure_startup()
+        times.append(time_to_window)
+        imported.update(modules)
+    fastest = min(times)
+    print(f"Time to window: {fastest:.3f} sec (budget {args.budget} sec)")
+
+    failed = False
+    if fastest > args.budget:
+        print(">>> The window is shown over the startup budget")
+        failed = True
+    if imported:
+        print(f">>> Imported before the window is shown: "
+              f"{', '.join(sorted(imported))}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+'''
+Headless batch mode: python -m transcripter [files, globs...] [options]
+
+Transcribes and translates many files without a display. Models are loaded
+once and stay resident for every file, files are processed concurrently
+up to --jobs, and a JSON summary of every file is printed at the end. The
+logs go to stderr, so that stdout only carries the summary.
+'''
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import contextlib
+from concurrent import futures
+
+from transcripter import ffmpeg
+from transcripter import models
+from transcripter import planner
+from transcripter import constants
+from transcripter import processing
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog=f"python -m {constants.TOOLNAME}",
+        description="Transcribe and translate video files to SRT subtitles.")
+    parser.add_argument(
+        "inputs", nargs="*",
+        help="Video files or glob patterns (use quotes, ** is recursive)")
+    parser.add_argument(
+        "-m", "--manifest",
+        help="Text file listing one video file or glob pattern per line")
+    parser.add_argument(
+        "-l", "--language", default=list(constants.LANGUAGE_CODES)[0],
+        help="Target language, name or code "
+        f"({', '.join(constants.LANGUAGE_CODES.values())})")
+    parser.add_argument(
+        "--model", default=constants.MODEL,
+        choices=constants.SETTING_NAMES_MODEL)
+    parser.add_argument(
+        "--beam-size", type=float, default=constants.BEAM_SIZE)
+    parser.add_argument(
+        "--temperature", type=float, default=constants.TEMPERATURE)
+    parser.add_argument(
+        "--compression-ratio", type=float,
+        default=constants.COMPRESSION_RATIO)
+    parser.add_argument(
+        "--chunk-duration", type=int, default=constants.CHUNK_DURATION,
+        help="Used with --no-auto-plan")
+    parser.add_argument(
+        "--chunk-mode", default=constants.CHUNK_MODE,
+        choices=constants.CHUNK_MODES)
+    parser.add_argument(
+        "--workers", type=int, default=constants.WORKERS,
+        help="Processes transcribing the chunks of a file (CPU only), "
+        "used with --no-auto-plan")
+    parser.add_argument(
+        "--auto-plan", action=argparse.BooleanOptionalAction,
+        default=constants.AUTO_PLAN,
+        help="Choose the chunk duration and the workers of every file "
+        "from its duration, the CPU cores and the model")
+    parser.add_argument(
+        "--batch-size", type=int, default=constants.BATCH_SIZE)
+    parser.add_argument(
+        "--backend", default=constants.ASR_BACKEND,
+        choices=constants.ASR_BACKENDS, help="Speech recognition engine")
+    parser.add_argument(
+        "--quantize", action="store_true",
+        help="Run the model with int8 weights (CPU only, faster)")
+    parser.add_argument(
+        "--skip-silence", action=argparse.BooleanOptionalAction,
+        default=constants.SKIP_SILENCE,
+        help="Cut chunks in pauses and don't transcribe regions without "
+        "speech")
+    parser.add_argument("--prompt", help="Hint guiding the model")
+    parser.add_argument(
+        "-f", "--force", action="store_true",
+        help="Transcribe again files that already have subtitles")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="Number of files processed concurrently")
+    parser.add_argument(
+        "-o", "--summary",
+        help="Write the JSON summary to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def get_language_code(language):
+    """Accepts a language name ("French") or code ("fr")."""
+    if language in constants.LANGUAGE_CODES.values():
+        return language
+    for name, code in constants.LANGUAGE_CODES.items():
+        if name.lower() == language.lower():
+            return code
+    raise ValueError(f"Unsupported language: {language}")
+
+
+def read_manifest(manifest_path):
+    """Returns the non empty, non comment lines of a manifest file."""
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def collect_input_files(patterns):
+    """
+    Expands glob patterns into a sorted list of unique existing files.
+    Patterns matching nothing are reported and skipped.
+    """
+    input_files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"No file matches {pattern}")
+        input_files.extend(
+            os.path.abspath(match) for match in matches
+            if os.path.isfile(match))
+    return list(dict.fromkeys(input_files))
+
+
+@contextlib.contextmanager
+def logs_to_stderr():
+    """
+    Sends everything written to stdout to stderr, the output of the worker
+    processes and of FFmpeg included.
+    """
+    sys.stdout.flush()
+    try:
+        stdout_fileno = sys.stdout.fileno()
+        stderr_fileno = sys.stderr.fileno()
+    except (AttributeError, OSError, ValueError):
+        # Not backed by files, only the prints of this process are sent
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+        return
+    saved_stdout = os.dup(stdout_fileno)
+    os.dup2(stderr_fileno, stdout_fileno)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_stdout, stdout_fileno)
+        os.close(saved_stdout)
+
+
+def get_job_cores(jobs):
+    """CPU cores of every job when jobs files are processed concurrently."""
+    if jobs <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // jobs)
+
+
+def process_file(input_file, options):
+    """Runs one job and returns its summary entry."""
+    job = processing.TranscriptionJob(file_path=input_file, **options)
+    start_time = time.time()
+    try:
+        final_srt = job.run()
+        error = job.error if final_srt is None else None
+    except Exception as e:
+        final_srt = None
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "input_file": input_file,
+        "srt_file": final_srt,
+        # Untranslated: the subtitles are named after their source language
+        "status": (
+            "failed" if error
+            else "untranslated" if job.translation_error else "done"),
+        "error": error,
+        "translation_error": job.translation_error,
+        "elapsed_time": round(time.time() - start_time, 3),
+        "estimated_time": (
+            job.plan.estimated_time if job.plan else None),
+        "chunks": len(job.job.chunks) if job.job else 0,
+        "failed_chunks": len(job.job.failed) if job.job else 0,
+        "cache_hits": job.cache.hits,
+        "cache_misses": job.cache.misses,
+        "trace_file": job.trace_files[0] if job.trace_files else None,
+        "trace_summary_file": (
+            job.trace_files[1] if job.trace_files else None),
+    }
+
+
+def run_batch(input_files, options, jobs=1):
+    """
+    Processes the files concurrently, jobs at a time, and returns the
+    summary entries in input order.
+    """
+    # Loaded once and shared by every job of the process, unless the chunks
+    # are transcribed in worker processes. The planner chooses the workers
+    # of every file, the model is then loaded by the first job needing it.
+    job = processing.TranscriptionJob(file_path=None, **options)
+    if not (job.auto_plan and planner.can_run_parallel(
+            job.backend, job.batch_size, models.get_device())):
+        job.load_model()
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        pending = {
+            executor.submit(process_file, input_file, options): input_file
+            for input_file in input_files}
+        results = {}
+        for future in futures.as_completed(pending):
+            result = future.result()
+            results[pending[future]] = result
+            print(
+                f">>> [{len(results)}/{len(input_files)}] "
+                f"{result['status']}: {result['input_file']} "
+                f"in {result['elapsed_time']:.2f} sec")
+    return [results[input_file] for input_file in input_files]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with logs_to_stderr():
+        summary = run(args)
+    if summary is None:
+        return 2
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=4)
+    else:
+        print(json.dumps(summary, indent=4))
+    return 1 if summary["failed"] or summary["untranslated"] else 0
+
+
+def run(args):
+    """Processes the input files, returns the summary (None on error)."""
+    patterns = list(args.inputs)
+    if args.manifest:
+        patterns.extend(read_manifest(args.manifest))
+    input_files = collect_input_files(patterns)
+    if not input_files:
+        print("No input file to process.")
+        return None
+
+    try:
+        target_language = get_language_code(args.language)
+        ffmpeg.setup_ffmpeg()
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        return None
+
+    options = {
+        "mode": "translate" if target_language == "en" else "transcribe",
+        "model_size": args.model,
+        "beam_size": args.beam_size,
+        "temperature": args.temperature,
+        "chunk_duration": args.chunk_duration,
+        "compression_threshold": args.compression_ratio,
+        "force_new_srt": args.force,
+        "target_language": target_language,
+        "prompt": args.prompt,
+        "chunk_mode": args.chunk_mode,
+        "workers": args.workers,
+        "skip_silence": args.skip_silence,
+        "batch_size": args.batch_size,
+        "quantize": args.quantize,
+        "backend": args.backend,
+        "auto_plan": args.auto_plan,
+        # Concurrent jobs share the cores between their workers
+        "cores": get_job_cores(args.jobs),
+    }
+
+    start_time = time.time()
+    results = run_batch(input_files, options, jobs=args.jobs)
+    return {
+        "files": results,
+        "done": sum(result["status"] == "done" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "untranslated": sum(
+            result["status"] == "untranslated" for result in results),
+        "elapsed_time": round(time.time() - start_time, 3),
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main())
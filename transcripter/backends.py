@@ -0,0 +1,220 @@
+'''
+Speech recognition engines. Every backend loads a resident model and
+transcribes audio files into segments of the same format, from the same
+decoding options.
+'''
+import os
+import types
+import typing
+import threading
+
+from transcripter import models
+from transcripter import tracing
+from transcripter import constants
+
+
+# Whisper mel frames per second of audio
+FRAMES_PER_SECOND = 100
+_decode_progress = threading.local()
+
+
+class Segment(typing.TypedDict):
+    """A transcribed segment, times in seconds from the start of the file."""
+    start: float
+    end: float
+    text: str
+
+
+class DecodeProgressBar:
+    """
+    Stands in for the tqdm bar of model.transcribe(), which is updated with
+    the mel frames decoded after every 30-second window, and reports the
+    decoded audio seconds to the callback of the calling thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.callback = getattr(_decode_progress, "callback", None)
+        self.frames = 0
+
+    def update(self, frames):
+        self.frames += frames
+        if self.callback:
+            self.callback(self.frames / FRAMES_PER_SECOND)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def install_decode_progress_hook():
+    """Hooks the decoding loop of model.transcribe() once per process."""
+    import whisper.transcribe
+    if not isinstance(whisper.transcribe.tqdm, types.SimpleNamespace):
+        whisper.transcribe.tqdm = types.SimpleNamespace(
+            tqdm=DecodeProgressBar)
+
+
+class ASRBackend:
+    """
+    Base class of the speech recognition engines.
+
+    Decoding options are the ones of transcribe_segments(): mode
+    ("transcribe" or "translate"), language, beam_size, temperature,
+    word_timestamps, compression_ratio_threshold and prompt. Beam search
+    is only used for deterministic (temperature 0) decoding.
+
+    cores limits the CPU threads of the engines that take it per model,
+    None for all of them.
+    """
+    name = None
+
+    def __init__(self, model_size, device=None, fp16=None, quantize=False,
+                 cores=None):
+        self.model_size = model_size
+        self.device = device or models.get_device()
+        # Auto-select fp16 based on device
+        self.fp16 = self.device == "cuda" if fp16 is None else fp16
+        self.quantize = quantize
+        self.cores = cores
+
+    def load(self):
+        """Returns the resident model, loading it on first use."""
+        raise NotImplementedError
+
+    def transcribe(self, audio_file, options, decode_progress_callback=None):
+        """
+        Transcribes an audio file and returns its segments.
+
+        Parameters:
+        - audio_file (str): Path to the audio file.
+        - options (dict): Decoding options.
+        - decode_progress_callback (function): Called with the seconds of
+            audio decoded so far.
+
+        Returns:
+        - List of Segment.
+        """
+        raise NotImplementedError
+
+
+class WhisperBackend(ASRBackend):
+    """
+    openai-whisper, PyTorch on CUDA or CPU. PyTorch threads are set for
+    the whole process, cores is not used.
+    """
+    name = "whisper"
+
+    def load(self):
+        return models.get_whisper_model(
+            self.model_size, device=self.device, fp16=self.fp16,
+            quantize=self.quantize)
+
+    def transcribe(self, audio_file, options, decode_progress_callback=None):
+        model = self.load()
+        install_decode_progress_hook()
+        _decode_progress.callback = decode_progress_callback
+        try:
+            with models.get_registry().get_inference_lock(model), \
+                    tracing.span("transcribe chunk", "asr",
+                                 file=os.path.basename(audio_file)):
+                result = model.transcribe(
+                    audio_file,
+                    task=options["mode"],
+                    language=options.get("language"),
+                    beam_size=options["beam_size"],
+                    temperature=options["temperature"],
+                    word_timestamps=options.get("word_timestamps", False),
+                    fp16=self.fp16,
+                    compression_ratio_threshold=(
+                        options["compression_ratio_threshold"]),
+                    # model.transcribe() replaces the prompt decoding
+                    # option by the previous text
+                    initial_prompt=options.get("prompt"),
+                )
+        finally:
+            _decode_progress.callback = None
+        return [
+            Segment(
+                start=segment["start"],
+                end=segment["end"],
+                text=segment["text"])
+            for segment in result["segments"]
+        ]
+
+
+class FasterWhisperBackend(ASRBackend):
+    """
+    faster-whisper, the Whisper models converted to CTranslate2. Runs with
+    int8 weights on CPU, and in float16 (int8 with quantize) on CUDA.
+    """
+    name = "faster-whisper"
+
+    def get_compute_type(self):
+        if self.device == "cpu":
+            return "int8"
+        return "int8_float16" if self.quantize else "float16"
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        compute_type = self.get_compute_type()
+        cpu_threads = self.cores or os.cpu_count() or 1
+        # Jobs limited to fewer cores get their own model, its threads are
+        # fixed when it is loaded
+        return models.get_registry().get(
+            ("faster-whisper", self.model_size, self.device, compute_type,
+             cpu_threads),
+            lambda: WhisperModel(
+                self.model_size, device=self.device,
+                compute_type=compute_type,
+                cpu_threads=cpu_threads))
+
+    def transcribe(self, audio_file, options, decode_progress_callback=None):
+        model = self.load()
+        # The beam size setting is a float, CTranslate2 needs a beam width
+        beam_size = max(1, int(round(options["beam_size"])))
+        with models.get_registry().get_inference_lock(model), \
+                tracing.span("transcribe chunk", "asr",
+                             file=os.path.basename(audio_file)):
+            # Segments are decoded while they are iterated
+            segments, _ = model.transcribe(
+                audio_file,
+                task=options["mode"],
+                language=options.get("language"),
+                beam_size=beam_size,
+                temperature=options["temperature"],
+                word_timestamps=options.get("word_timestamps", False),
+                compression_ratio_threshold=(
+                    options["compression_ratio_threshold"]),
+                initial_prompt=options.get("prompt"),
+            )
+            result = []
+            for segment in segments:
+                result.append(Segment(
+                    start=segment.start, end=segment.end, text=segment.text))
+                if decode_progress_callback:
+                    decode_progress_callback(segment.end)
+        return result
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (WhisperBackend, FasterWhisperBackend)}
+
+
+def get_backend(name=constants.ASR_BACKEND, model_size="base", device=None,
+                fp16=None, quantize=False, cores=None):
+    """
+    Returns the backend called name. Backends are light, their models are
+    kept resident by the model registry.
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown ASR backend: {name} "
+            f"(available: {', '.join(BACKENDS)})")
+    return backend_class(
+        model_size, device=device, fp16=fp16, quantize=quantize, cores=cores)
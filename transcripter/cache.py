@@ -0,0 +1,173 @@
+'''
+Content-addressed on-disk cache of transcribed chunks.
+'''
+import os
+import json
+import wave
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from transcripter import paths
+from transcripter import constants
+
+# Bump when the stored segments format changes
+CACHE_VERSION = 1
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Size in bytes of the cache directories, tracked by the puts of the
+# process and measured again on eviction
+_cache_sizes = {}
+_cache_sizes_lock = threading.Lock()
+
+
+def hash_audio(audio_file):
+    """
+    Hashes the decoded samples of a PCM wav file, so the key does not depend
+    on the file name or its header. Other files are hashed as is.
+    """
+    digest = hashlib.sha256()
+    try:
+        with wave.open(audio_file, "rb") as source:
+            digest.update(repr(source.getparams()[:3]).encode())
+            while True:
+                frames = source.readframes(READ_BLOCK_SIZE)
+                if not frames:
+                    break
+                digest.update(frames)
+    except (wave.Error, EOFError):
+        digest = hashlib.sha256()
+        with open(audio_file, "rb") as source:
+            for block in iter(lambda: source.read(READ_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Stores the segments of transcribed chunks under a hash of the decoded
+    audio and of the decoding parameters. Segment timestamps are relative to
+    the start of the chunk, so a hit is valid at any offset in any file.
+    The least recently used entries are removed when the cache grows over
+    its size limit.
+    """
+
+    def __init__(self, cache_dir=None,
+                 max_size_mb=constants.TRANSCRIPTION_CACHE_MAX_SIZE_MB):
+        self.cache_dir = cache_dir or os.path.join(
+            paths.get_cache_dir(), "transcriptions")
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, audio_file, **params):
+        """
+        Builds the cache key of a chunk from its audio and the decoding
+        parameters (model, mode, language, beam_size, temperature...).
+        """
+        params = json.dumps(
+            {"version": CACHE_VERSION, **params}, sort_keys=True)
+        digest = hashlib.sha256(hash_audio(audio_file).encode())
+        digest.update(params.encode())
+        return digest.hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached segments of a key, or None on miss."""
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as file:
+                segments = json.load(file)
+        except (IOError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        # Mark as recently used for the LRU eviction
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Evicted since it was read
+            pass
+        self.hits += 1
+        return segments
+
+    def put(self, key, segments):
+        """
+        Stores the segments of a key and evicts old entries once the cache
+        grows over its size limit.
+        """
+        entry_path = self.get_entry_path(key)
+        entry_dir = os.path.dirname(entry_path)
+        temp_path = None
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            # Unique per writer, chunks of several jobs may share a key
+            fd, temp_path = tempfile.mkstemp(dir=entry_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(segments, file)
+            size = os.path.getsize(temp_path)
+            try:
+                size -= os.path.getsize(entry_path)
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, entry_path)
+        except IOError as e:
+            print(f"Error writing transcription cache: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with _cache_sizes_lock:
+            if self.cache_dir not in _cache_sizes:
+                # Measured once per process, the entry is already counted
+                _cache_sizes[self.cache_dir] = self.get_size()
+            else:
+                _cache_sizes[self.cache_dir] += size
+            if _cache_sizes[self.cache_dir] > self.max_size:
+                _cache_sizes[self.cache_dir] = self.evict()
+
+    def get_entries(self):
+        """Returns (last use, size, path) of every file of the cache."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                entry_path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    # Evicted or renamed by another job
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        return entries
+
+    def get_size(self):
+        """Size of the cache in bytes."""
+        return sum(size for _, size, _ in self.get_entries())
+
+    def evict(self):
+        """
+        Removes the least recently used entries over the size limit.
+
+        Returns:
+        - int: Size of the cache in bytes after eviction.
+        """
+        entries = self.get_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return total_size
+
+    def clear(self):
+        """Removes every cached entry."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        with _cache_sizes_lock:
+            _cache_sizes.pop(self.cache_dir, None)
@@ -4,6 +4,7 @@ TOOL_NICENAME = "Video to srt"
 
 PREFERENCES_FILENAME = "transcripter_prefs.json"
 PREFERENCES_DIR_NAME = ".transcripter_prefs"
+CACHE_DIR_NAME = "transcripter"
 
 LANGUAGE_CODES = {
     "English": "en",
@@ -18,6 +19,15 @@ SETTING_NAME_BEAM_SIZE = "Accuracy Level"
 SETTING_NAME_TEMPERATURE = "Creativity Level"
 SETTING_NAME_COMPRESSION_RATIO = "Noise Reduction"
 SETTING_NAME_CHUNK_DURATION = "Chunk Duration"
+SETTING_NAME_WORKERS = "Parallel Workers"
+SETTING_NAME_SKIP_SILENCE = "Skip Silence"
+SETTING_NAME_BATCH_SIZE = "Batch Size"
+SETTING_NAME_QUANTIZE = "Fast CPU Mode (int8)"
+SETTING_NAME_ASR_BACKEND = "Engine"
+SETTING_NAME_AUTO_PLAN = "Auto Chunks & Workers"
+# "audio": demux the audio once and cut it at exact sample boundaries.
+# "video": stream-copy every stream with keyframe aligned cuts (legacy).
+CHUNK_MODES = ["audio", "video"]
 
 
 # DEFAULT VALUES
@@ -26,6 +36,174 @@ BEAM_SIZE = 0.8
 TEMPERATURE = 0.1
 COMPRESSION_RATIO = 3.0
 CHUNK_DURATION = 300
+CHUNK_MODE = CHUNK_MODES[0]
+# Number of processes transcribing chunks concurrently (CPU only)
+WORKERS = 1
+# Number of chunks whose 30-second windows are decoded together (1 = one
+# window at a time). Opt-in: batched windows are not conditioned on the text
+# of the previous window, the transcript may differ slightly.
+BATCH_SIZE = 1
+
+# Speech recognition engines. "faster-whisper" runs the Whisper models
+# converted to CTranslate2, with int8 weights on CPU. Batched and parallel
+# transcription are only available with "whisper".
+ASR_BACKENDS = ["whisper", "faster-whisper"]
+ASR_BACKEND = ASR_BACKENDS[0]
+# Run Whisper and the summarizer with int8 linear layers on CPU (dynamic
+# quantization). Faster, with a small accuracy loss. The quantized models
+# are saved in the cache folder.
+QUANTIZE = False
+# Plan chunk boundaries in pauses and drop silent regions (audio mode only).
+# Off by default: the energy detection can't tell speech from a continuous
+# music or ambience bed as loud as the speech.
+SKIP_SILENCE = False
+# Choose the chunk duration and the number of workers of every job from the
+# duration of the file, the CPU cores and the model (see planner.py)
+AUTO_PLAN = True
+
+# Voice activity detection (seconds and dBFS)
+VAD_FRAME_DURATION = 0.03
+VAD_NOISE_PERCENTILE = 10
+VAD_THRESHOLD_MARGIN_DB = 12.0
+VAD_MIN_SPEECH_DB = -50.0
+VAD_MIN_SPEECH = 0.25
+VAD_MIN_SILENCE = 0.5
+VAD_MAX_PAUSE = 5.0
+VAD_PADDING = 0.2
+# Below this fraction of speech, the detection is not trusted and the whole
+# file is cut in chunks of fixed duration
+VAD_MIN_SPEECH_RATIO = 0.05
+
+# Size of the on-disk cache of transcribed chunks
+TRANSCRIPTION_CACHE_MAX_SIZE_MB = 512
+# Interrupted jobs not resumed after this many days are removed
+JOB_MAX_AGE_DAYS = 7
+
+# Number of sentences translated per model pass
+TRANSLATION_BATCH_SIZE = 32
+TRANSLATION_BEAM_SIZE = 4
+# A sentence without ending punctuation is cut after this many cues
+TRANSLATION_MAX_SENTENCE_CUES = 4
+
+# Argos packages: the local package index is refreshed in the background
+# once older than the TTL, and packages are installed from the mirror folder
+# (.argosmodel files) before trying to download them.
+# TRANSCRIPTER_OFFLINE and TRANSCRIPTER_ARGOS_MIRROR environment variables
+# override these values on render nodes.
+ARGOS_INDEX_TTL_HOURS = 24
+ARGOS_MIRROR_DIR = None
+OFFLINE = False
+
+# Run decoding, transcription, translation and writing as overlapping
+# stages. Only used with sequential transcription (1 worker, batch size 1).
+PIPELINE = True
+# Number of chunks waiting between two pipeline stages
+PIPELINE_QUEUE_SIZE = 2
+
+# Record the spans of every job and export them as Chrome traces in the
+# cache folder. Only the latest TRACES_MAX_COUNT traces are kept.
+TRACING = True
+TRACES_MAX_COUNT = 50
+
+# Progress is computed from the covered audio between these percentages,
+# the remaining time from the real-time factor measured by previous jobs
+# (weighing as ETA_PRIOR_WEIGHT seconds of audio) and the current one.
+PROGRESS_TRANSCRIPTION_START = 5
+PROGRESS_TRANSCRIPTION_END = 90
+# The pipelined execution translates while transcribing
+PROGRESS_PIPELINE_END = 95
+ETA_PRIOR_WEIGHT = 60
+# Without a previous measure, no estimate before this many decoded seconds
+ETA_MIN_DECODED_AUDIO = 10
+# A job stores its real-time factor after decoding this many seconds
+ETA_MIN_MEASURED_AUDIO = 60
+# Seconds between two remaining time updates
+ETA_UPDATE_INTERVAL = 1.0
+
+# Local transcription server shared by the users of a host. Only listens on
+# the loopback interface. TRANSCRIPTER_SERVER overrides the address used by
+# clients ("host:port").
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+# Number of jobs the server runs at the same time
+SERVER_JOBS = 1
+# Seconds between keep-alive messages of the progress event streams
+SERVER_EVENTS_KEEPALIVE = 15
+# Priorities of the jobs of a user are clamped to this range
+SERVER_MAX_PRIORITY = 10
+
+# Packages imported in the background once the window is shown, in order of
+# first use. WARM_UP_DELAY leaves time to the first paint of the window.
+WARM_UP_MODULES = [
+    "torch", "whisper", "langdetect", "argostranslate.translate",
+    "ctranslate2", "sentencepiece"]
+WARM_UP_DELAY_MS = 500
+# Time allowed between the start of the app and the window being shown
+STARTUP_BUDGET = 2.0
+
+# Job planner. Parallel workers get PLANNER_THREADS_PER_WORKER cores each
+# and PLANNER_CHUNKS_PER_WORKER chunks, so they finish close together. N
+# workers run about N * PLANNER_PARALLEL_EFFICIENCY times faster than one.
+# Worker processes report their progress per chunk: a chunk takes at most
+# PLANNER_MAX_CHUNK_TIME seconds to transcribe when the speed allows it.
+PLANNER_THREADS_PER_WORKER = 4
+PLANNER_CHUNKS_PER_WORKER = 3
+PLANNER_PARALLEL_EFFICIENCY = 0.7
+PLANNER_MIN_CHUNK_DURATION = 100
+PLANNER_MAX_CHUNK_DURATION = 600
+PLANNER_MAX_CHUNK_TIME = 180
+# Measure the peak level of the whole audio stream before transcribing a
+# file with its silent regions, and skip it if it is silent. Costs one more
+# decode of the stream.
+PLANNER_CHECK_SILENCE = False
+# Memory of the model of one worker in MB
+MODEL_MEMORY_MB = {"base": 500, "medium": 2500, "large": 5000}
+# Seconds a worker process takes to load its model on CPU, parallel workers
+# only pay off when they save more than that
+MODEL_LOAD_TIME = {"base": 3, "medium": 15, "large": 30}
+# Processing seconds per audio second of a single worker, used to estimate
+# the cost of a job until the real-time factor of its setting is measured
+# (cache/rtf.json). Multiplied by RTF_FACTORS for the faster engine and
+# the int8 models.
+RTF_ESTIMATES = {
+    "cpu": {"base": 0.15, "medium": 0.9, "large": 1.8},
+    "cuda": {"base": 0.02, "medium": 0.05, "large": 0.09},
+}
+RTF_FACTORS = {"faster-whisper": 0.4, "int8": 0.6}
+# Media probes (duration, audio streams) kept in the cache folder
+PROBE_CACHE_MAX_ENTRIES = 2000
+
+# Whisper works on 16 kHz mono audio
+AUDIO_SAMPLE_RATE = 16000
+# Small delay for synchronization of keyframe aligned video chunks
+VIDEO_CHUNK_CORRECTION_OFFSET = 0.2
+
+# Summaries: transcripts are summarized by windows of at most
+# SUMMARY_MAX_INPUT_TOKENS tokens, SUMMARY_BATCH_SIZE windows per model pass,
+# into partial summaries of SUMMARY_PARTIAL_*_LENGTH tokens merged together.
+SUMMARY_MAX_INPUT_TOKENS = 1024
+SUMMARY_BATCH_SIZE = 4
+SUMMARY_PARTIAL_MAX_LENGTH = 128
+SUMMARY_PARTIAL_MIN_LENGTH = 32
+
+# Named presets of settings, applied over the current ones. Profiles saved
+# by the user are stored with the preferences.
+PREFERENCE_PROFILES = {
+    "fast draft": {
+        "model": "base",
+        "skip_silence": True,
+    },
+    "final delivery": {
+        "model": "large",
+        "compression_ratio": COMPRESSION_RATIO,
+        # Nothing is dropped as silence
+        "skip_silence": False,
+    },
+}
+
+# Maximum memory used by resident models (Whisper, translation...) before
+# the least recently used ones are unloaded.
+MODEL_MEMORY_BUDGET_MB = 8192
 
 # These terms are used to add context to the translation.
 # There's a character limit estimated to be around 200–300 characters.
@@ -3,8 +3,85 @@ Creates a virtual environment locally and manage the run script from venv
 '''
 import os
 import venv
+import hashlib
 import subprocess
 
+# Written in the venv once its packages are installed and verified
+FINGERPRINT_FILE = "transcripter_fingerprint.txt"
+
+
+def get_site_packages_dirs(venv_path):
+    """
+    Return the site-packages folders of the virtual environment.
+
+    :param venv_path: Path to the virtual environment.
+    """
+    if os.name == "nt":
+        return [os.path.join(venv_path, "Lib", "site-packages")]
+    lib_path = os.path.join(venv_path, "lib")
+    if not os.path.isdir(lib_path):
+        return []
+    return [
+        os.path.join(lib_path, name, "site-packages")
+        for name in sorted(os.listdir(lib_path))
+        if name.startswith("python")]
+
+
+def get_venv_fingerprint(venv_path, requirements_path, python_executable=None):
+    """
+    Return a hash of what the installed packages depend on: the
+    requirements, the interpreter of the venv and the installed
+    distributions. Only file contents and folder listings are read, so it
+    takes milliseconds.
+
+    :param venv_path: Path to the virtual environment.
+    :param requirements_path: Path to the requirements.txt file.
+    :param python_executable: Python executable used for the venv (optional).
+    """
+    fingerprint = hashlib.sha256()
+    for path in (requirements_path, os.path.join(venv_path, "pyvenv.cfg")):
+        try:
+            with open(path, "rb") as file:
+                fingerprint.update(file.read())
+        except OSError:
+            return None
+    fingerprint.update((python_executable or "").encode("utf-8"))
+    for site_packages in get_site_packages_dirs(venv_path):
+        if not os.path.isdir(site_packages):
+            return None
+        for name in sorted(os.listdir(site_packages)):
+            if name.endswith((".dist-info", ".egg-info")):
+                fingerprint.update(name.encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def read_venv_fingerprint(venv_path):
+    try:
+        with open(os.path.join(venv_path, FINGERPRINT_FILE), "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def write_venv_fingerprint(venv_path, fingerprint):
+    with open(os.path.join(venv_path, FINGERPRINT_FILE), "w") as file:
+        file.write(fingerprint)
+
+
+def verify_packages(pip_executable):
+    """
+    Check that the installed packages have compatible dependencies.
+
+    :param pip_executable: pip of the virtual environment.
+    :return: True if pip check found no problem.
+    """
+    print("Verifying installed packages...")
+    result = subprocess.run(
+        [pip_executable, "check"], text=True, capture_output=True)
+    if result.returncode != 0:
+        print(f"Broken packages:\n{result.stdout.strip()}")
+    return result.returncode == 0
+
 
 def create_venv(
         venv_path, requirements_path, python_executable=None, env_vars=None):
@@ -15,8 +92,11 @@ def create_venv(
     :param requirements_path: Path to the requirements.txt file.
     :param python_executable: Python executable to use for the venv (optional).
     :param env_vars: Dictionary of environment variables (optional).
+
+    The pip step is skipped when the fingerprint of the requirements, the
+    interpreter and the installed packages is the one recorded after the
+    last successful install.
     """
-    print('Installing software, please wait...')
 
     # Check if the virtual environment already exists
     if os.path.exists(venv_path):
@@ -43,7 +123,14 @@ def create_venv(
         venv_path, "Scripts" if os.name == "nt" else "bin", "pip"
     )
 
+    fingerprint = get_venv_fingerprint(
+        venv_path, requirements_path, python_executable)
+    if fingerprint and fingerprint == read_venv_fingerprint(venv_path):
+        print("Packages are up to date.")
+        return
+
     if os.path.exists(requirements_path):
+        print('Installing software, please wait...')
         print(f"Installing packages from: {requirements_path}\n")
 
         try:
@@ -63,6 +150,12 @@ def create_venv(
 
             if process.returncode == 0:
                 print("\n Packages installed successfully.")
+                # pip changed the installed distributions
+                fingerprint = get_venv_fingerprint(
+                    venv_path, requirements_path, python_executable)
+                # Broken packages are installed again on the next launch
+                if verify_packages(pip_executable) and fingerprint:
+                    write_venv_fingerprint(venv_path, fingerprint)
             else:
                 print("\n Package installation failed.")
                 print(process.stderr.read())
@@ -1,13 +1,18 @@
 import os
+import wave
+import shutil
 import zipfile
 import tempfile
 import subprocess
 import urllib.request
 
 from transcripter import paths
+from transcripter import tracing
+from transcripter import constants
 
 
-def split_video_into_chunks(input_video, chunk_duration=400):
+@tracing.traced("split video", "ffmpeg")
+def split_video_into_chunks(input_video, chunk_duration=400, output_dir=None):
     """
     Splits a video into smaller chunks (default: 15 minutes max per chunk)
     and stores them in the Windows temp folder.
@@ -16,13 +21,14 @@ def split_video_into_chunks(input_video, chunk_duration=400):
     - input_video (str): Path to the input video file.
     - chunk_duration (int): Maximum duration per chunk in seconds
     (default: 400s = 5 minutes).
+    - output_dir (str): Folder of the chunks (default: system temp folder).
 
     Returns:
     - List of chunked video file paths stored in the temp folder.
     """
 
     # Get system temp folder
-    temp_dir = tempfile.gettempdir()
+    temp_dir = output_dir or tempfile.gettempdir()
 
     # Extract filename and extension
     input_file_name = os.path.basename(input_video)
@@ -68,6 +74,323 @@ def split_video_into_chunks(input_video, chunk_duration=400):
         return []
 
 
+@tracing.traced("extract audio", "ffmpeg")
+def extract_audio(input_video, output_dir=None,
+                  sample_rate=constants.AUDIO_SAMPLE_RATE, audio_stream=0):
+    """
+    Demuxes an audio stream of a video and downmixes it to a mono 16-bit
+    PCM wav file. Video streams are never copied.
+
+    Parameters:
+    - input_video (str): Path to the input video file.
+    - output_dir (str): Folder of the wav file (default: system temp folder).
+    - sample_rate (int): Output sample rate (default: 16 kHz, Whisper's rate).
+    - audio_stream (int): Index of the audio stream (default: the first).
+
+    Returns:
+    - Path to the extracted wav file, or None if extraction failed.
+    """
+    output_dir = output_dir or tempfile.gettempdir()
+    input_file_name_without_ext, _ = paths.get_filename_without_ext(
+        input_video)
+    output_audio = os.path.join(
+        output_dir, f"{input_file_name_without_ext}_audio.wav")
+
+    ffmpeg_path = os.environ["FFMPEG"]
+    command = [
+        ffmpeg_path,
+        "-y",  # Overwrite leftovers from a previous run
+        "-i", input_video,  # Input file
+        "-map", f"0:a:{audio_stream}",  # Planned audio stream only
+        "-vn", "-sn", "-dn",  # Drop video, subtitle and data streams
+        "-ac", "1",  # Downmix to mono
+        "-ar", str(sample_rate),  # Resample
+        "-c:a", "pcm_s16le",  # Uncompressed, sample addressable
+        output_audio
+    ]
+
+    print(f">>> Extracting audio of {input_video}...")
+    result = subprocess.run(command, check=False)
+    if result.returncode != 0 or not os.path.exists(output_audio):
+        print(f"Error extracting audio from {input_video}")
+        return None
+    return output_audio
+
+
+@tracing.traced("split audio", "ffmpeg")
+def split_audio_into_chunks(audio_file, chunk_duration=400, output_dir=None):
+    """
+    Cuts a wav file into chunks at exact sample boundaries.
+
+    Parameters:
+    - audio_file (str): Path to a PCM wav file (see extract_audio).
+    - chunk_duration (int): Maximum duration per chunk in seconds.
+    - output_dir (str): Folder of the chunks (default: system temp folder).
+
+    Returns:
+    - List of (chunk file path, chunk start time in seconds) tuples.
+    """
+    with wave.open(audio_file, "rb") as source:
+        duration = source.getnframes() / source.getframerate()
+
+    regions = []
+    start = 0
+    while start < duration:
+        regions.append((start, min(start + chunk_duration, duration)))
+        start += chunk_duration
+    return cut_audio_regions(audio_file, regions, output_dir)
+
+
+def cut_audio_regions(audio_file, regions, output_dir=None):
+    """
+    Writes each (start, end) region of a wav file, in seconds, to its own
+    chunk file. Cuts happen at exact sample boundaries.
+
+    Returns:
+    - List of (chunk file path, chunk start time in seconds) tuples. The
+    start time is the one of the first sample of the chunk.
+    """
+    chunks = list(iter_audio_regions(audio_file, regions, output_dir))
+    print(
+        f">>> Successfully created {len(chunks)} chunks in "
+        f"{output_dir or tempfile.gettempdir()}.")
+    return chunks
+
+
+def iter_audio_regions(audio_file, regions, output_dir=None, start_index=0):
+    """
+    Generator version of cut_audio_regions(): each chunk file is written
+    only when the next chunk is requested. The chunks before start_index
+    are skipped.
+    """
+    output_dir = output_dir or tempfile.gettempdir()
+    audio_file_name_without_ext, _ = paths.get_filename_without_ext(
+        audio_file)
+
+    chunk_index = 0
+    with wave.open(audio_file, "rb") as source:
+        params = source.getparams()
+        for start, end in regions:
+            first_frame = min(int(round(start * params.framerate)),
+                              params.nframes)
+            last_frame = min(int(round(end * params.framerate)),
+                             params.nframes)
+            if last_frame <= first_frame:
+                continue
+            if chunk_index < start_index:
+                chunk_index += 1
+                continue
+
+            chunk_file = os.path.join(
+                output_dir,
+                f"{audio_file_name_without_ext}_chunk_{chunk_index:03d}.wav")
+            source.setpos(first_frame)
+            frames = source.readframes(last_frame - first_frame)
+            with wave.open(chunk_file, "wb") as chunk:
+                chunk.setparams(params)
+                chunk.writeframes(frames)
+
+            chunk_index += 1
+            yield chunk_file, first_frame / params.framerate
+
+
+def iter_audio_stream_chunks(input_video, chunk_duration=400, output_dir=None,
+                             sample_rate=constants.AUDIO_SAMPLE_RATE,
+                             audio_stream=0, start_index=0):
+    """
+    Decodes the audio of a video through a pipe and yields each chunk as
+    soon as its samples are decoded, so the next stages can start before
+    the whole file is decoded. Cuts happen at exact sample boundaries.
+    Decoding starts at the chunk start_index.
+
+    Yields:
+    - (chunk file path, chunk start time in seconds) tuples.
+
+    Raises:
+    - RuntimeError: FFmpeg failed, the audio was not decoded to its end.
+    """
+    output_dir = output_dir or tempfile.gettempdir()
+    input_file_name_without_ext, _ = paths.get_filename_without_ext(
+        input_video)
+
+    bytes_per_chunk = int(chunk_duration * sample_rate) * 2
+    start_time = start_index * bytes_per_chunk / 2 / sample_rate
+    ffmpeg_path = os.environ["FFMPEG"]
+    command = [
+        ffmpeg_path,
+        "-nostdin",
+        "-loglevel", "error",  # Errors only, reported if decoding fails
+        "-ss", str(start_time),  # Sample accurate seek when decoding
+        "-i", input_video,  # Input file
+        "-map", f"0:a:{audio_stream}",  # Planned audio stream only
+        "-vn", "-sn", "-dn",  # Drop video, subtitle and data streams
+        "-ac", "1",  # Downmix to mono
+        "-ar", str(sample_rate),  # Resample
+        "-f", "s16le",  # Raw 16-bit PCM
+        "pipe:1"
+    ]
+    print(f">>> Decoding audio of {input_video}...")
+    # A file can't fill up and block FFmpeg like a pipe read at the end
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=stderr_file)
+
+    chunk_index = start_index
+    try:
+        while True:
+            frames = process.stdout.read(bytes_per_chunk)
+            if not frames:
+                break
+            chunk_file = os.path.join(
+                output_dir,
+                f"{input_file_name_without_ext}_chunk_{chunk_index:03d}.wav")
+            with wave.open(chunk_file, "wb") as chunk:
+                chunk.setnchannels(1)
+                chunk.setsampwidth(2)
+                chunk.setframerate(sample_rate)
+                chunk.writeframes(frames)
+
+            yield chunk_file, chunk_index * bytes_per_chunk / 2 / sample_rate
+            chunk_index += 1
+
+        if process.wait() != 0:
+            stderr_file.seek(0)
+            errors = stderr_file.read().decode(errors="replace").strip()
+            raise RuntimeError(
+                f"Error decoding the audio of {input_video}: "
+                f"{errors[-500:] or f'exit code {process.returncode}'}")
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+        stderr_file.close()
+
+
+def split_into_chunks(input_file, chunk_duration=400,
+                      chunk_mode=constants.CHUNK_MODE,
+                      skip_silence=constants.SKIP_SILENCE,
+                      output_dir=None, audio_stream=0):
+    """
+    Splits a media file into chunks using the selected chunk mode.
+
+    Parameters:
+    - input_file (str): Path to the input video file.
+    - chunk_duration (int): Maximum duration per chunk in seconds.
+    - chunk_mode (str): "audio" extracts the audio once and cuts it at exact
+        sample boundaries, "video" stream-copies all streams with the
+        segment muxer (keyframe aligned cuts).
+    - skip_silence (bool): In audio mode, place the chunk boundaries in
+        pauses and drop the regions without speech.
+    - output_dir (str): Folder of the chunks (default: system temp folder).
+    - audio_stream (int): In audio mode, index of the audio stream to
+        transcribe (see probe.select_audio_stream).
+
+    Returns:
+    - List of (chunk file path, chunk start time in seconds) tuples.
+    """
+    if chunk_mode == "video":
+        chunk_files = split_video_into_chunks(
+            input_file, chunk_duration, output_dir)
+        return [
+            (chunk_file,
+             i * chunk_duration + (
+                 constants.VIDEO_CHUNK_CORRECTION_OFFSET if i > 0 else 0))
+            for i, chunk_file in enumerate(chunk_files)]
+
+    audio_file = extract_audio(
+        input_file, output_dir, audio_stream=audio_stream)
+    if not audio_file:
+        return []
+    try:
+        if skip_silence:
+            from transcripter import vad
+            regions = vad.plan_chunks(audio_file, chunk_duration)
+            return cut_audio_regions(audio_file, regions, output_dir)
+        return split_audio_into_chunks(
+            audio_file, chunk_duration, output_dir)
+    finally:
+        os.remove(audio_file)
+
+
+def iter_chunks(input_file, chunk_duration=400,
+                chunk_mode=constants.CHUNK_MODE,
+                skip_silence=constants.SKIP_SILENCE,
+                output_dir=None, audio_stream=0, start_index=0):
+    """
+    Generator version of split_into_chunks(), used by the pipelined
+    execution. Without silence detection, the audio is decoded in a stream
+    and every chunk is yielded as soon as it is decoded. Silence detection
+    needs the whole audio first, then chunks are cut one at a time.
+    The chunks before start_index, planned by an interrupted run, are not
+    yielded again, the audio stream is decoded from the next one.
+
+    Yields:
+    - (chunk file path, chunk start time in seconds) tuples.
+    """
+    if chunk_mode == "video":
+        yield from split_into_chunks(
+            input_file, chunk_duration, chunk_mode, skip_silence,
+            output_dir)[start_index:]
+        return
+
+    if not skip_silence:
+        yield from iter_audio_stream_chunks(
+            input_file, chunk_duration, output_dir,
+            audio_stream=audio_stream, start_index=start_index)
+        return
+
+    audio_file = extract_audio(
+        input_file, output_dir, audio_stream=audio_stream)
+    if not audio_file:
+        return
+    try:
+        from transcripter import vad
+        regions = vad.plan_chunks(audio_file, chunk_duration)
+        yield from iter_audio_regions(
+            audio_file, regions, output_dir, start_index)
+    finally:
+        os.remove(audio_file)
+
+
+def get_ffprobe_path():
+    """FFprobe is shipped next to FFmpeg."""
+    ffmpeg_path = os.environ["FFMPEG"]
+    ffprobe_name = "ffprobe.exe" if ffmpeg_path.endswith(".exe") else "ffprobe"
+    return os.path.join(os.path.dirname(ffmpeg_path), ffprobe_name)
+
+
+def get_audio_duration(audio_file):
+    """
+    Returns the duration of a chunk in seconds, read from the header of wav
+    files and with FFprobe for other files.
+    """
+    try:
+        with wave.open(audio_file, "rb") as source:
+            return source.getnframes() / source.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return get_media_duration(audio_file) or 0.0
+
+
+def get_media_duration(input_file):
+    """
+    Returns the duration of a media file in seconds, or None if it can't be
+    read.
+    """
+    command = [
+        get_ffprobe_path(),
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_file
+    ]
+    try:
+        result = subprocess.run(
+            command, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
 def get_ffmpeg_path():
     """
     Check if FFmpeg is already installed in the custom path and return
@@ -98,6 +421,17 @@ def get_ffmpeg_path():
         return ffmpeg_exe_path
 
 
+def setup_ffmpeg():
+    """
+    The launcher sets FFMPEG, fall back to the bundled FFmpeg or to the one
+    in the PATH when run directly (batch mode, server).
+    """
+    if not os.environ.get("FFMPEG"):
+        os.environ["FFMPEG"] = (
+            get_ffmpeg_path() or shutil.which("ffmpeg") or "")
+    add_ffmpeg_to_path()
+
+
 def add_ffmpeg_to_path():
 
     ffmpeg_path = os.environ["FFMPEG"]
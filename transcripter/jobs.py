@@ -0,0 +1,176 @@
+'''
+Per-job manifests used to resume interrupted transcriptions.
+'''
+import os
+import json
+import time
+import shutil
+import hashlib
+
+from transcripter import paths
+from transcripter import constants
+
+# Bump when the manifest format changes
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+
+def get_jobs_dir():
+    return os.path.join(paths.get_cache_dir(), "jobs")
+
+
+def get_job_id(input_file, params):
+    """
+    Identifies a job by its input file (path, size and modification time)
+    and its parameters, so a relaunch with the same settings finds it.
+    """
+    stat = os.stat(input_file)
+    job_key = json.dumps({
+        "input_file": os.path.abspath(input_file),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "params": params,
+    }, sort_keys=True)
+    return hashlib.sha256(job_key.encode()).hexdigest()[:16]
+
+
+def remove_stale_jobs(max_age_days=constants.JOB_MAX_AGE_DAYS):
+    """Removes the job folders not updated for max_age_days."""
+    jobs_dir = get_jobs_dir()
+    if not os.path.exists(jobs_dir):
+        return
+    oldest_time = time.time() - max_age_days * 24 * 3600
+    for job_id in os.listdir(jobs_dir):
+        job_dir = os.path.join(jobs_dir, job_id)
+        if os.path.getmtime(job_dir) < oldest_time:
+            print(f">>> Removing stale job {job_id}")
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def has_unfinished_job(input_file):
+    """
+    Whether a job of input_file was interrupted or has failed chunks, its
+    subtitles are then incomplete.
+    """
+    jobs_dir = get_jobs_dir()
+    if not os.path.exists(jobs_dir):
+        return False
+    input_file = os.path.abspath(input_file)
+    for job_id in os.listdir(jobs_dir):
+        manifest_path = os.path.join(jobs_dir, job_id, MANIFEST_FILENAME)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                if json.load(file).get("input_file") == input_file:
+                    return True
+        except (IOError, json.JSONDecodeError):
+            continue
+    return False
+
+
+class JobManifest:
+    """
+    Records the chunk plan, the parameters and the results of the completed
+    chunks of a transcription job. The chunks are stored in the job folder
+    instead of the system temp folder, so they survive a reboot.
+    """
+
+    def __init__(self, input_file, params):
+        self.input_file = input_file
+        self.params = params
+        self.job_id = get_job_id(input_file, params)
+        self.job_dir = os.path.join(get_jobs_dir(), self.job_id)
+        self.chunks_dir = os.path.join(self.job_dir, "chunks")
+        self.manifest_path = os.path.join(self.job_dir, MANIFEST_FILENAME)
+        self.chunks = []
+        self.results = {}
+        # False while chunks are still being added to the plan
+        self.planned = False
+        # Chunks that failed in this run, retried on the next one
+        self.failed = set()
+        self.load()
+
+    def load(self):
+        """Loads the manifest of a previous run of the job if any."""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (IOError, json.JSONDecodeError):
+            return
+        if manifest.get("version") != MANIFEST_VERSION:
+            return
+
+        self.chunks = [
+            (os.path.join(self.chunks_dir, chunk["file"]), chunk["start"])
+            for chunk in manifest["chunks"]]
+        self.results = {
+            int(index): segments
+            for index, segments in manifest["results"].items()}
+        self.planned = manifest.get("planned", False)
+
+    def save(self):
+        """Writes the manifest atomically."""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "input_file": os.path.abspath(self.input_file),
+            "params": self.params,
+            "chunks": [
+                {"file": os.path.basename(chunk), "start": start}
+                for chunk, start in self.chunks],
+            "results": self.results,
+            "planned": self.planned,
+        }
+        os.makedirs(self.job_dir, exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, self.manifest_path)
+
+    def prepare_chunks_dir(self):
+        """Returns an empty folder for the chunks of the job."""
+        shutil.rmtree(self.chunks_dir, ignore_errors=True)
+        os.makedirs(self.chunks_dir)
+        return self.chunks_dir
+
+    def set_chunks(self, chunks):
+        """Records the chunk plan, a list of (chunk file, start time)."""
+        self.chunks = list(chunks)
+        self.results = {}
+        self.planned = True
+        self.save()
+
+    def start_planning(self):
+        """Starts a chunk plan built one chunk at a time with add_chunk()."""
+        self.set_chunks([])
+        self.planned = False
+        self.save()
+
+    def add_chunk(self, chunk, start):
+        self.chunks.append((chunk, start))
+        self.save()
+
+    def finish_planning(self):
+        self.planned = True
+        self.save()
+
+    def is_resumable(self, partial=False):
+        """
+        A job can resume when it has a complete chunk plan, or a partial
+        one with partial, and every chunk not transcribed yet is still on
+        disk.
+        """
+        return (self.planned or partial) and bool(self.chunks) and all(
+            os.path.exists(chunk)
+            for i, (chunk, _) in enumerate(self.chunks)
+            if i not in self.results)
+
+    def get_result(self, index):
+        return self.results.get(index)
+
+    def add_result(self, index, segments):
+        """Records the segments of a completed chunk."""
+        self.results[index] = segments
+        self.save()
+
+    def remove(self):
+        """Removes the job folder once the job is complete."""
+        shutil.rmtree(self.job_dir, ignore_errors=True)
@@ -1,11 +1,15 @@
+import os
 import sys
+from PySide6 import QtCore
 from PySide6 import QtWidgets
 from PySide6 import QtGui
 
 from transcripter import thread
 from transcripter import ffmpeg
+from transcripter import models
+from transcripter import progress
+from transcripter import server
 from transcripter import constants
-from transcripter import summerize
 from transcripter import preferences
 
 
@@ -15,9 +19,15 @@ class VideoTranscriptor(QtWidgets.QWidget):
         # Add ffmpeg to path
         ffmpeg.add_ffmpeg_to_path()
         self.prompt = None
+        self.plan_worker = None
+        self.estimate_pending = False
         preferences.set_default_preferences()
+        models.get_registry().set_memory_budget(
+            preferences.get_preference(
+                "model_memory_budget", constants.MODEL_MEMORY_BUDGET_MB))
         self.load_main_ui()
         self.load_from_prefs()
+        preferences.get_store().add_listener(self.preferences_changed)
         # self.load_summerize_ui()
 
     def load_main_ui(self):
@@ -38,6 +48,12 @@ class VideoTranscriptor(QtWidgets.QWidget):
         # Label to show selected file
         self.file_label = QtWidgets.QLabel("No file selected")
 
+        # Estimated cost of the job of the selected file
+        self.estimate_label = QtWidgets.QLabel("")
+        self.estimate_label.setToolTip(
+            "Estimated from the duration of the file and the speed "
+            "measured by previous jobs")
+
         # Language selection dropdown
         self.language_label = QtWidgets.QLabel("Select Target Language:")
         self.language_combo = QtWidgets.QComboBox()
@@ -106,6 +122,63 @@ class VideoTranscriptor(QtWidgets.QWidget):
             "Split input video into small parts. "
             "Select a chunk value between 100 and 600")
 
+        # Set number of parallel workers
+        self.workers_label = QtWidgets.QLabel(
+            f"{constants.SETTING_NAME_WORKERS}:")
+        self.workers_spinbox = QtWidgets.QSpinBox()
+        self.workers_spinbox.setRange(1, os.cpu_count() or 1)
+        self.workers_spinbox.setSingleStep(1)
+        self.workers_spinbox.setValue(constants.WORKERS)
+        self.workers_spinbox.setToolTip(
+            "Number of chunks transcribed at the same time (CPU only). "
+            "Each worker loads its own model")
+
+        # Let the planner choose the chunk duration and the workers
+        self.auto_plan_checkbox = QtWidgets.QCheckBox(
+            constants.SETTING_NAME_AUTO_PLAN)
+        self.auto_plan_checkbox.toggled.connect(self.toggle_auto_plan)
+        self.auto_plan_checkbox.setChecked(constants.AUTO_PLAN)
+        self.auto_plan_checkbox.setToolTip(
+            "Choose the chunk duration and the number of workers from the "
+            "duration of the video, the CPU cores and the model")
+
+        # Set batch size
+        self.batch_size_label = QtWidgets.QLabel(
+            f"{constants.SETTING_NAME_BATCH_SIZE}:")
+        self.batch_size_spinbox = QtWidgets.QSpinBox()
+        self.batch_size_spinbox.setRange(1, 64)
+        self.batch_size_spinbox.setSingleStep(1)
+        self.batch_size_spinbox.setValue(constants.BATCH_SIZE)
+        self.batch_size_spinbox.setToolTip(
+            "Number of chunks whose 30 sec windows are decoded together. "
+            "Higher = faster, but uses more memory. Windows are not "
+            "conditioned on the previous text, results may differ slightly")
+
+        # Skip silent regions
+        self.skip_silence_checkbox = QtWidgets.QCheckBox(
+            constants.SETTING_NAME_SKIP_SILENCE)
+        self.skip_silence_checkbox.setChecked(constants.SKIP_SILENCE)
+        self.skip_silence_checkbox.setToolTip(
+            "Cut chunks in pauses and don't transcribe regions without speech")
+
+        # Speech recognition engine
+        self.backend_label = QtWidgets.QLabel(
+            f"{constants.SETTING_NAME_ASR_BACKEND}:")
+        self.backend_combo = QtWidgets.QComboBox()
+        self.backend_combo.addItems(constants.ASR_BACKENDS)
+        self.backend_combo.setCurrentText(constants.ASR_BACKEND)
+        self.backend_combo.setToolTip(
+            "faster-whisper is faster on CPU (needs the faster-whisper "
+            "package). Batch size and workers only apply to whisper")
+
+        # Int8 quantized models
+        self.quantize_checkbox = QtWidgets.QCheckBox(
+            constants.SETTING_NAME_QUANTIZE)
+        self.quantize_checkbox.setChecked(constants.QUANTIZE)
+        self.quantize_checkbox.setToolTip(
+            "Faster transcription on CPU with a small accuracy loss. "
+            "The first launch converts the model")
+
         # Set prompt
         self.prompt_button = QtWidgets.QPushButton("Prompt Hint")
         self.prompt_button.setToolTip(
@@ -113,6 +186,18 @@ class VideoTranscriptor(QtWidgets.QWidget):
             "(useful for specific vocabulary or context)")
         self.prompt_button.clicked.connect(self.set_prompt)
 
+        # Settings profiles
+        self.profile_label = QtWidgets.QLabel("Profile:")
+        self.profile_combo = QtWidgets.QComboBox()
+        self.profile_combo.addItems(
+            preferences.get_store().get_profile_names())
+        self.profile_combo.setCurrentIndex(-1)
+        self.profile_combo.setPlaceholderText("Custom")
+        self.profile_combo.setToolTip(
+            "Apply a preset of settings, "
+            "click on \"Save as default\" to keep it")
+        self.profile_combo.activated.connect(self.apply_profile)
+
         # Save settings
         self.save_settings_layout = QtWidgets.QHBoxLayout()
         self.save_settings_button = QtWidgets.QPushButton('Save as default')
@@ -138,6 +223,8 @@ class VideoTranscriptor(QtWidgets.QWidget):
         self.save_settings_layout.addWidget(self.save_settings_button)
         self.save_settings_layout.addWidget(self.reset_all_settings_button)
 
+        self.settings_main_layout.addWidget(self.profile_label)
+        self.settings_main_layout.addWidget(self.profile_combo)
         self.settings_main_layout.addWidget(self.beam_size_label)
         self.settings_main_layout.addWidget(self.beam_side_doublespin)
         self.settings_main_layout.addWidget(self.temperature_label)
@@ -146,14 +233,24 @@ class VideoTranscriptor(QtWidgets.QWidget):
             self.compression_ratio_threshold_label)
         self.settings_main_layout.addWidget(
             self.compression_ratio_threshold_spinbox)
+        self.settings_main_layout.addWidget(self.auto_plan_checkbox)
         self.settings_main_layout.addWidget(self.chunk_duration_label)
         self.settings_main_layout.addWidget(self.chunk_duration_spinbox)
+        self.settings_main_layout.addWidget(self.workers_label)
+        self.settings_main_layout.addWidget(self.workers_spinbox)
+        self.settings_main_layout.addWidget(self.batch_size_label)
+        self.settings_main_layout.addWidget(self.batch_size_spinbox)
+        self.settings_main_layout.addWidget(self.skip_silence_checkbox)
+        self.settings_main_layout.addWidget(self.quantize_checkbox)
+        self.settings_main_layout.addWidget(self.backend_label)
+        self.settings_main_layout.addWidget(self.backend_combo)
         self.settings_main_layout.addWidget(self.prompt_button)
         self.settings_main_layout.addLayout(
             self.save_settings_layout)
 
         self.main_layout.addWidget(self.select_button)
         self.main_layout.addWidget(self.file_label)
+        self.main_layout.addWidget(self.estimate_label)
         self.main_layout.addWidget(self.language_label)
         self.main_layout.addWidget(self.language_combo)
         self.main_layout.addWidget(self.model_label)
@@ -166,6 +263,17 @@ class VideoTranscriptor(QtWidgets.QWidget):
         self.main_layout.addWidget(version_info)
         self.setLayout(self.main_layout)
 
+        # The cost of the job changes with these settings
+        for signal in (
+                self.model_version.currentTextChanged,
+                self.backend_combo.currentTextChanged,
+                self.quantize_checkbox.toggled,
+                self.auto_plan_checkbox.toggled,
+                self.chunk_duration_spinbox.valueChanged,
+                self.workers_spinbox.valueChanged,
+                self.batch_size_spinbox.valueChanged):
+            signal.connect(self.update_estimate)
+
 
     def load_summerize_ui(self):
         self.summerize_layout = QtWidgets.QVBoxLayout()
@@ -188,7 +296,17 @@ class VideoTranscriptor(QtWidgets.QWidget):
 
     def launch_summerizer_process(self):
         srt_file = self.selected_srt_file.text()
-        summerize.summarize_srt(srt_file)
+        self.progress_bar.setValue(0)
+        self.launch_summerizer_process_button.setEnabled(False)
+        self.summary_worker = thread.SummaryWorker(
+            srt_file, quantize=self.quantize_checkbox.isChecked())
+        self.summary_worker.progress.connect(self.update_progress)
+        self.summary_worker.finished.connect(self.summary_complete)
+        self.summary_worker.start()
+
+    def summary_complete(self, summary):
+        self.launch_summerizer_process_button.setEnabled(True)
+        QtWidgets.QMessageBox.information(self, "Summary", summary)
 
     def set_prompt(self):
         """Open the PromptInputDialog and get user input."""
@@ -200,46 +318,65 @@ class VideoTranscriptor(QtWidgets.QWidget):
 
     def save_settings(self):
         print('Saving settings')
-        preferences.set_preference(
-            "target_language",
-            self.language_combo.currentText())
-        preferences.set_preference(
-            "model",
-            self.model_version.currentText())
-        preferences.set_preference(
-            "beam_size",
-            self.beam_side_doublespin.value())
-        preferences.set_preference(
-            "temperature",
-            self.temperature_doublespin.value())
-        preferences.set_preference(
-            "compression_ratio",
-            self.compression_ratio_threshold_spinbox.value())
-        preferences.set_preference(
-            "chunk_duration",
-            self.chunk_duration_spinbox.value())
+        # A single write of all the settings
+        preferences.get_store().update({
+            "target_language": self.language_combo.currentText(),
+            "model": self.model_version.currentText(),
+            "beam_size": self.beam_side_doublespin.value(),
+            "temperature": self.temperature_doublespin.value(),
+            "compression_ratio":
+                self.compression_ratio_threshold_spinbox.value(),
+            "chunk_duration": self.chunk_duration_spinbox.value(),
+            "workers": self.workers_spinbox.value(),
+            "auto_plan": self.auto_plan_checkbox.isChecked(),
+            "skip_silence": self.skip_silence_checkbox.isChecked(),
+            "batch_size": self.batch_size_spinbox.value(),
+            "quantize": self.quantize_checkbox.isChecked(),
+            "backend": self.backend_combo.currentText(),
+        })
 
     def reset_all_settings(self):
+        # The widgets are updated by preferences_changed
         preferences.reset_preferences()
-        self.load_from_prefs()
+        self.profile_combo.setCurrentIndex(-1)
 
     def load_from_prefs(self):
-
-        target_language = preferences.get_preference("target_language")
-        model = preferences.get_preference("model")
-        beam_size = preferences.get_preference("beam_size")
-        temperature = preferences.get_preference("temperature")
-        compression_ratio = preferences.get_preference("compression_ratio")
-        chunk_duration = preferences.get_preference("chunk_duration")
-        prompt = preferences.get_preference("prompt")
-
-        self.language_combo.setCurrentText(target_language)
-        self.model_version.setCurrentText(model)
-        self.beam_side_doublespin.setValue(beam_size)
-        self.temperature_doublespin.setValue(temperature)
-        self.compression_ratio_threshold_spinbox.setValue(compression_ratio)
-        self.chunk_duration_spinbox.setValue(chunk_duration)
-        self.prompt = prompt
+        self.set_settings(preferences.load_preferences())
+
+    def apply_profile(self, index):
+        """Shows the settings of a profile, saved with "Save as default"."""
+        self.set_settings(preferences.get_store().get_profile(
+            self.profile_combo.itemText(index)))
+
+    def preferences_changed(self, changes):
+        """Listener of the preferences store."""
+        if "model_memory_budget" in changes:
+            models.get_registry().set_memory_budget(
+                preferences.get_preference("model_memory_budget"))
+        self.set_settings(changes)
+
+    def set_settings(self, values):
+        """Sets the widgets of the given {preference: value}."""
+        setters = {
+            "target_language": self.language_combo.setCurrentText,
+            "model": self.model_version.setCurrentText,
+            "beam_size": self.beam_side_doublespin.setValue,
+            "temperature": self.temperature_doublespin.setValue,
+            "compression_ratio":
+                self.compression_ratio_threshold_spinbox.setValue,
+            "chunk_duration": self.chunk_duration_spinbox.setValue,
+            "workers": self.workers_spinbox.setValue,
+            "auto_plan": self.auto_plan_checkbox.setChecked,
+            "skip_silence": self.skip_silence_checkbox.setChecked,
+            "batch_size": self.batch_size_spinbox.setValue,
+            "quantize": self.quantize_checkbox.setChecked,
+            "backend": self.backend_combo.setCurrentText,
+        }
+        for key, value in values.items():
+            if key in setters:
+                setters[key](value)
+        if "prompt" in values:
+            self.prompt = values["prompt"]
 
     def select_video(self):
         file_dialog = QtWidgets.QFileDialog()
@@ -251,6 +388,47 @@ class VideoTranscriptor(QtWidgets.QWidget):
         )
         if file_path:
             self.file_label.setText(file_path)
+            self.update_estimate()
+
+    def get_plan_params(self):
+        """Settings of the job planner."""
+        return {
+            "model_size": self.model_version.currentText(),
+            "backend": self.backend_combo.currentText(),
+            "quantize": self.quantize_checkbox.isChecked(),
+            "batch_size": self.batch_size_spinbox.value(),
+            "chunk_duration": self.chunk_duration_spinbox.value(),
+            "workers": self.workers_spinbox.value(),
+            "auto_plan": self.auto_plan_checkbox.isChecked(),
+        }
+
+    def update_estimate(self, *args):
+        """
+        Probes the selected file in the background and shows the estimated
+        cost of its job.
+        """
+        input_file = self.file_label.text()
+        if not os.path.isfile(input_file):
+            self.estimate_label.setText("")
+            return
+        if self.plan_worker and self.plan_worker.isRunning():
+            # Planned again with the latest settings once it finishes
+            self.estimate_pending = True
+            return
+        self.estimate_pending = False
+        self.plan_worker = thread.PlanWorker(
+            input_file, **self.get_plan_params())
+        self.plan_worker.planned.connect(self.show_estimate)
+        self.plan_worker.finished.connect(self.plan_finished)
+        self.plan_worker.start()
+
+    def show_estimate(self, plan):
+        if not self.estimate_pending:
+            self.estimate_label.setText(plan.describe() if plan else "")
+
+    def plan_finished(self):
+        if self.estimate_pending:
+            self.update_estimate()
 
     def select_srt_file(self):
         file_dialog = QtWidgets.QFileDialog()
@@ -289,22 +467,45 @@ class VideoTranscriptor(QtWidgets.QWidget):
         compression_threshold = (
             self.compression_ratio_threshold_spinbox.value())
         force_new_srt = self.force_new_transcribe_checkbox.isChecked()
-        # Start worker thread
-        self.worker = thread.TranscriptionWorker(
-            file_path=input_file,
-            mode=mode,
-            model_size=model_size,
-            beam_size=beam_size,
-            temperature=temperature,
-            chunk_duration=chunk_duration,
-            target_language=lang_target,
-            compression_threshold=compression_threshold,
-            prompt=self.prompt,
-            force_new_srt=force_new_srt)
+        workers = self.workers_spinbox.value()
+        skip_silence = self.skip_silence_checkbox.isChecked()
+        batch_size = self.batch_size_spinbox.value()
+        job_params = {
+            "file_path": input_file,
+            "mode": mode,
+            "model_size": model_size,
+            "beam_size": beam_size,
+            "temperature": temperature,
+            "chunk_duration": chunk_duration,
+            "target_language": lang_target,
+            "compression_threshold": compression_threshold,
+            "prompt": self.prompt,
+            "force_new_srt": force_new_srt,
+            "workers": workers,
+            "skip_silence": skip_silence,
+            "batch_size": batch_size,
+            "quantize": self.quantize_checkbox.isChecked(),
+            "backend": self.backend_combo.currentText(),
+            "auto_plan": self.auto_plan_checkbox.isChecked(),
+        }
+        # Start worker thread, the local transcription server runs the job
+        # with its resident models when it is up
+        if server.is_server_running():
+            self.worker = thread.RemoteTranscriptionWorker(**job_params)
+        else:
+            self.worker = thread.TranscriptionWorker(**job_params)
         self.worker.progress.connect(self.update_progress)
+        self.worker.eta.connect(self.update_eta)
+        self.translation_error = None
+        self.worker.translation_failed.connect(self.set_translation_error)
         self.worker.finished.connect(self.transcription_complete)
         self.worker.start()
 
+    def toggle_auto_plan(self, checked):
+        # Chosen by the planner
+        self.chunk_duration_spinbox.setEnabled(not checked)
+        self.workers_spinbox.setEnabled(not checked)
+
     def toggle_settings(self, state):
         self.settings_container.setVisible(state == 2)
         self.adjustSize()
@@ -313,6 +514,17 @@ class VideoTranscriptor(QtWidgets.QWidget):
         """Update the progress bar value."""
         self.progress_bar.setValue(value)
 
+    def update_eta(self, seconds):
+        """Show the estimated remaining time in the progress bar."""
+        if seconds > 0:
+            self.progress_bar.setFormat(
+                f"%p% - about {progress.format_duration(seconds)} left")
+        else:
+            self.progress_bar.setFormat("%p%")
+
+    def set_translation_error(self, error):
+        self.translation_error = error
+
     def transcription_complete(self, srt_file, elapsed_time):
         """Handles actions after transcription is complete."""
         self.progress_bar.setValue(100)
@@ -325,7 +537,9 @@ class VideoTranscriptor(QtWidgets.QWidget):
         # Reset UI so user can start a new task
         self.launch_button.setEnabled(True)
         self.file_label.setText("No file selected")
+        self.estimate_label.setText("")
         self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
 
     def show_popup(self, srt_file, elapsed_time):
         """Show a message box with the transcription completion time."""
@@ -339,6 +553,11 @@ class VideoTranscriptor(QtWidgets.QWidget):
             f"Time taken: {minutes} min {seconds:.2f} sec"
         )
         msg_box.setIcon(QtWidgets.QMessageBox.Information)
+        if self.translation_error:
+            msg_box.setText(
+                f"{msg_box.text()}\n\n The subtitles could not be "
+                f"translated: {self.translation_error}")
+            msg_box.setIcon(QtWidgets.QMessageBox.Warning)
         msg_box.setStandardButtons(QtWidgets.QMessageBox.Ok)
         msg_box.exec()
 
@@ -392,4 +611,6 @@ if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
     window = VideoTranscriptor()
     window.show()
+    # The ML packages are imported while the user fills the settings
+    QtCore.QTimer.singleShot(constants.WARM_UP_DELAY_MS, models.warm_up)
     sys.exit(app.exec())
@@ -0,0 +1,247 @@
+'''
+Process-wide registry keeping loaded models resident between jobs.
+'''
+import os
+import time
+import weakref
+import importlib
+import threading
+from collections import OrderedDict
+
+from transcripter import paths
+from transcripter import tracing
+from transcripter import constants
+
+
+class ModelRegistry:
+    """
+    LRU cache of loaded models keyed by (kind, name, device, precision).
+
+    Models are kept in memory until the estimated size of all resident
+    models exceeds the memory budget, then the least recently used ones
+    are evicted.
+    """
+
+    def __init__(self, memory_budget_mb=constants.MODEL_MEMORY_BUDGET_MB):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self._inference_locks = weakref.WeakKeyDictionary()
+
+    def get(self, key, loader):
+        """
+        Return the model stored under key, loading it with loader() on miss.
+
+        Parameters:
+        - key (tuple): Registry key, e.g. ("whisper", "large", "cpu", "fp32").
+        - loader (function): Called with no argument to load the model.
+
+        Returns:
+        - The resident model.
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            print(f">>> Loading model {key}...")
+            start_time = time.time()
+            with tracing.span("load model", "model", key=str(key)):
+                model = loader()
+            print(
+                f">>> Model {key} loaded in "
+                f"{time.time() - start_time:.2f} sec")
+
+            self._models[key] = model
+            self._sizes[key] = estimate_model_size(model)
+            self._evict(keep=key)
+            return model
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._models
+
+    def release(self, key):
+        """Drop a model from the registry."""
+        with self._lock:
+            self._models.pop(key, None)
+            self._sizes.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+
+    def get_inference_lock(self, model):
+        """
+        Lock serializing the inference calls on a model shared by
+        concurrent jobs. Whisper installs its decoding hooks on the model
+        itself, so two threads can't decode with it at the same time.
+        """
+        with self._lock:
+            lock = self._inference_locks.get(model)
+            if lock is None:
+                lock = self._inference_locks[model] = threading.Lock()
+            return lock
+
+    def set_memory_budget(self, memory_budget_mb):
+        with self._lock:
+            self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+            self._evict()
+
+    def resident_size(self):
+        """Estimated size in bytes of all resident models."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def _evict(self, keep=None):
+        # Never evict the model that was just requested, even if it alone
+        # exceeds the budget.
+        while self.resident_size() > self.memory_budget:
+            victim = next((k for k in self._models if k != keep), None)
+            if victim is None:
+                break
+            print(f">>> Evicting model {victim} from memory")
+            self.release(victim)
+
+
+def estimate_model_size(model):
+    """
+    Estimate the memory footprint of a model in bytes from its parameters.
+    Returns 0 for objects that don't expose torch parameters.
+    """
+    parameters = getattr(model, "parameters", None)
+    if not callable(parameters):
+        return 0
+    try:
+        return sum(p.numel() * p.element_size() for p in parameters())
+    except (TypeError, AttributeError):
+        return 0
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """Return the process-wide model registry."""
+    return _registry
+
+
+def warm_up(modules=constants.WARM_UP_MODULES):
+    """
+    Imports the machine learning packages in a background thread, so they
+    are loaded by the time a job needs them. Missing packages are ignored.
+    """
+    def import_modules():
+        for module in modules:
+            try:
+                with tracing.span(f"import {module}", "warm-up"):
+                    importlib.import_module(module)
+            except ImportError:
+                continue
+            except Exception as e:
+                print(f"Error importing {module}: {e}")
+
+    thread = threading.Thread(
+        target=import_modules, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_device():
+    """Select device (CUDA if available, otherwise CPU)."""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_whisper_model(model_size, device=None, fp16=None, quantize=False):
+    """
+    Return a resident Whisper model, loading it only once per process.
+
+    Parameters:
+    - model_size (str): Whisper model size ("tiny", "base", ..., "large").
+    - device (str): "cuda" or "cpu" (None = auto-detect).
+    - fp16 (bool): Precision the model is used with (None = auto-detect).
+    - quantize (bool): Use int8 linear layers on CPU (ignored on CUDA).
+    """
+    import whisper
+
+    if device is None:
+        device = get_device()
+    if fp16 is None:
+        fp16 = device == "cuda"
+    precision = "fp16" if fp16 else "fp32"
+
+    if use_quantization(quantize, device):
+        return _registry.get(
+            ("whisper", model_size, device, "int8"),
+            lambda: load_quantized_model(
+                f"whisper_{model_size}_{whisper.__version__}",
+                lambda: whisper.load_model(model_size, device="cpu")))
+
+    return _registry.get(
+        ("whisper", model_size, device, precision),
+        lambda: whisper.load_model(model_size, device=device))
+
+
+def use_quantization(quantize, device=None):
+    """Int8 dynamic quantization only runs on CPU."""
+    return bool(quantize) and (device or get_device()) == "cpu"
+
+
+def quantize_linear_layers(model):
+    """
+    Return a copy of a CPU model whose linear layers use int8 weights,
+    activations are quantized on the fly (dynamic quantization).
+    """
+    import torch
+
+    for module in model.modules():
+        # Only exact nn.Linear modules are swapped, Whisper subclasses it
+        # to cast the weights to the input type (a no-op in fp32).
+        if (isinstance(module, torch.nn.Linear)
+                and type(module) is not torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(
+        model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def get_quantized_model_path(name):
+    import torch
+    return os.path.join(
+        paths.get_cache_dir(), "quantized",
+        f"{name}_torch{torch.__version__}_int8.pt")
+
+
+def load_quantized_model(name, loader):
+    """
+    Return the int8 version of the model returned by loader(). Quantized
+    models are saved in the cache folder, so the fp32 weights are loaded and
+    quantized only once per model and package versions.
+
+    Parameters:
+    - name (str): Name of the model and of the version of its package.
+    - loader (function): Loads the fp32 model on CPU.
+    """
+    import torch
+
+    model_path = get_quantized_model_path(name)
+    if os.path.exists(model_path):
+        try:
+            return torch.load(model_path, weights_only=False)
+        except Exception as e:
+            print(f"Error loading quantized model {model_path}: {e}")
+
+    print(f">>> Quantizing {name} to int8...")
+    model = quantize_linear_layers(loader())
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    temp_path = f"{model_path}.{os.getpid()}.tmp"
+    try:
+        torch.save(model, temp_path)
+        os.replace(temp_path, model_path)
+    except Exception as e:
+        print(f"Error saving quantized model {model_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return model
@@ -29,3 +29,9 @@ def get_prefs_dir():
 
 def get_prefs_filepath():
     return os.path.join(get_prefs_dir(), constants.PREFERENCES_FILENAME)
+
+
+def get_cache_dir():
+    """Returns the transcripter cache directory (cross-platform)."""
+    return os.path.join(
+        get_user_home_dir(), ".cache", constants.CACHE_DIR_NAME)
@@ -0,0 +1,142 @@
+'''
+Staged pipeline running each stage in its own thread, connected by bounded
+queues, so the stages of consecutive chunks overlap.
+'''
+import time
+import queue
+import threading
+
+from transcripter import tracing
+from transcripter import constants
+
+# Marks the end of the stream of items
+_DONE = object()
+# How often blocked stages check whether the pipeline was stopped
+POLL_INTERVAL = 0.1
+
+
+class Pipeline:
+    """
+    Chains stages: the first one is an iterable producing items, every
+    following stage is a function receiving the item returned by the
+    previous one. Stages returning None drop the item.
+
+    While stage N works on an item, stage N-1 already works on the next one,
+    so the wall-clock time approaches the one of the slowest stage. Bounded
+    queues keep a fast stage from running too far ahead of a slow one.
+    """
+
+    def __init__(self, queue_size=constants.PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stages = []
+        self.busy_times = {}
+        self._stop = threading.Event()
+        self._errors = []
+
+    def add_stage(self, name, function):
+        self.stages.append((name, function))
+        return self
+
+    def run(self, items, source_name="source"):
+        """
+        Runs the pipeline until every item went through every stage.
+        Re-raises the first exception raised by a stage. Every item of every
+        stage is recorded as a span in the tracer of the calling thread.
+        """
+        tracer = tracing.get_tracer()
+        queues = [
+            queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.busy_times = {
+            name: 0.0 for name in [source_name] + [n for n, _ in self.stages]}
+
+        threads = [threading.Thread(
+            target=self._run_source,
+            args=(tracer, source_name, items, queues[0]),
+            name=source_name, daemon=True)]
+        for i, (name, function) in enumerate(self.stages):
+            output_queue = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(tracer, name, function, queues[i], output_queue),
+                name=name, daemon=True))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for name, busy_time in self.busy_times.items():
+            print(f">>> Pipeline stage {name}: {busy_time:.2f} sec busy")
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_source(self, tracer, name, items, output_queue):
+        try:
+            items = iter(items)
+            while not self._stop.is_set():
+                start_time = time.time()
+                with tracing.activate(tracer), tracing.span(name, "pipeline"):
+                    item = next(items, _DONE)
+                self.busy_times[name] += time.time() - start_time
+                if item is _DONE:
+                    break
+                self._put(output_queue, item)
+        except Exception as e:
+            self._fail(name, e)
+        finally:
+            # Stopped early: let a generator release its resources (e.g. an
+            # FFmpeg process) now rather than when garbage collected
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            self._put(output_queue, _DONE)
+
+    def _run_stage(self, tracer, name, function, input_queue, output_queue):
+        try:
+            while True:
+                item = self._get(input_queue)
+                if item is _DONE:
+                    break
+                start_time = time.time()
+                with tracing.activate(tracer), tracing.span(name, "pipeline"):
+                    result = function(item)
+                self.busy_times[name] += time.time() - start_time
+                if result is not None and output_queue is not None:
+                    self._put(output_queue, result)
+        except Exception as e:
+            self._fail(name, e)
+        finally:
+            if output_queue is not None:
+                self._put(output_queue, _DONE)
+
+    def _fail(self, name, error):
+        print(f"Error in pipeline stage {name}: {error}")
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, output_queue, item):
+        # The end marker must get through even once the pipeline stopped
+        while not self._stop.is_set() or item is _DONE:
+            try:
+                output_queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                if self._stop.is_set() and item is _DONE:
+                    # Nobody reads anymore, drop the pending items
+                    self._drain(output_queue)
+
+    def _get(self, input_queue):
+        while not self._stop.is_set():
+            try:
+                return input_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    @staticmethod
+    def _drain(input_queue):
+        try:
+            while True:
+                input_queue.get_nowait()
+        except queue.Empty:
+            pass
@@ -0,0 +1,214 @@
+'''
+Cost-based planning of transcription jobs.
+
+A job is planned from the probe of its file: the audio stream to
+transcribe, whether there is anything to transcribe at all and, with
+automatic planning, the chunk duration and the number of workers. The cost
+of the job is estimated from the real-time factor of its setting, and
+automatic planning picks the workers with the lowest estimated cost.
+'''
+import os
+import math
+
+from transcripter import probe
+from transcripter import models
+from transcripter import progress
+from transcripter import constants
+
+
+class JobPlan:
+    """
+    How a job runs and what it is expected to cost. skip_reason is set
+    when the file has nothing to transcribe.
+    """
+
+    def __init__(self, duration=None, audio_stream=0,
+                 chunk_duration=constants.CHUNK_DURATION,
+                 workers=constants.WORKERS, rtf=None, skip_reason=None):
+        self.duration = duration
+        self.audio_stream = audio_stream
+        self.chunk_duration = chunk_duration
+        self.workers = workers
+        self.rtf = rtf
+        self.skip_reason = skip_reason
+
+    @property
+    def estimated_time(self):
+        """Estimated processing seconds, None while unknown."""
+        if self.duration is None or self.rtf is None:
+            return None
+        return self.duration * self.rtf
+
+    def describe(self):
+        if self.skip_reason:
+            return self.skip_reason
+        if self.estimated_time is None:
+            return "Estimated time: unknown"
+        workers = f"{self.workers} worker{'s' if self.workers > 1 else ''}"
+        return (
+            "Estimated time: about "
+            f"{progress.format_duration(self.estimated_time)} for "
+            f"{progress.format_duration(self.duration)} of audio "
+            f"({workers}, {self.chunk_duration} sec chunks)")
+
+
+def plan_job(input_file, model_size=constants.MODEL,
+             backend=constants.ASR_BACKEND, quantize=constants.QUANTIZE,
+             batch_size=constants.BATCH_SIZE,
+             chunk_duration=constants.CHUNK_DURATION,
+             workers=constants.WORKERS, auto_plan=constants.AUTO_PLAN,
+             check_silence=False, device=None, cores=None):
+    """
+    Plans the job of a file.
+
+    Parameters:
+    - chunk_duration, workers: Settings of the user, kept as they are
+        without auto_plan.
+    - check_silence (bool): Skip the file when its audio stream is silent.
+        Decodes the whole stream once, see constants.PLANNER_CHECK_SILENCE.
+    - device (str): Device of the models (default: detected).
+    - cores (int): CPU cores available to the job (default: all of them),
+        jobs running side by side share the cores.
+
+    Returns:
+    - JobPlan. The settings of the user are returned as they are when the
+    file can't be probed.
+    """
+    device = device or models.get_device()
+    cores = cores or os.cpu_count() or 1
+    plan = JobPlan(
+        chunk_duration=chunk_duration, workers=min(workers, cores))
+    info = probe.probe_media(input_file)
+    if info is None:
+        plan.rtf = estimate_rtf(
+            model_size, backend, device, quantize, plan.workers, batch_size)
+        return plan
+
+    plan.duration = info["duration"]
+    plan.audio_stream = probe.select_audio_stream(info)
+    if plan.audio_stream is None:
+        plan.skip_reason = "Error: The file has no audio stream."
+        return plan
+    if check_silence:
+        max_volume = probe.get_max_volume(input_file, plan.audio_stream)
+        if max_volume is not None and max_volume < constants.VAD_MIN_SPEECH_DB:
+            plan.skip_reason = "Error: The audio stream is silent."
+            return plan
+
+    if auto_plan and plan.duration:
+        plan.workers = 1
+        if can_run_parallel(backend, batch_size, device):
+            plan.workers = choose_workers(
+                plan.duration, model_size, backend, device, quantize, cores)
+        plan.chunk_duration = get_chunk_duration(
+            plan.duration, plan.workers, worker_rtf=get_worker_rtf(
+                model_size, backend, device, quantize, plan.workers))
+    plan.rtf = estimate_rtf(
+        model_size, backend, device, quantize, plan.workers, batch_size,
+        duration=plan.duration)
+    return plan
+
+
+def can_run_parallel(backend, batch_size, device):
+    """See TranscriptionJob.use_parallel()."""
+    return backend == "whisper" and batch_size <= 1 and device == "cpu"
+
+
+def get_worker_count(duration, model_size, cores=None):
+    """
+    Workers that fit the CPU cores and the model memory budget, with at
+    least one minimal chunk each.
+    """
+    cores = cores or os.cpu_count() or 1
+    by_cores = cores // constants.PLANNER_THREADS_PER_WORKER
+    model_memory = constants.MODEL_MEMORY_MB.get(model_size, 0) * 1024 * 1024
+    by_memory = (
+        models.get_registry().memory_budget // model_memory
+        if model_memory else by_cores)
+    by_chunks = math.ceil(duration / constants.PLANNER_MIN_CHUNK_DURATION)
+    return max(1, min(by_cores, by_memory, by_chunks))
+
+
+def choose_workers(duration, model_size, backend, device, quantize,
+                   cores=None):
+    """
+    Returns the number of workers, up to get_worker_count(), with the
+    lowest estimated processing time. Short files stay on one worker when
+    loading the models of the workers costs more than it saves.
+    """
+    best_workers, best_rtf = 1, None
+    for workers in range(1, get_worker_count(duration, model_size, cores) + 1):
+        rtf = estimate_rtf(
+            model_size, backend, device, quantize, workers,
+            duration=duration)
+        if rtf is None:
+            # Unknown model, the resources decide
+            return get_worker_count(duration, model_size, cores)
+        if best_rtf is None or rtf < best_rtf:
+            best_workers, best_rtf = workers, rtf
+    return best_workers
+
+
+def get_worker_rtf(model_size, backend, device, quantize, workers=1):
+    """
+    Real-time factor of one of the workers of a job, the time it takes to
+    transcribe a chunk. None if unknown.
+    """
+    rtf = estimate_rtf(model_size, backend, device, quantize, workers)
+    if rtf is None:
+        return None
+    return rtf * workers if workers > 1 else rtf
+
+
+def get_chunk_duration(duration, workers=1, worker_rtf=None):
+    """
+    Cuts the file into chunks of equal duration, no longer than the
+    default chunk duration, and enough of them to balance the workers.
+    Worker processes report their progress per chunk, at their real-time
+    factor (worker_rtf) a chunk is transcribed in at most
+    constants.PLANNER_MAX_CHUNK_TIME seconds.
+    """
+    max_chunk_duration = constants.CHUNK_DURATION
+    if workers > 1 and worker_rtf:
+        max_chunk_duration = min(
+            max_chunk_duration, constants.PLANNER_MAX_CHUNK_TIME / worker_rtf)
+    chunks = math.ceil(duration / max_chunk_duration)
+    if workers > 1:
+        chunks = max(chunks, workers * constants.PLANNER_CHUNKS_PER_WORKER)
+    chunk_duration = math.ceil(duration / max(1, chunks))
+    return min(
+        max(chunk_duration, constants.PLANNER_MIN_CHUNK_DURATION),
+        constants.PLANNER_MAX_CHUNK_DURATION)
+
+
+def estimate_rtf(model_size, backend, device, quantize, workers=1,
+                 batch_size=1, duration=None):
+    """
+    Real-time factor of a setting: the one measured by previous jobs, else
+    the one of constants.RTF_ESTIMATES. Parallel workers first load their
+    own model, the load time is spread over the duration of the file when
+    it is given. Measured factors already include it.
+    """
+    parallel = workers > 1 and can_run_parallel(backend, batch_size, device)
+    batched = batch_size > 1 and backend == "whisper"
+    quantized = models.use_quantization(quantize, device)
+    measured = progress.load_rtf_estimates().get(progress.get_rtf_key(
+        backend, model_size, device, quantized=quantized,
+        workers=workers if parallel else 1,
+        batch_size=batch_size if batched else 1))
+    if measured is not None:
+        return measured
+
+    estimates = constants.RTF_ESTIMATES.get(
+        device, constants.RTF_ESTIMATES["cpu"])
+    rtf = estimates.get(model_size)
+    if rtf is None:
+        return None
+    rtf *= constants.RTF_FACTORS.get(backend, 1.0)
+    if quantized and backend == "whisper":
+        rtf *= constants.RTF_FACTORS["int8"]
+    if parallel:
+        rtf /= workers * constants.PLANNER_PARALLEL_EFFICIENCY
+        if duration:
+            rtf += constants.MODEL_LOAD_TIME.get(model_size, 0) / duration
+    return rtf
@@ -1,94 +1,340 @@
+'''
+User preferences, loaded once per process and kept in memory.
+
+Changes are validated, applied in transactions and written with a single
+atomic write (temp file + rename). Listeners are notified of the changed
+values. Named profiles are presets of settings applied over the current
+ones.
+'''
 import os
 import json
+import threading
+import contextlib
 import subprocess
 
 from transcripter import constants
 from transcripter import paths
 
+PROFILES_KEY = "profiles"
+# Marks a key removed in a transaction
+_REMOVED = object()
 
-def load_preferences():
+
+class Field:
     """
-    Load preferences from the JSON file.
-    Returns an empty dictionary if the file does not exist or is invalid.
+    A typed preference. Values are converted to the type of the field and
+    checked against its choices or range, ValueError is raised otherwise.
     """
 
-    prefs_filepath = paths.get_prefs_filepath()
+    def __init__(self, name, value_type, default, choices=None,
+                 minimum=None, maximum=None, nullable=False):
+        self.name = name
+        self.value_type = value_type
+        self.default = default
+        self.choices = choices
+        self.minimum = minimum
+        self.maximum = maximum
+        self.nullable = nullable
 
-    if os.path.exists(prefs_filepath):
+    def validate(self, value):
+        if value is None and self.nullable:
+            return None
+        if self.value_type is bool and not isinstance(value, bool):
+            raise ValueError(f"{self.name} must be true or false: {value!r}")
         try:
-            with open(prefs_filepath, "r", encoding="utf-8") as file:
-                return json.load(file)
-        except (json.JSONDecodeError, IOError):
-            print("Error loading preferences. Resetting to empty.")
-            return {}
-    return {}
+            value = self.value_type(value)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"{self.name} must be of type {self.value_type.__name__}: "
+                f"{value!r}")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(
+                f"{self.name} must be one of {', '.join(self.choices)}: "
+                f"{value!r}")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"{self.name} must be >= {self.minimum}")
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f"{self.name} must be <= {self.maximum}")
+        return value
 
 
-def save_preferences(preferences):
+FIELDS = {field.name: field for field in [
+    Field("target_language", str, list(constants.LANGUAGE_CODES)[0],
+          choices=list(constants.LANGUAGE_CODES)),
+    Field("model", str, constants.MODEL,
+          choices=constants.SETTING_NAMES_MODEL),
+    Field("beam_size", float, constants.BEAM_SIZE, minimum=0),
+    Field("temperature", float, constants.TEMPERATURE, minimum=0),
+    Field("compression_ratio", float, constants.COMPRESSION_RATIO,
+          minimum=1, maximum=5),
+    Field("chunk_duration", int, constants.CHUNK_DURATION,
+          minimum=100, maximum=600),
+    Field("workers", int, constants.WORKERS, minimum=1),
+    Field("auto_plan", bool, constants.AUTO_PLAN),
+    Field("skip_silence", bool, constants.SKIP_SILENCE),
+    Field("quantize", bool, constants.QUANTIZE),
+    Field("backend", str, constants.ASR_BACKEND,
+          choices=constants.ASR_BACKENDS),
+    Field("batch_size", int, constants.BATCH_SIZE, minimum=1, maximum=64),
+    Field("model_memory_budget", int, constants.MODEL_MEMORY_BUDGET_MB,
+          minimum=0),
+    Field("prompt", str, constants.PROMPT, nullable=True),
+]}
+
+
+def get_defaults():
+    return {name: field.default for name, field in FIELDS.items()}
+
+
+class PreferencesStore:
     """
-    Save preferences to the JSON file. Ensure the file and its directory exist.
+    In-memory preferences backed by the JSON file.
+
+    The file is read on first access only. Values of unknown keys (written
+    by other versions of the app) are kept as they are.
     """
-    prefs_filepath = paths.get_prefs_filepath()
-    os.makedirs(os.path.dirname(prefs_filepath), exist_ok=True)
 
-    subprocess.run(["attrib", "+h", paths.get_prefs_dir()], shell=True)
+    def __init__(self, prefs_filepath=None):
+        self.prefs_filepath = prefs_filepath or paths.get_prefs_filepath()
+        self._values = None
+        self._profiles = {}
+        self._pending = None
+        self._depth = 0
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    def load(self):
+        """(Re)reads the file. Invalid values are replaced by defaults."""
+        with self._lock:
+            stored = {}
+            if os.path.exists(self.prefs_filepath):
+                try:
+                    with open(self.prefs_filepath, "r",
+                              encoding="utf-8") as file:
+                        stored = json.load(file)
+                except (json.JSONDecodeError, IOError):
+                    print("Error loading preferences. Resetting to default.")
+            if not isinstance(stored, dict):
+                stored = {}
+
+            profiles = stored.pop(PROFILES_KEY, {})
+            self._profiles = profiles if isinstance(profiles, dict) else {}
+            self._values = get_defaults()
+            for key, value in stored.items():
+                field = FIELDS.get(key)
+                if field is None:
+                    self._values[key] = value
+                    continue
+                try:
+                    self._values[key] = field.validate(value)
+                except ValueError as e:
+                    print(f"Invalid preference, using the default: {e}")
+
+    def _ensure_loaded(self):
+        if self._values is None:
+            self.load()
+
+    def exists(self):
+        return os.path.exists(self.prefs_filepath)
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._ensure_loaded()
+            return self._values.get(key, default)
+
+    def get_all(self):
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._values)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Groups changes: they are applied, written and notified once, when
+        the outermost transaction ends. Nothing is applied on error.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._depth == 0:
+                self._pending = {}
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pending = None
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                changes, self._pending = self._pending, None
+                self._commit(changes)
+
+    def set(self, key, value):
+        """Sets a value, ValueError is raised if it is invalid."""
+        field = FIELDS.get(key)
+        if field is not None:
+            value = field.validate(value)
+        with self.transaction():
+            self._pending[key] = value
+
+    def update(self, values):
+        """Sets several values with a single write."""
+        with self.transaction():
+            for key, value in values.items():
+                self.set(key, value)
+
+    def remove(self, key):
+        """Removes a value, fields go back to their default."""
+        field = FIELDS.get(key)
+        with self.transaction():
+            self._pending[key] = field.default if field else _REMOVED
+
+    def reset(self):
+        """Sets every field back to its default. Profiles are kept."""
+        with self.transaction():
+            for key in list(self._values):
+                self.remove(key)
 
-    try:
-        with open(prefs_filepath, "w", encoding="utf-8") as file:
-            json.dump(preferences, file, indent=4)
-    except IOError:
-        print("Error saving preferences.")
+    def _commit(self, changes):
+        changed = {}
+        for key, value in changes.items():
+            if value is _REMOVED:
+                if key in self._values:
+                    del self._values[key]
+                    changed[key] = None
+            elif self._values.get(key, _REMOVED) != value:
+                self._values[key] = value
+                changed[key] = value
+        if changed or not self.exists():
+            self.save()
+        if changed:
+            for listener in list(self._listeners):
+                listener(changed)
+
+    def save(self):
+        """Writes all the preferences with an atomic rename."""
+        with self._lock:
+            self._ensure_loaded()
+            data = dict(self._values)
+            if self._profiles:
+                data[PROFILES_KEY] = self._profiles
+            prefs_dir = os.path.dirname(self.prefs_filepath)
+            if not os.path.isdir(prefs_dir):
+                os.makedirs(prefs_dir, exist_ok=True)
+                if os.name == "nt":
+                    subprocess.run(["attrib", "+h", prefs_dir])
+            temp_path = f"{self.prefs_filepath}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    json.dump(data, file, indent=4)
+                os.replace(temp_path, self.prefs_filepath)
+            except OSError as e:
+                print(f"Error saving preferences: {e}")
+
+    def add_listener(self, listener):
+        """listener(changes) is called with the {key: value} changed."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def get_profile_names(self):
+        with self._lock:
+            self._ensure_loaded()
+            return list(dict.fromkeys(
+                list(constants.PREFERENCE_PROFILES) + list(self._profiles)))
+
+    def get_profile(self, name):
+        """
+        Returns the current values with the ones of the profile applied
+        over them. Profiles saved by the user override the built-in ones.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if name in self._profiles:
+                profile = self._profiles[name]
+            elif name in constants.PREFERENCE_PROFILES:
+                profile = constants.PREFERENCE_PROFILES[name]
+            else:
+                raise KeyError(f"Unknown preferences profile: {name}")
+            values = dict(self._values)
+            for key, value in profile.items():
+                field = FIELDS.get(key)
+                values[key] = field.validate(value) if field else value
+            return values
+
+    def apply_profile(self, name):
+        """Sets the values of a profile with a single write."""
+        self.update(self.get_profile(name))
+
+    def save_profile(self, name, keys=None):
+        """Stores the current values of keys (all fields) as a profile."""
+        with self._lock:
+            self._ensure_loaded()
+            self._profiles[name] = {
+                key: self._values[key] for key in (keys or FIELDS)
+                if key in self._values}
+            self.save()
+
+    def remove_profile(self, name):
+        with self._lock:
+            self._ensure_loaded()
+            if self._profiles.pop(name, None) is not None:
+                self.save()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide preferences store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PreferencesStore()
+        return _store
+
+
+def load_preferences():
+    """Return a copy of all the preferences."""
+    return get_store().get_all()
+
+
+def save_preferences(preferences):
+    """Set all the given preferences with a single write."""
+    get_store().update(preferences)
 
 
 def set_default_preferences():
     """
     Set default preferences if the file does not exist.
     """
-    if not os.path.exists(paths.get_prefs_filepath()):
-        preferences = {
-            "target_language": list(constants.LANGUAGE_CODES.keys())[0],
-            "model": constants.MODEL,
-            "beam_size": constants.BEAM_SIZE,
-            "temperature": constants.TEMPERATURE,
-            "compression_ratio": constants.COMPRESSION_RATIO,
-            "chunk_duration": constants.CHUNK_DURATION,
-            "prompt": constants.PROMPT,
-        }
-        save_preferences(preferences)
+    store = get_store()
+    if not store.exists():
+        store.save()
 
 
 def reset_preferences():
     """
-    Reset all preferences to their default values by overwriting
-    the existing file.
+    Reset all preferences to their default values.
     """
-    prefs_filepath = paths.get_prefs_filepath()
-
-    # Delete the file if it exists
-    if os.path.exists(prefs_filepath):
-        os.remove(prefs_filepath)
-
-    # Recreate with default values
-    set_default_preferences()
+    get_store().reset()
     print("Preferences have been reset to default.")
 
 
 def set_preference(key, value):
     """Set a preference and save it."""
-    preferences = load_preferences()
-    preferences[key] = value
-    save_preferences(preferences)
+    get_store().set(key, value)
 
 
 def get_preference(key, default=None):
     """Retrieve a preference. If not found, return the default value."""
-    preferences = load_preferences()
-    return preferences.get(key, default)
+    return get_store().get(key, default)
 
 
 def remove_preference(key):
-    """Remove a preference and save the file."""
-    preferences = load_preferences()
-    if key in preferences:
-        del preferences[key]
-        save_preferences(preferences)
+    """Remove a preference (fields go back to their default) and save."""
+    get_store().remove(key)
@@ -0,0 +1,301 @@
+'''
+Media probes: the duration and the audio streams of a media file, read
+with FFprobe once and cached per file path, size and modification time.
+'''
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import subprocess
+
+from transcripter import paths
+from transcripter import ffmpeg
+from transcripter import tracing
+from transcripter import constants
+
+# Fallback parsing of "ffmpeg -i" when FFprobe is not shipped with FFmpeg
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+STREAM_PATTERN = re.compile(
+    r"Stream #\d+:\d+(?:\[\w+\])?(?:\((\w+)\))?: (Audio|Video): (.*)")
+SAMPLE_RATE_PATTERN = re.compile(r"(\d+) Hz, ([^,]+)")
+MAX_VOLUME_PATTERN = re.compile(r"max_volume: (-?[\d.]+|-inf) dB")
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2}
+
+
+class ProbeCache:
+    """
+    SQLite-backed store of media probes keyed by file path. An entry is
+    only valid for the size and modification time of the probed file.
+    """
+
+    def __init__(self, db_path=None,
+                 max_entries=constants.PROBE_CACHE_MAX_ENTRIES):
+        self.db_path = db_path or os.path.join(
+            paths.get_cache_dir(), "media_probes.sqlite")
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS probes ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                "info TEXT, last_used REAL)")
+
+    def get(self, path, size, mtime):
+        """Returns the cached probe of the file, or None on miss."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT info FROM probes "
+                "WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime)).fetchone()
+            if row is None:
+                return None
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE probes SET last_used = ? WHERE path = ?",
+                    (time.time(), path))
+        return json.loads(row[0])
+
+    def put(self, path, size, mtime, info):
+        """Stores the probe of a file, the least recently used go first."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime, json.dumps(info), time.time()))
+            self._connection.execute(
+                "DELETE FROM probes WHERE path NOT IN ("
+                "SELECT path FROM probes ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,))
+
+    def close(self):
+        self._connection.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_probe_cache():
+    """Return the process-wide probe cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProbeCache()
+        return _cache
+
+
+def get_file_key(input_file):
+    """(path, size, modification time) identifying a version of a file."""
+    stat = os.stat(input_file)
+    return os.path.abspath(input_file), stat.st_size, stat.st_mtime
+
+
+def probe_media(input_file):
+    """
+    Returns the probe of a media file, from the cache when the file has not
+    changed since it was probed:
+
+    - duration (float): Seconds, None if unknown.
+    - has_video (bool)
+    - audio_streams (list): One dict per audio stream, in the order of
+        "-map 0:a:N": index (N), codec, channels, sample_rate, language,
+        title, default and secondary (commentary or audio description).
+    - max_volume (dict): Peak level in dBFS of the measured streams, see
+        get_max_volume().
+
+    Returns None if the file can't be read.
+    """
+    try:
+        file_key = get_file_key(input_file)
+    except OSError:
+        return None
+    cache = get_probe_cache()
+    info = cache.get(*file_key)
+    if info is None:
+        with tracing.span("probe media", "ffmpeg",
+                          file=os.path.basename(input_file)):
+            info = run_ffprobe(input_file) or run_ffmpeg_probe(input_file)
+        if info is None:
+            return None
+        cache.put(*file_key, info)
+    return info
+
+
+def run_ffprobe(input_file):
+    """Probes a file with FFprobe, None if FFprobe is unavailable."""
+    command = [
+        ffmpeg.get_ffprobe_path(),
+        "-v", "error",
+        "-show_format",
+        "-show_streams",
+        "-of", "json",
+        input_file
+    ]
+    try:
+        result = subprocess.run(
+            command, capture_output=True, text=True, check=True)
+        return parse_ffprobe_output(json.loads(result.stdout))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_ffprobe_output(data):
+    info = {"duration": None, "has_video": False, "audio_streams": [],
+            "max_volume": {}}
+    durations = []
+    for stream in data.get("streams", []):
+        disposition = stream.get("disposition", {})
+        if stream.get("duration"):
+            durations.append(float(stream["duration"]))
+        if stream.get("codec_type") == "video":
+            # Cover art of audio files
+            info["has_video"] |= not disposition.get("attached_pic")
+        elif stream.get("codec_type") == "audio":
+            tags = stream.get("tags", {})
+            title = tags.get("title")
+            info["audio_streams"].append({
+                "index": len(info["audio_streams"]),
+                "codec": stream.get("codec_name"),
+                "channels": stream.get("channels", 0),
+                "sample_rate": int(stream.get("sample_rate") or 0),
+                "language": tags.get("language"),
+                "title": title,
+                "default": bool(disposition.get("default")),
+                "secondary": bool(
+                    disposition.get("comment")
+                    or disposition.get("visual_impaired")
+                    or "commentary" in (title or "").lower()),
+            })
+    duration = data.get("format", {}).get("duration")
+    if duration:
+        info["duration"] = float(duration)
+    elif durations:
+        info["duration"] = max(durations)
+    return info
+
+
+def run_ffmpeg_probe(input_file):
+    """
+    Probes a file from the stream summary printed by "ffmpeg -i", used when
+    FFprobe is not found next to FFmpeg.
+    """
+    command = [os.environ["FFMPEG"], "-hide_banner", "-i", input_file]
+    try:
+        # Exits with an error, no output file is given
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError:
+        return None
+
+    info = {"duration": None, "has_video": False, "audio_streams": [],
+            "max_volume": {}}
+    duration_match = DURATION_PATTERN.search(result.stderr)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        info["duration"] = (
+            int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    for line in result.stderr.splitlines():
+        stream_match = STREAM_PATTERN.search(line)
+        if not stream_match:
+            continue
+        language, codec_type, description = stream_match.groups()
+        if codec_type == "Video":
+            info["has_video"] |= "(attached pic)" not in description
+            continue
+        sample_rate, layout = 0, ""
+        sample_rate_match = SAMPLE_RATE_PATTERN.search(description)
+        if sample_rate_match:
+            sample_rate = int(sample_rate_match.group(1))
+            layout = sample_rate_match.group(2).strip()
+        info["audio_streams"].append({
+            "index": len(info["audio_streams"]),
+            "codec": description.split()[0].rstrip(","),
+            "channels": get_layout_channels(layout),
+            "sample_rate": sample_rate,
+            "language": language if language != "und" else None,
+            "title": None,
+            "default": "(default)" in description,
+            "secondary": (
+                "(comment)" in description
+                or "(visual_impaired)" in description),
+        })
+    if info["duration"] is None and not info["audio_streams"] \
+            and not info["has_video"]:
+        # Not a media file
+        return None
+    return info
+
+
+def get_layout_channels(layout):
+    """Channels of an FFmpeg layout: "stereo", "5.1(side)", "3 channels"."""
+    if layout in CHANNEL_LAYOUTS:
+        return CHANNEL_LAYOUTS[layout]
+    match = re.match(r"(\d+) channels", layout)
+    if match:
+        return int(match.group(1))
+    match = re.match(r"(\d+)\.(\d+)", layout)
+    if match:
+        return int(match.group(1)) + int(match.group(2))
+    return 0
+
+
+def select_audio_stream(info):
+    """
+    Returns the index of the audio stream to transcribe: the main dialogue
+    track, skipping commentary and audio description tracks. Default
+    streams come first, then the ones with the most channels. None if the
+    file has no audio stream.
+    """
+    streams = info["audio_streams"]
+    if not streams:
+        return None
+    stream = min(streams, key=lambda stream: (
+        stream["secondary"], not stream["default"], -stream["channels"],
+        stream["index"]))
+    return stream["index"]
+
+
+def get_max_volume(input_file, audio_stream=0):
+    """
+    Returns the peak level of an audio stream in dBFS (-inf for digital
+    silence), None if it can't be measured. Decodes the whole stream, the
+    level is cached with the probe of the file.
+    """
+    info = probe_media(input_file)
+    if info is None:
+        return None
+    max_volume = info.get("max_volume", {})
+    if str(audio_stream) not in max_volume:
+        level = measure_max_volume(input_file, audio_stream)
+        if level is None:
+            return None
+        max_volume[str(audio_stream)] = level
+        info["max_volume"] = max_volume
+        get_probe_cache().put(*get_file_key(input_file), info)
+    return max_volume[str(audio_stream)]
+
+
+@tracing.traced("measure volume", "ffmpeg")
+def measure_max_volume(input_file, audio_stream=0):
+    command = [
+        os.environ["FFMPEG"],
+        "-nostdin", "-hide_banner",
+        "-i", input_file,  # Input file
+        "-map", f"0:a:{audio_stream}",  # Planned audio stream only
+        "-vn", "-sn", "-dn",  # Drop video, subtitle and data streams
+        "-ac", "1",  # Downmix to mono
+        "-ar", str(constants.AUDIO_SAMPLE_RATE),  # Fewer samples to scan
+        "-af", "volumedetect",
+        "-f", "null", "-"
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError:
+        return None
+    match = MAX_VOLUME_PATTERN.search(result.stderr)
+    if result.returncode != 0 or not match:
+        return None
+    return float(match.group(1))
@@ -0,0 +1,713 @@
+'''
+Transcription job logic shared by the UI worker thread and the command line.
+'''
+import os
+import time
+
+from transcripter import cache
+from transcripter import jobs
+from transcripter import ffmpeg
+from transcripter import paths
+from transcripter import models
+from transcripter import tracing
+from transcripter import constants
+from transcripter import subtitles
+from transcripter import backends
+from transcripter import pipeline
+from transcripter import planner
+from transcripter import progress
+from transcripter import translate
+from transcripter import transcribe
+from transcripter import translation_memory
+
+
+class TranscriptionJob:
+    """
+    Transcribes and translates one video file. Progress is reported to
+    progress_callback as a percentage, the estimated remaining time to
+    eta_callback in seconds (-1 while unknown). Jobs don't depend on Qt,
+    several can run in threads of the same process and share the resident
+    models.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        mode: str,
+        model_size: str,
+        beam_size: int,
+        temperature: float,
+        chunk_duration: int,
+        compression_threshold: float,
+        force_new_srt: bool = True,
+        target_language: str = None,
+        prompt=None,
+        chunk_mode: str = constants.CHUNK_MODE,
+        workers: int = constants.WORKERS,
+        skip_silence: bool = constants.SKIP_SILENCE,
+        batch_size: int = constants.BATCH_SIZE,
+        quantize: bool = constants.QUANTIZE,
+        backend: str = constants.ASR_BACKEND,
+        auto_plan: bool = constants.AUTO_PLAN,
+        cores: int = None,
+        progress_callback=None,
+        eta_callback=None
+    ):
+        self.input_file = file_path
+        self.mode = mode
+        self.target_language = target_language
+        self.model_size = model_size
+        self.beam_size = beam_size
+        self.temperature = temperature
+        self.compression_threshold = compression_threshold
+        self.chunk_duration = chunk_duration
+        self.chunk_mode = chunk_mode
+        self.workers = workers
+        self.skip_silence = skip_silence
+        self.batch_size = batch_size
+        self.quantize = quantize
+        self.backend = backend
+        self.auto_plan = auto_plan
+        # CPU cores of the job, None for all, jobs running side by side
+        # share them
+        self.cores = cores
+        self.audio_stream = 0
+        self.plan = None
+        self.force_new_srt = force_new_srt
+        self.prompt = prompt
+        self.progress_callback = progress_callback
+        self.eta_callback = eta_callback
+        self.tracker = None
+        self.error = None
+        self.elapsed_time = 0.0
+        self.trace_files = None
+        self.cache = cache.TranscriptionCache()
+        self.job = None
+        self.srt_writer = None
+        self.next_chunk_to_write = 0
+        self.duration = None
+        self.source_language = None
+        self.translation_error = None
+        self.memory = None
+
+    def run(self):
+        """
+        Executes the transcription process, traced when constants.TRACING
+        is enabled.
+
+        Returns:
+        - str: Path to the final SRT file, None on error (see self.error).
+        """
+        if not constants.TRACING:
+            return self.process()
+
+        tracer = tracing.Tracer(
+            paths.get_filename_without_ext(self.input_file)[0])
+        try:
+            with tracing.activate(tracer):
+                return self.process()
+        finally:
+            try:
+                self.trace_files = tracer.save()
+                print(f">>> Trace saved to {self.trace_files[0]}")
+            except OSError as e:
+                print(f"Error saving trace: {e}")
+
+    def process(self):
+        start_time = time.time()
+        self.update_progress(5)
+        existing_subtitle_file = None
+        # Update a stale Argos package index while transcribing
+        translate.refresh_package_index()
+
+        if not self.force_new_srt:
+            existing_subtitle_file = subtitles.srt_exists(
+                original_video_path=self.input_file)
+            if existing_subtitle_file and jobs.has_unfinished_job(
+                    self.input_file):
+                print(f">>> {existing_subtitle_file} is incomplete, "
+                      "resuming its job")
+                existing_subtitle_file = None
+
+        if not existing_subtitle_file or self.force_new_srt is True:
+            jobs.remove_stale_jobs()
+            if not self.plan_job():
+                return None
+            self.job = jobs.JobManifest(self.input_file, self.get_job_params())
+            if self.use_pipeline():
+                # Translated while transcribing, chunk by chunk
+                final_srt = self.run_pipeline()
+            else:
+                video_chunks = self.plan_chunks()
+                if video_chunks:
+                    final_srt = self.translate_srt(
+                        self.process_chunks(video_chunks))
+                else:
+                    final_srt = None
+            if not final_srt:
+                self.job.remove()
+                self.error = "Error: Video chunking failed or no speech found."
+                return None
+
+        else:
+            # Bypass whisper transcription
+            final_srt = self.translate_srt(existing_subtitle_file)
+
+        if self.job and not self.job.failed:
+            self.job.remove()
+        self.elapsed_time = time.time() - start_time
+        self.update_progress(100)
+        return final_srt
+
+    def plan_job(self) -> bool:
+        """
+        Probes the input file and applies the plan of the job: the audio
+        stream and, with auto_plan, the chunk duration and the workers.
+
+        Returns:
+        - bool: False, with self.error set, if there is nothing to
+        transcribe in the file.
+        """
+        self.plan = planner.plan_job(
+            self.input_file,
+            model_size=self.model_size,
+            backend=self.backend,
+            quantize=self.quantize,
+            batch_size=self.batch_size,
+            chunk_duration=self.chunk_duration,
+            workers=self.workers,
+            auto_plan=self.auto_plan,
+            cores=self.cores,
+            # Silent regions are dropped anyway when skipping silence
+            check_silence=(
+                constants.PLANNER_CHECK_SILENCE and not self.skip_silence))
+        print(f">>> {self.plan.describe()}")
+        if self.plan.skip_reason:
+            self.error = self.plan.skip_reason
+            return False
+        self.duration = self.plan.duration
+        self.audio_stream = self.plan.audio_stream
+        self.chunk_duration = self.plan.chunk_duration
+        self.workers = self.plan.workers
+        return True
+
+    def load_model(self):
+        """
+        Loads the Whisper model once for the whole job. Every chunk then
+        reuses the resident model from the registry.
+        """
+        if self.use_parallel():
+            # Each worker process loads its own model
+            return
+        backends.get_backend(
+            self.backend, self.model_size, quantize=self.quantize,
+            cores=self.cores).load()
+
+    def use_parallel(self) -> bool:
+        """
+        Chunks are transcribed in parallel processes on CPU only, a GPU
+        already runs a single model at full occupancy.
+        """
+        return (
+            self.workers > 1
+            and not self.use_batched()
+            and self.backend == "whisper"
+            and models.get_device() == "cpu")
+
+    def use_batched(self) -> bool:
+        """Batched decoding of mel windows is implemented for Whisper."""
+        return self.batch_size > 1 and self.backend == "whisper"
+
+    def use_pipeline(self) -> bool:
+        """
+        Decoding, transcription, translation and writing run as overlapping
+        stages when chunks are transcribed one at a time. Batched and
+        parallel transcription already keep the hardware busy.
+        """
+        return (
+            constants.PIPELINE
+            and not self.use_batched()
+            and not self.use_parallel())
+
+    def plan_chunks(self) -> list:
+        """
+        Returns the chunks of the job, resuming the chunk plan of an
+        interrupted run of the same job when possible.
+        """
+        if self.job.is_resumable():
+            print(
+                f">>> Resuming job {self.job.job_id}: "
+                f"{len(self.job.results)}/{len(self.job.chunks)} "
+                "chunks already transcribed")
+            return self.job.chunks
+
+        video_chunks = self.split_video(self.job.prepare_chunks_dir())
+        self.job.set_chunks(video_chunks)
+        return video_chunks
+
+    def split_video(self, output_dir=None) -> list:
+        """
+        Splits the video into chunks and returns a list of
+        (chunk file path, chunk start time) tuples.
+        """
+        return ffmpeg.split_into_chunks(
+            self.input_file,
+            chunk_duration=self.chunk_duration,
+            chunk_mode=self.chunk_mode,
+            skip_silence=self.skip_silence,
+            output_dir=output_dir,
+            audio_stream=self.audio_stream)
+
+    def process_chunks(self, video_chunks: list) -> str:
+        """
+        Processes video chunks for transcription and writes their subtitles
+        to the final SRT file as soon as they are available, in timeline
+        order. Chunks completed by a previous run of the job or found in the
+        transcription cache are not transcribed again.
+        """
+        self.srt_writer = subtitles.SrtWriter(
+            subtitles.get_srt_path(self.input_file, self.target_language))
+        self.next_chunk_to_write = 0
+
+        try:
+            pending = [
+                i for i in range(len(video_chunks))
+                if self.job.get_result(i) is None]
+            self.write_completed_chunks()
+            durations = {
+                i: ffmpeg.get_audio_duration(video_chunks[i][0])
+                for i in pending}
+
+            cache_keys = {}
+            misses = []
+            for i in pending:
+                chunk, _ = video_chunks[i]
+                cache_keys[i] = self.cache.make_key(
+                    chunk, **self.get_decoding_params())
+                segments = self.cache.get(cache_keys[i])
+                if segments is None:
+                    misses.append(i)
+                else:
+                    self.complete_chunk(i, segments)
+            print(
+                f">>> Transcription cache: "
+                f"{len(pending) - len(misses)} hits, {len(misses)} misses")
+
+            if misses:
+                self.load_model()
+            # Started after the model load to measure the decoding only
+            self.tracker = self.create_tracker(
+                sum(durations.values()),
+                constants.PROGRESS_TRANSCRIPTION_END)
+            self.tracker.add_skipped(
+                sum(durations[i] for i in pending if i not in misses))
+            if misses:
+                self.transcribe_chunks(
+                    [video_chunks[i] for i in misses],
+                    result_callback=lambda j, segments: self.complete_chunk(
+                        misses[j], segments, cache_keys[misses[j]]))
+            self.tracker.finish()
+        except BaseException:
+            # The subtitles of a previous run are kept
+            self.srt_writer.discard()
+            raise
+
+        final_srt = self.srt_writer.finish()
+        print(f">>> Successfully wrote subtitles into: {final_srt}")
+        return final_srt
+
+    def run_pipeline(self) -> str:
+        """
+        Runs the job as pipelined stages: while a chunk is transcribed, the
+        next one is decoded and the previous one is translated and written
+        to the final SRT file. Chunks are planned and recorded in the job
+        manifest as they are decoded, so an interrupted run resumes from
+        its last decoded chunk.
+
+        Returns:
+        - str: Path to the final SRT file, None if no chunk was found.
+        """
+        self.srt_writer = subtitles.SrtWriter(
+            subtitles.get_srt_path(self.input_file, self.target_language))
+        if self.duration is None:
+            self.duration = ffmpeg.get_media_duration(self.input_file)
+        self.source_language = None
+        self.translation_error = None
+        self.memory = translation_memory.TranslationMemory()
+        self.tracker = self.create_tracker(
+            self.duration, constants.PROGRESS_PIPELINE_END)
+
+        try:
+            pipeline.Pipeline() \
+                .add_stage("transcribe", self.transcribe_stage) \
+                .add_stage("translate", self.translate_stage) \
+                .add_stage("write", self.write_stage) \
+                .run(self.iter_chunks(), source_name="decode")
+            self.tracker.finish()
+        except BaseException:
+            # The subtitles of a previous run are kept
+            self.srt_writer.discard()
+            raise
+        finally:
+            self.memory.close()
+
+        if not self.job.chunks:
+            self.srt_writer.discard()
+            return None
+        if self.translation_error:
+            # Part of the subtitles would not be in the target language
+            self.srt_writer.discard()
+            return self.write_untranslated()
+        final_srt = self.srt_writer.finish()
+        print(f">>> Successfully wrote subtitles into: {final_srt}")
+        return final_srt
+
+    def iter_chunks(self):
+        """
+        Yields (index, chunk file path, chunk start time) tuples as the
+        chunks are decoded. The chunks planned by an interrupted run are
+        yielded first, and decoding continues after the last of them.
+        """
+        if self.job.is_resumable(partial=True):
+            print(
+                f">>> Resuming job {self.job.job_id}: "
+                f"{len(self.job.results)}/{len(self.job.chunks)} "
+                "chunks already transcribed"
+                f"{'' if self.job.planned else ', planning the rest'}")
+            for i, (chunk, start) in enumerate(list(self.job.chunks)):
+                yield i, chunk, start
+            if self.job.planned:
+                return
+            output_dir = self.job.chunks_dir
+        else:
+            output_dir = self.job.prepare_chunks_dir()
+            self.job.start_planning()
+
+        for chunk, start in ffmpeg.iter_chunks(
+                self.input_file,
+                chunk_duration=self.chunk_duration,
+                chunk_mode=self.chunk_mode,
+                skip_silence=self.skip_silence,
+                output_dir=output_dir,
+                audio_stream=self.audio_stream,
+                start_index=len(self.job.chunks)):
+            self.job.add_chunk(chunk, start)
+            yield len(self.job.chunks) - 1, chunk, start
+        self.job.finish_planning()
+
+    def transcribe_stage(self, item):
+        """
+        Returns the segments of a chunk from the job manifest, the cache or
+        the Whisper model.
+        """
+        index, chunk, start = item
+        # Silence between chunks is never decoded
+        self.tracker.skip_to(start)
+        segments = self.job.get_result(index)
+        if segments is not None:
+            # Completed by a previous run
+            return index, start, segments
+
+        duration = ffmpeg.get_audio_duration(chunk)
+        cache_key = self.cache.make_key(chunk, **self.get_decoding_params())
+        segments = self.cache.get(cache_key)
+        if segments is None:
+            self.load_model()
+            segments = transcribe.transcribe_segments(
+                input_file=chunk,
+                mode=self.mode,
+                model_size=self.model_size,
+                beam_size=self.beam_size,
+                temperature=self.temperature,
+                compression_ratio_threshold=self.compression_threshold,
+                prompt=self.prompt,
+                decode_progress_callback=self.tracker.set_partial,
+                quantize=self.quantize,
+                backend=self.backend,
+                cores=self.cores,
+                )
+            self.record_chunk(index, segments, cache_key)
+            self.tracker.add_decoded(duration)
+        else:
+            self.record_chunk(index, segments)
+            self.tracker.add_skipped(duration)
+        return index, start, segments or []
+
+    def translate_stage(self, item):
+        """
+        Translates the segments of a chunk to the target language. The
+        source language is detected on the first chunk with text.
+
+        Translation errors (unknown language, model not installed offline)
+        don't fail the job: the transcript is written untranslated from
+        then on.
+        """
+        index, start, segments = item
+        if not segments or self.translation_error:
+            return item
+
+        track = subtitles.SubtitleTrack.from_segments(segments)
+        try:
+            if self.source_language is None:
+                self.source_language = translate.detect_language(
+                    translate.extract_text_for_detection(track))
+                print(
+                    f"Detected language: {self.source_language} "
+                    f"-> Translating to: {self.target_language}")
+                if self.source_language != self.target_language:
+                    translate.install_translation_model(
+                        self.source_language, self.target_language)
+                    if not translate.is_pair_available(
+                            self.source_language, self.target_language):
+                        raise RuntimeError(
+                            f"No {self.source_language} -> "
+                            f"{self.target_language} translation model")
+
+            if self.source_language == self.target_language:
+                return item
+            translated = translate.translate_texts(
+                track.texts(), self.source_language, self.target_language,
+                memory=self.memory)
+        except Exception as e:
+            self.translation_error = f"{type(e).__name__}: {e}"
+            print(f"Error translating, subtitles are written untranslated: "
+                  f"{self.translation_error}")
+            return item
+        return index, start, track.with_texts(translated).to_segments()
+
+    def write_stage(self, item):
+        """Chunks reach this stage in timeline order."""
+        _, start, segments = item
+        if segments:
+            self.srt_writer.write_segments(segments, offset=start)
+
+    def create_tracker(self, total_audio, end):
+        """Tracks the covered audio of the job."""
+        device = models.get_device()
+        return progress.ProgressTracker(
+            total_audio,
+            rtf_key=progress.get_rtf_key(
+                self.backend, self.model_size, device,
+                quantized=models.use_quantization(self.quantize, device),
+                workers=self.workers if self.use_parallel() else 1,
+                batch_size=self.batch_size if self.use_batched() else 1),
+            end=end,
+            progress_callback=self.update_progress,
+            eta_callback=self.update_eta)
+
+    def complete_chunk(self, index: int, segments: list, cache_key=None):
+        """
+        Records the segments of a transcribed chunk and writes the
+        subtitles that are now in timeline order.
+        """
+        self.record_chunk(index, segments, cache_key)
+        self.write_completed_chunks()
+
+    def record_chunk(self, index: int, segments: list, cache_key=None):
+        """
+        Records the segments of a transcribed chunk in the job manifest and
+        the cache and removes the chunk file.
+        """
+        if segments is None:
+            # Failed chunk, kept on disk so a relaunch can retry it
+            self.job.failed.add(index)
+            return
+        if cache_key:
+            self.cache.put(cache_key, segments)
+        self.job.add_result(index, segments)
+        chunk, _ = self.job.chunks[index]
+        if os.path.exists(chunk):
+            os.remove(chunk)
+
+    def write_completed_chunks(self):
+        """
+        Appends the subtitles of the completed chunks that follow the last
+        written one. Chunks completing out of order wait for their
+        predecessors.
+        """
+        while self.next_chunk_to_write < len(self.job.chunks):
+            index = self.next_chunk_to_write
+            segments = self.job.get_result(index)
+            if segments is None and index not in self.job.failed:
+                return
+            if segments:
+                _, chunk_start_time = self.job.chunks[index]
+                self.srt_writer.write_segments(
+                    segments, offset=chunk_start_time)
+            self.next_chunk_to_write += 1
+
+    def get_job_params(self) -> dict:
+        """
+        Parameters identifying a job, a relaunch with the same parameters
+        resumes it.
+        """
+        params = {
+            **self.get_decoding_params(),
+            "chunk_duration": self.chunk_duration,
+            "chunk_mode": self.chunk_mode,
+            "skip_silence": self.skip_silence,
+        }
+        # Only added when used, interrupted jobs keep their ids
+        if self.audio_stream:
+            params["audio_stream"] = self.audio_stream
+        return params
+
+    def get_decoding_params(self) -> dict:
+        """
+        Parameters changing the transcription output, used in cache keys.
+        """
+        params = {
+            "model": self.model_size,
+            "mode": self.mode,
+            "language": None,
+            "beam_size": self.beam_size,
+            "temperature": self.temperature,
+            "compression_ratio_threshold": self.compression_threshold,
+            "prompt": self.prompt,
+            "batched": self.use_batched(),
+        }
+        # Only added when used, cached fp32 Whisper chunks keep their keys
+        if models.use_quantization(self.quantize):
+            params["quantized"] = True
+        if self.backend != "whisper":
+            params["backend"] = self.backend
+        return params
+
+    def transcribe_chunks(self, video_chunks: list, result_callback=None):
+        """
+        Transcribes video chunks and calls result_callback with the index
+        and the segments of each chunk as soon as it completes. Batched
+        decoding takes precedence over parallel workers when both are
+        enabled.
+        """
+        if self.use_batched():
+            return self.transcribe_chunks_batched(
+                video_chunks, result_callback)
+        if self.use_parallel():
+            return self.transcribe_chunks_parallel(
+                video_chunks, result_callback)
+
+        for i, (chunk, _) in enumerate(video_chunks):
+            segments = transcribe.transcribe_segments(
+                input_file=chunk,
+                mode=self.mode,
+                model_size=self.model_size,
+                beam_size=self.beam_size,
+                temperature=self.temperature,
+                compression_ratio_threshold=self.compression_threshold,
+                prompt=self.prompt,
+                decode_progress_callback=self.tracker.set_partial,
+                quantize=self.quantize,
+                backend=self.backend,
+                cores=self.cores,
+                )
+            self.tracker.add_decoded(ffmpeg.get_audio_duration(chunk))
+            if result_callback:
+                result_callback(i, segments)
+
+    def transcribe_chunks_batched(
+            self, video_chunks: list, result_callback=None):
+        """
+        Transcribes video chunks with batched encoder/decoder inference.
+        """
+        transcribe.transcript_batched(
+            video_chunks,
+            batch_size=self.batch_size,
+            mode=self.mode,
+            model_size=self.model_size,
+            beam_size=self.beam_size,
+            temperature=self.temperature,
+            compression_ratio_threshold=self.compression_threshold,
+            prompt=self.prompt,
+            decode_progress_callback=self.tracker.set_partial,
+            result_callback=result_callback,
+            quantize=self.quantize
+            )
+
+    def transcribe_chunks_parallel(
+            self, video_chunks: list, result_callback=None):
+        """
+        Transcribes video chunks concurrently in a pool of worker processes.
+        """
+        def complete_chunk(i, segments):
+            # Worker processes report whole chunks only
+            self.tracker.add_decoded(
+                ffmpeg.get_audio_duration(video_chunks[i][0]))
+            if result_callback:
+                result_callback(i, segments)
+
+        # Spans of the worker processes are not recorded
+        with tracing.span(
+                "transcribe chunks", "asr",
+                chunks=len(video_chunks), workers=self.workers):
+            transcribe.transcript_parallel(
+                video_chunks,
+                workers=self.workers,
+                model_size=self.model_size,
+                mode=self.mode,
+                beam_size=self.beam_size,
+                temperature=self.temperature,
+                compression_ratio_threshold=self.compression_threshold,
+                prompt=self.prompt,
+                result_callback=complete_chunk,
+                cores=self.cores,
+                quantize=self.quantize
+                )
+
+    def translate_srt(self, srt_file: str) -> str:
+        """
+        Translates the SRT file if a language is specified. Translation
+        errors don't fail the job (see self.translation_error), the
+        transcript of the job is kept untranslated.
+
+        Returns:
+        - str: Path to the final SRT file.
+        """
+        self.update_progress(90)
+        print('Launch translation')
+        try:
+            translate.translate_srt(
+                self.input_file, srt_file, self.target_language)
+        except Exception as e:
+            self.translation_error = f"{type(e).__name__}: {e}"
+            print(f"Error translating, the transcript is kept untranslated: "
+                  f"{self.translation_error}")
+            if self.job is not None:
+                # Named after the target language, it is not translated
+                os.remove(srt_file)
+                return self.write_untranslated()
+        return srt_file
+
+    def write_untranslated(self) -> str:
+        """
+        Writes the transcript of the job under the name of its source
+        language ("und" if unknown) and returns its path.
+        """
+        track = subtitles.SubtitleTrack.merge(
+            subtitles.SubtitleTrack.from_segments(segments, offset=start)
+            for (_, start), segments in zip(
+                self.job.chunks,
+                map(self.job.get_result, range(len(self.job.chunks))))
+            if segments)
+        if self.source_language is None:
+            try:
+                self.source_language = translate.detect_language(
+                    translate.extract_text_for_detection(track))
+            except Exception as e:
+                print(f"Error detecting the language: {e}")
+        language = self.source_language
+        if language in (None, "unknown"):
+            # ISO 639 code of an undetermined language
+            language = "und"
+        srt_file = track.save(
+            subtitles.get_srt_path(self.input_file, language))
+        print(f">>> Untranslated subtitles written into: {srt_file}")
+        return srt_file
+
+    def update_progress(self, value: int):
+        if self.progress_callback:
+            self.progress_callback(value)
+
+    def update_eta(self, seconds: float):
+        if self.eta_callback:
+            self.eta_callback(seconds)
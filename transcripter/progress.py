@@ -0,0 +1,173 @@
+'''
+Job progress computed from the audio seconds actually decoded, and
+remaining time estimated from the measured real-time factor.
+'''
+import os
+import json
+import time
+import threading
+
+from transcripter import paths
+from transcripter import constants
+
+
+def get_rtf_file():
+    return os.path.join(paths.get_cache_dir(), "rtf.json")
+
+
+def load_rtf_estimates():
+    """Returns the {key: real-time factor} measured by previous jobs."""
+    try:
+        with open(get_rtf_file(), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (IOError, json.JSONDecodeError):
+        return {}
+
+
+def save_rtf_estimate(key, rtf):
+    """
+    Blends a measured real-time factor into the stored estimate of key.
+    """
+    estimates = load_rtf_estimates()
+    previous_rtf = estimates.get(key)
+    if previous_rtf is not None:
+        rtf = (previous_rtf + rtf) / 2
+    estimates[key] = rtf
+    rtf_file = get_rtf_file()
+    os.makedirs(os.path.dirname(rtf_file), exist_ok=True)
+    temp_path = f"{rtf_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(estimates, file, indent=4)
+        os.replace(temp_path, rtf_file)
+    except OSError as e:
+        print(f"Error saving real-time factor: {e}")
+
+
+def get_rtf_key(backend, model_size, device, quantized=False, workers=1,
+                batch_size=1):
+    """
+    Real-time factors are measured separately for every engine, model,
+    device and parallelism setting.
+    """
+    if quantized:
+        device = f"{device}-int8"
+    return f"{backend}/{model_size}/{device}/{workers}x{batch_size}"
+
+
+def format_duration(seconds):
+    """Formats a duration as "1h 05m", "4m 10s" or "25s"."""
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressTracker:
+    """
+    Maps the covered audio to a percentage between start and end. Covered
+    audio is either decoded by the model, or skipped (silence, chunks found
+    in the cache or completed by a previous run).
+
+    The remaining time is the remaining audio multiplied by the real-time
+    factor (processing seconds per decoded audio second). The factor
+    measured during the job is blended with the one measured by previous
+    jobs with the same rtf_key, which weighs as ETA_PRIOR_WEIGHT seconds of
+    decoded audio.
+    """
+
+    def __init__(self, total_audio, rtf_key,
+                 start=constants.PROGRESS_TRANSCRIPTION_START,
+                 end=constants.PROGRESS_TRANSCRIPTION_END,
+                 progress_callback=None, eta_callback=None):
+        self.total_audio = total_audio
+        self.rtf_key = rtf_key
+        self.start = start
+        self.end = end
+        self.progress_callback = progress_callback
+        self.eta_callback = eta_callback
+        self.prior_rtf = load_rtf_estimates().get(rtf_key)
+        self.skipped = 0.0
+        self.decoded = 0.0
+        self.partial = 0.0
+        self.start_time = time.time()
+        self.last_progress = None
+        self.last_eta_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def covered(self):
+        return self.skipped + self.decoded + self.partial
+
+    def add_skipped(self, seconds):
+        """Audio covered without decoding it."""
+        with self._lock:
+            self.skipped += max(0.0, seconds)
+        self.report()
+
+    def skip_to(self, position):
+        """Skips the audio up to position (silence between chunks)."""
+        self.add_skipped(position - self.covered)
+
+    def add_decoded(self, seconds):
+        """A chunk of seconds of audio is decoded."""
+        with self._lock:
+            self.decoded += seconds
+            self.partial = 0.0
+        self.report()
+
+    def set_partial(self, seconds):
+        """Seconds decoded so far in the chunks being transcribed."""
+        with self._lock:
+            self.partial = seconds
+        self.report()
+
+    def get_rtf(self):
+        """Current real-time factor estimate, None while unknown."""
+        decoded = self.decoded + self.partial
+        elapsed = time.time() - self.start_time
+        if self.prior_rtf is not None:
+            weight = constants.ETA_PRIOR_WEIGHT
+            return (self.prior_rtf * weight + elapsed) / (weight + decoded)
+        if decoded < constants.ETA_MIN_DECODED_AUDIO:
+            return None
+        return elapsed / decoded
+
+    def get_eta(self):
+        """Remaining seconds, None while unknown."""
+        rtf = self.get_rtf()
+        if rtf is None or not self.total_audio:
+            return None
+        return max(0.0, self.total_audio - self.covered) * rtf
+
+    def get_progress(self):
+        if not self.total_audio:
+            return self.start
+        fraction = min(self.covered / self.total_audio, 1.0)
+        return self.start + int(fraction * (self.end - self.start))
+
+    def report(self):
+        progress = self.get_progress()
+        if self.progress_callback and progress != self.last_progress:
+            self.last_progress = progress
+            self.progress_callback(progress)
+
+        now = time.time()
+        if (self.eta_callback
+                and now - self.last_eta_time >= constants.ETA_UPDATE_INTERVAL):
+            self.last_eta_time = now
+            eta = self.get_eta()
+            self.eta_callback(-1.0 if eta is None else eta)
+
+    def finish(self):
+        """Stores the real-time factor measured on enough decoded audio."""
+        decoded = self.decoded + self.partial
+        if decoded >= constants.ETA_MIN_MEASURED_AUDIO:
+            save_rtf_estimate(
+                self.rtf_key, (time.time() - self.start_time) / decoded)
+        if self.eta_callback:
+            self.eta_callback(0.0)
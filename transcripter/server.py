@@ -0,0 +1,513 @@
+'''
+Local transcription server shared by the users of a host. Models are loaded
+once and stay resident, submitted jobs are run from a persistent priority
+queue and their progress is streamed to the clients.
+
+Start it with: python -m transcripter.server [--port 8765] [--jobs 1]
+
+HTTP API (JSON, loopback interface only). Requests changing the queue must
+have the application/json content type and no Origin header, so web pages
+can't submit jobs:
+- POST /jobs                {"params": {...}, "priority": 0, "user": "..."}
+- GET /jobs                 Every job of the queue.
+- GET /jobs/<id>            One job.
+- DELETE /jobs/<id>         Cancels a queued job.
+- GET /jobs/<id>/events     Job updates as a text/event-stream.
+
+A done job with an error could not be translated, its result is the
+untranslated transcript.
+'''
+import os
+import sys
+import json
+import time
+import getpass
+import sqlite3
+import argparse
+import threading
+import urllib.request
+from http import server as http_server
+
+from transcripter import paths
+from transcripter import models
+from transcripter import ffmpeg
+from transcripter import constants
+from transcripter import processing
+
+# Parameters of processing.TranscriptionJob clients can set, with their
+# types. Numbers are never booleans.
+JOB_PARAMETERS = {
+    "file_path": str,
+    "mode": str,
+    "model_size": str,
+    "beam_size": (int, float),
+    "temperature": (int, float),
+    "chunk_duration": int,
+    "compression_threshold": (int, float),
+    "force_new_srt": bool,
+    "target_language": (str, type(None)),
+    "prompt": (str, type(None)),
+    "chunk_mode": str,
+    "workers": int,
+    "skip_silence": bool,
+    "batch_size": int,
+    "quantize": bool,
+    "backend": str,
+    "auto_plan": bool,
+}
+# Parameters without a default value in processing.TranscriptionJob
+REQUIRED_JOB_PARAMETERS = {
+    "file_path", "mode", "model_size", "beam_size", "temperature",
+    "chunk_duration", "compression_threshold",
+}
+JOB_PARAMETER_CHOICES = {
+    "mode": ("transcribe", "translate"),
+    "model_size": constants.SETTING_NAMES_MODEL,
+    "chunk_mode": constants.CHUNK_MODES,
+    "backend": constants.ASR_BACKENDS,
+}
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of the server jobs. Jobs survive a restart of the
+    server: the ones that were running are queued again and resume from
+    their job manifest.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(
+            paths.get_cache_dir(), "server_queue.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT, "
+                "priority INTEGER, params TEXT, status TEXT, "
+                "progress INTEGER, result TEXT, error TEXT, "
+                "submitted REAL, started REAL, finished REAL, eta REAL)"
+            )
+            columns = [
+                row["name"] for row in
+                self._connection.execute("PRAGMA table_info(jobs)")]
+            if "eta" not in columns:
+                # Queue created by a previous version
+                self._connection.execute(
+                    "ALTER TABLE jobs ADD COLUMN eta REAL")
+        # Incremented on every change, waited on by the event streams
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def submit(self, params, priority=0, user=None):
+        """Queues a job and returns its id."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (user, priority, params, status, progress, "
+                "submitted) VALUES (?, ?, ?, 'queued', 0, ?)",
+                (user, priority, json.dumps(params), time.time()))
+        self._notify()
+        return cursor.lastrowid
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_jobs(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM jobs ORDER BY id").fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """Cancels a queued job. Running jobs can't be cancelled."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? "
+                "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+        self._notify()
+        return cursor.rowcount > 0
+
+    def take_next(self):
+        """
+        Marks the next job as running and returns it, None if the queue is
+        empty. Users take turns: the next job is one of the user whose last
+        job started the longest ago (users who never ran a job first), so
+        the batch of one user doesn't hold the host. The jobs of a user run
+        by priority, then oldest first.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT * FROM jobs AS job WHERE status = 'queued' ORDER BY "
+                "(SELECT COALESCE(MAX(started), 0) FROM jobs "
+                "WHERE user IS job.user), priority DESC, submitted, id "
+                "LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE jobs SET status = 'running', started = ? "
+                "WHERE id = ?", (time.time(), row["id"]))
+        self._notify()
+        return self.get(row["id"])
+
+    def set_progress(self, job_id, progress):
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ? AND progress != ?",
+                (progress, job_id, progress))
+        if cursor.rowcount:
+            self._notify()
+
+    def set_eta(self, job_id, eta):
+        """Estimated remaining seconds of a running job, -1 if unknown."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET eta = ? WHERE id = ?", (eta, job_id))
+        self._notify()
+
+    def finish(self, job_id, result=None, error=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, progress = ?, result = ?, "
+                "error = ?, finished = ? WHERE id = ?",
+                ("done" if result else "failed", 100, result, error,
+                 time.time(), job_id))
+        self._notify()
+
+    def requeue_running(self):
+        """Queues again the jobs interrupted by a stop of the server."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = 'queued', progress = 0 "
+                "WHERE status = 'running'")
+
+    def wait_for_change(self, version, timeout):
+        """
+        Waits until the queue changes after version was read. Returns False
+        on timeout.
+        """
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self.version != version, timeout)
+
+    def close(self):
+        self._connection.close()
+
+    def _notify(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+
+class TranscriptionServer(http_server.ThreadingHTTPServer):
+    """
+    HTTP server running up to `jobs` queued jobs at the same time in its
+    runner threads. Every job shares the models resident in the process.
+    """
+    daemon_threads = True
+
+    def __init__(self, job_queue, host=constants.SERVER_HOST,
+                 port=constants.SERVER_PORT, jobs=constants.SERVER_JOBS):
+        super().__init__((host, port), RequestHandler)
+        self.job_queue = job_queue
+        self.jobs = jobs
+        # The runners split the CPU cores instead of each using all of them
+        self.job_cores = (
+            max(1, (os.cpu_count() or 1) // jobs) if jobs > 1 else None)
+
+    def start_runners(self):
+        for i in range(self.jobs):
+            threading.Thread(
+                target=self.run_jobs, name=f"runner-{i}", daemon=True
+            ).start()
+
+    def run_jobs(self):
+        while True:
+            version = self.job_queue.version
+            job = self.job_queue.take_next()
+            if job is None:
+                self.job_queue.wait_for_change(
+                    version, constants.SERVER_EVENTS_KEEPALIVE)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        print(f">>> Running job {job['id']} of {job['user']}: "
+              f"{job['params'].get('file_path')}")
+        try:
+            # Jobs queued by a previous version are not validated
+            transcription = processing.TranscriptionJob(
+                **job["params"],
+                cores=self.job_cores,
+                progress_callback=lambda progress: (
+                    self.job_queue.set_progress(job["id"], progress)),
+                eta_callback=lambda eta: self.job_queue.set_eta(
+                    job["id"], eta))
+            final_srt = transcription.run()
+            error = (
+                transcription.error if final_srt is None
+                else transcription.translation_error)
+        except Exception as e:
+            final_srt = None
+            error = f"{type(e).__name__}: {e}"
+        self.job_queue.finish(job["id"], result=final_srt, error=error)
+
+
+class RequestHandler(http_server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        job_queue = self.server.job_queue
+        if parts == ["jobs"]:
+            self.send_json(200, job_queue.list_jobs())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = job_queue.get(self.get_job_id(parts[1]))
+            if job:
+                self.send_json(200, job)
+            else:
+                self.send_json(404, {"error": "Unknown job"})
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            self.send_events(self.get_job_id(parts[1]))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+        if not self.check_client():
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            submission = json.loads(self.rfile.read(length))
+            params = submission["params"]
+            priority = min(max(
+                int(submission.get("priority", 0)),
+                -constants.SERVER_MAX_PRIORITY),
+                constants.SERVER_MAX_PRIORITY)
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {"error": "Invalid job submission"})
+            return
+
+        error = validate_job_params(params)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+
+        job_id = self.server.job_queue.submit(
+            params, priority, submission.get("user"))
+        self.send_json(201, {"id": job_id})
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "jobs":
+            self.send_json(404, {"error": "Not found"})
+        elif not self.check_client():
+            return
+        elif self.server.job_queue.cancel(self.get_job_id(parts[1])):
+            self.send_json(200, {"cancelled": True})
+        else:
+            self.send_json(409, {"error": "Job is not queued"})
+
+    def send_events(self, job_id):
+        """
+        Streams the job every time its status, progress or remaining time
+        changes, until it is finished.
+        """
+        job_queue = self.server.job_queue
+        if job_queue.get(job_id) is None:
+            self.send_json(404, {"error": "Unknown job"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        last_state = None
+        try:
+            while True:
+                version = job_queue.version
+                job = job_queue.get(job_id)
+                state = (job["status"], job["progress"], job["eta"])
+                if state != last_state:
+                    self.wfile.write(f"data: {json.dumps(job)}\n\n".encode())
+                    self.wfile.flush()
+                    last_state = state
+                if job["status"] in FINAL_STATUSES:
+                    return
+                if not job_queue.wait_for_change(
+                        version, constants.SERVER_EVENTS_KEEPALIVE):
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client disconnected, the job keeps running
+            return
+
+    def check_client(self):
+        """
+        Rejects requests sent by web pages (cross-site request forgery):
+        browsers add an Origin header to them, and can't send JSON to
+        another site without a preflight request the server doesn't
+        answer.
+        """
+        content_type = self.headers.get("Content-Type", "")
+        if self.headers.get("Origin") is not None:
+            self.send_json(403, {"error": "Cross-origin requests refused"})
+            return False
+        if content_type.split(";")[0].strip() != "application/json":
+            self.send_json(
+                415, {"error": "Content-Type must be application/json"})
+            return False
+        return True
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def get_job_id(value):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+
+def validate_job_params(params):
+    """Returns why the parameters of a job are invalid, None if valid."""
+    if not isinstance(params, dict):
+        return "params must be an object"
+    unknown = set(params) - set(JOB_PARAMETERS)
+    if unknown:
+        return f"Unknown parameters: {sorted(unknown)}"
+    missing = REQUIRED_JOB_PARAMETERS - set(params)
+    if missing:
+        return f"Missing parameters: {sorted(missing)}"
+    for name, value in params.items():
+        value_type = JOB_PARAMETERS[name]
+        if not isinstance(value, value_type) or (
+                isinstance(value, bool) and value_type is not bool):
+            return f"Invalid type of {name}: {type(value).__name__}"
+        choices = JOB_PARAMETER_CHOICES.get(name)
+        if choices and value not in choices:
+            return f"{name} must be one of {', '.join(choices)}"
+    if not os.path.isfile(params["file_path"]):
+        return "file_path is not a file"
+    return None
+
+
+def get_server_url():
+    address = os.environ.get(
+        "TRANSCRIPTER_SERVER",
+        f"{constants.SERVER_HOST}:{constants.SERVER_PORT}")
+    return f"http://{address}"
+
+
+def call_server(method, path, payload=None, timeout=10):
+    """Sends a request to the server and returns its decoded JSON answer."""
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(
+        f"{get_server_url()}{path}", data=data, method=method,
+        headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def is_server_running(timeout=0.5):
+    try:
+        call_server("GET", "/jobs", timeout=timeout)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def submit_job(params, priority=0, user=None):
+    """
+    Submits a job to the server and returns its id.
+
+    Parameters:
+    - params (dict): processing.TranscriptionJob parameters, file_path is
+        required.
+    - priority (int): Higher priorities run first among the jobs of the
+        user, clamped to +/- SERVER_MAX_PRIORITY.
+    - user (str): Owner of the job (default: current user).
+    """
+    answer = call_server("POST", "/jobs", {
+        "params": params,
+        "priority": priority,
+        "user": user or getpass.getuser(),
+    })
+    return answer["id"]
+
+
+def iter_job_events(job_id):
+    """Yields the job every time it changes, until it is finished."""
+    url = f"{get_server_url()}/jobs/{job_id}/events"
+    with urllib.request.urlopen(url) as response:
+        for line in response:
+            line = line.decode().strip()
+            if line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog=f"python -m {constants.TOOLNAME}.server",
+        description="Local transcription server sharing resident models.")
+    parser.add_argument("--host", default=constants.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=constants.SERVER_PORT)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=constants.SERVER_JOBS,
+        help="Number of jobs running at the same time")
+    parser.add_argument(
+        "--preload", nargs="*", default=[],
+        choices=constants.SETTING_NAMES_MODEL,
+        help="Whisper models loaded at startup")
+    parser.add_argument(
+        "--memory-budget", type=int,
+        default=constants.MODEL_MEMORY_BUDGET_MB,
+        help="Memory used by resident models in MB")
+    args = parser.parse_args(argv)
+
+    try:
+        ffmpeg.setup_ffmpeg()
+    except FileNotFoundError as e:
+        print(e)
+        return 2
+
+    models.get_registry().set_memory_budget(args.memory_budget)
+    for model_size in args.preload:
+        models.get_whisper_model(model_size)
+
+    job_queue = JobQueue()
+    job_queue.requeue_running()
+    server = TranscriptionServer(job_queue, args.host, args.port, args.jobs)
+    server.start_runners()
+    print(f">>> Transcription server listening on "
+          f"http://{args.host}:{args.port} with {args.jobs} job runners")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,19 @@
 import os
-import paths
+import re
+import itertools
+import numpy as np
 
+from transcripter import paths
+from transcripter import tracing
 from transcripter import constants
 
+# Cue timing line of SRT ("00:00:01,000") and VTT ("00:01.000") files
+TIMING_PATTERN = re.compile(
+    r"^(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})[ \t]*-->[ \t]*"
+    r"(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})[^\n]*\n?", re.MULTILINE)
+MILLISECONDS_FACTORS = np.array(
+    [3600000, 60000, 1000, 1], dtype=np.int64)
+
 
 def srt_exists(original_video_path):
     dir_name = os.path.dirname(original_video_path)
@@ -19,6 +30,17 @@ def srt_exists(original_video_path):
     return False
 
 
+def get_srt_path(original_video_path, target_language):
+    """Returns the path of the final SRT file, next to the video."""
+    original_video_base_name, _ = paths.get_filename_without_ext(
+        original_video_path)
+    return os.path.join(
+        os.path.dirname(original_video_path),
+        f"{original_video_base_name}.{target_language}.srt"
+    )
+
+
+@tracing.traced("merge subtitles", "subtitles")
 def merge_srt_files(srt_files, original_video_path, target_language):
     """
     Merges multiple SRT files into a single final SRT file.
@@ -30,49 +52,245 @@ def merge_srt_files(srt_files, original_video_path, target_language):
     Returns:
     - str: Path to the final merged SRT file.
     """
+    merged_srt_path = get_srt_path(original_video_path, target_language)
 
-    original_video_base_name, _ = paths.get_filename_without_ext(
-        original_video_path)
-
-    merged_srt_path = os.path.join(
-        os.path.dirname(original_video_path),
-        f"{original_video_base_name}.{target_language}.srt"
-    )
-
-    subtitle_index = 1  # Counter for subtitles
-
-    with open(merged_srt_path, "w", encoding="utf-8") as outfile:
-        for srt_file in srt_files:
-            with open(srt_file, "r", encoding="utf-8") as infile:
-                lines = infile.readlines()
-
-            subtitle_block = []
-
-            for line in lines:
-                line = line.strip()
-                if line.isdigit():  # Subtitle index
-                    if subtitle_block:
-                        outfile.write(
-                            f"{subtitle_index}\n" + "\n".join(subtitle_block) + "\n\n")
-                        subtitle_index += 1
-                        subtitle_block = []
-                elif "-->" in line:  # Timestamp line
-                    subtitle_block.append(line)
-                else:  # Subtitle text
-                    subtitle_block.append(line)
-
-            # Write last subtitle block of the file
-            if subtitle_block:
-                outfile.write(
-                    f"{subtitle_index}\n" + "\n".join(subtitle_block) + "\n\n")
-                subtitle_index += 1
+    SubtitleTrack.merge(
+        [SubtitleTrack.load(srt_file) for srt_file in srt_files]
+    ).save(merged_srt_path)
 
     print(f">>> Successfully merged subtitles into: {merged_srt_path}")
     return merged_srt_path
 
 
-def save_srt(srt_file, srt_content):
-    print(f">>> Saving temporary SRT file: {srt_file}")
-    with open(srt_file, "w", encoding="utf-8") as f:
-        f.write(srt_content)
-    return srt_file
+def format_milliseconds(milliseconds, separator=","):
+    """Formats a time in milliseconds as an SRT timestamp (HH:MM:SS,mmm)."""
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return (
+        f"{hours:02}:{minutes:02}:{seconds:02}{separator}{milliseconds:03}")
+
+
+class SubtitleTrack:
+    """
+    Subtitle cues stored in parallel arrays: start and end times in integer
+    milliseconds, and the offsets of each cue text in one string buffer.
+    Offsetting and merging tracks are array operations, so large subtitle
+    libraries parse and shift quickly.
+    """
+
+    def __init__(self, starts=None, ends=None, text_offsets=None,
+                 text_buffer=""):
+        self.starts = np.asarray(
+            starts if starts is not None else [], dtype=np.int64)
+        self.ends = np.asarray(
+            ends if ends is not None else [], dtype=np.int64)
+        # Cue i text is text_buffer[text_offsets[i]:text_offsets[i + 1]]
+        self.text_offsets = np.asarray(
+            text_offsets if text_offsets is not None else [0],
+            dtype=np.int64)
+        self.text_buffer = text_buffer
+
+    @classmethod
+    def from_texts(cls, starts, ends, texts):
+        """Builds a track from cue times (milliseconds) and texts."""
+        lengths = np.fromiter(
+            (len(text) for text in texts), dtype=np.int64, count=len(texts))
+        text_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        return cls(starts, ends, text_offsets, "".join(texts))
+
+    @classmethod
+    def from_segments(cls, segments, offset=0):
+        """
+        Builds a track from Whisper segments ("start", "end" and "text" in
+        seconds) shifted by offset seconds.
+        """
+        starts = np.array(
+            [segment["start"] for segment in segments], dtype=np.float64)
+        ends = np.array(
+            [segment["end"] for segment in segments], dtype=np.float64)
+        return cls.from_texts(
+            np.round((starts + offset) * 1000).astype(np.int64),
+            np.round((ends + offset) * 1000).astype(np.int64),
+            [segment["text"].strip() for segment in segments])
+
+    @classmethod
+    def parse(cls, content):
+        """
+        Parses SRT or VTT content in a single pass. Cue numbers, the VTT
+        header and cue settings are ignored.
+        """
+        content = content.lstrip("\ufeff").replace("\r\n", "\n")
+        timings = []
+        texts = []
+        matches = list(TIMING_PATTERN.finditer(content))
+        for i, match in enumerate(matches):
+            text_end = content.find("\n\n", match.end())
+            if text_end == -1:
+                text_end = len(content)
+            if i + 1 < len(matches):
+                # A cue without text ends where the next one starts, with
+                # its cue number
+                next_start = matches[i + 1].start()
+                newline = content.rfind("\n", match.end(), next_start - 1)
+                line_start = match.end() if newline == -1 else newline + 1
+                if content[line_start:next_start].strip().isdigit():
+                    next_start = line_start
+                text_end = min(text_end, next_start)
+            timings.append(match.groups("0"))
+            texts.append(content[match.end():text_end].strip())
+
+        if not timings:
+            return cls()
+        # Columns: start h, m, s, ms, end h, m, s, ms
+        timings = np.array(
+            list(map(int, itertools.chain.from_iterable(timings))),
+            dtype=np.int64).reshape(-1, 8)
+        starts = timings[:, :4] @ MILLISECONDS_FACTORS
+        ends = timings[:, 4:] @ MILLISECONDS_FACTORS
+        return cls.from_texts(starts, ends, texts)
+
+    @classmethod
+    def load(cls, subtitle_file):
+        with open(subtitle_file, "r", encoding="utf-8") as file:
+            return cls.parse(file.read())
+
+    @classmethod
+    def merge(cls, tracks):
+        """Concatenates tracks into one track."""
+        tracks = list(tracks)
+        if not tracks:
+            return cls()
+        text_offsets = [np.zeros(1, dtype=np.int64)]
+        buffer_length = 0
+        for track in tracks:
+            text_offsets.append(track.text_offsets[1:] + buffer_length)
+            buffer_length += len(track.text_buffer)
+        return cls(
+            np.concatenate([track.starts for track in tracks]),
+            np.concatenate([track.ends for track in tracks]),
+            np.concatenate(text_offsets),
+            "".join(track.text_buffer for track in tracks))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def get_text(self, index):
+        return self.text_buffer[
+            self.text_offsets[index]:self.text_offsets[index + 1]]
+
+    def texts(self):
+        """Returns the list of cue texts."""
+        offsets = self.text_offsets.tolist()
+        return [
+            self.text_buffer[start:end]
+            for start, end in zip(offsets, offsets[1:])]
+
+    def get_full_text(self, separator=" "):
+        """Returns the text of every cue joined in one string."""
+        return separator.join(
+            " ".join(text.split()) for text in self.texts() if text)
+
+    def shift(self, milliseconds):
+        """Offsets every cue by milliseconds, in place."""
+        self.starts += milliseconds
+        self.ends += milliseconds
+        return self
+
+    def with_texts(self, texts):
+        """Returns a track with the same timings and new cue texts."""
+        return SubtitleTrack.from_texts(
+            self.starts.copy(), self.ends.copy(), texts)
+
+    def to_segments(self):
+        """Returns the cues as segments with times in seconds."""
+        return [
+            {"start": start / 1000, "end": end / 1000, "text": text}
+            for start, end, text in zip(
+                self.starts.tolist(), self.ends.tolist(), self.texts())]
+
+    def to_srt(self, first_index=1):
+        """Serializes the track in SRT format."""
+        return "".join(
+            f"{index}\n"
+            f"{format_milliseconds(start)} --> {format_milliseconds(end)}\n"
+            f"{text}\n\n"
+            for index, start, end, text in zip(
+                range(first_index, first_index + len(self)),
+                self.starts.tolist(), self.ends.tolist(), self.texts()))
+
+    def to_vtt(self):
+        """Serializes the track in WebVTT format."""
+        return "WEBVTT\n\n" + "".join(
+            f"{format_milliseconds(start, '.')} --> "
+            f"{format_milliseconds(end, '.')}\n{text}\n\n"
+            for start, end, text in zip(
+                self.starts.tolist(), self.ends.tolist(), self.texts()))
+
+    def save(self, subtitle_file):
+        """Saves the track, as VTT if the file extension is .vtt."""
+        is_vtt = subtitle_file.lower().endswith(".vtt")
+        with open(subtitle_file, "w", encoding="utf-8") as file:
+            file.write(self.to_vtt() if is_vtt else self.to_srt())
+        return subtitle_file
+
+
+class SrtWriter:
+    """
+    Writes subtitles progressively to an SRT file. Segments are numbered as
+    they are appended and the file is flushed after every write, so the
+    partial file is always a valid SRT that editors can open.
+
+    The subtitles are written to a ".partial" file next to srt_file, created
+    with the first cue. finish() renames it to srt_file, discard() removes
+    it: an existing srt_file is only replaced by a complete one.
+    """
+
+    def __init__(self, srt_file):
+        self.srt_file = srt_file
+        self.partial_file = f"{srt_file}.partial"
+        self.subtitle_index = 1
+        self._file = None
+
+    def write_segments(self, segments, offset=0):
+        """
+        Appends segments ("start", "end" and "text" in seconds) shifted by
+        offset seconds.
+        """
+        self.write_track(SubtitleTrack.from_segments(segments, offset))
+
+    def write_track(self, track):
+        """Appends the cues of a SubtitleTrack."""
+        with tracing.span("write subtitles", "subtitles", cues=len(track)):
+            if self._file is None:
+                self._file = open(self.partial_file, "w", encoding="utf-8")
+            self._file.write(track.to_srt(first_index=self.subtitle_index))
+            self._file.flush()
+        self.subtitle_index += len(track)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def finish(self):
+        """Replaces srt_file by the written subtitles, even if empty."""
+        self.close()
+        if self._file is None:
+            open(self.partial_file, "w", encoding="utf-8").close()
+        os.replace(self.partial_file, self.srt_file)
+        return self.srt_file
+
+    def discard(self):
+        """Removes the written subtitles, srt_file is left as it was."""
+        self.close()
+        if os.path.exists(self.partial_file):
+            os.remove(self.partial_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.discard()
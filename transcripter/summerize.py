@@ -1,29 +1,192 @@
-import re
+'''
+Summarizes transcripts of any length with Pegasus.
+
+The text is split into windows that fit the model input, the windows are
+summarized in batches and the partial summaries are summarized again until
+they fit a single window (map-reduce). Only one batch of windows is in
+memory on the model at a time.
+'''
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import re
+
+from transcripter import models
+from transcripter import tracing
+from transcripter import constants
+from transcripter import subtitles
 
 MODEL_NAME = "google/pegasus-xsum"
 
-def read_srt_text(file_path):
-    """Extracts the text content from an SRT file, ignoring timestamps."""
-    with open(file_path, "r", encoding="utf-8") as file:
-        content = file.readlines()
+# Splits after sentence ending punctuation
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?\u2026])\s+")
+
+
+class Summarizer:
+    """
+    A resident Pegasus tokenizer and model. Exposes the parameters of the
+    model so the registry accounts for its memory.
+    """
+
+    def __init__(self, model_name, device, quantize=False):
+        # Imported on first use, they take seconds to import
+        import transformers
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if quantize:
+            self.model = models.load_quantized_model(
+                f"{model_name.replace('/', '_')}_{transformers.__version__}",
+                lambda: AutoModelForSeq2SeqLM.from_pretrained(model_name))
+        else:
+            self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+            self.model.to(device)
+        self.model.eval()
+        # Pegasus models are trained on inputs of 512 or 1024 tokens
+        self.max_input_tokens = min(
+            constants.SUMMARY_MAX_INPUT_TOKENS,
+            getattr(self.model.config, "max_position_embeddings",
+                    constants.SUMMARY_MAX_INPUT_TOKENS),
+            self.tokenizer.model_max_length)
+
+    def parameters(self):
+        return self.model.parameters()
+
+    def split_into_windows(self, text):
+        """
+        Splits text into windows of whole sentences, each one fitting the
+        model input. Sentences longer than a window are cut.
+        """
+        # Room for the end of sequence token
+        window_tokens = self.max_input_tokens - 1
+        windows = []
+        window = []
+        window_length = 0
+        for sentence in SENTENCE_END_PATTERN.split(text):
+            tokens = self.tokenizer.encode(
+                sentence, add_special_tokens=False)
+            for first in range(0, len(tokens), window_tokens):
+                part = tokens[first:first + window_tokens]
+                if window and window_length + len(part) > window_tokens:
+                    windows.append(window)
+                    window, window_length = [], 0
+                window.append(
+                    sentence if len(tokens) <= window_tokens
+                    else self.tokenizer.decode(part))
+                window_length += len(part)
+        if window:
+            windows.append(window)
+        return [" ".join(window) for window in windows]
+
+    def fit_window(self, texts):
+        """
+        Joins texts into a single window, every text cut in proportion to
+        its length so that they all keep a part.
+        """
+        window_tokens = self.max_input_tokens - 1
+        texts_tokens = [
+            self.tokenizer.encode(text, add_special_tokens=False)
+            for text in texts]
+        # The separators take one token each at most
+        room = max(len(texts), window_tokens - len(texts))
+        total = sum(len(tokens) for tokens in texts_tokens) or 1
+        return " ".join(
+            self.tokenizer.decode(tokens[:max(1, len(tokens) * room // total)])
+            for tokens in texts_tokens)
+
+    def summarize_batch(self, texts, max_length, min_length):
+        """Summarizes texts, each one fitting the model input."""
+        import torch
+
+        inputs = self.tokenizer(
+            texts, return_tensors="pt", padding=True, truncation=True,
+            max_length=self.max_input_tokens).to(self.device)
+        lock = models.get_registry().get_inference_lock(self)
+        with lock, torch.inference_mode(), \
+                tracing.span("summarize", "summary", windows=len(texts)):
+            summary_ids = self.model.generate(
+                inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                max_length=max_length,
+                min_length=min_length,
+                length_penalty=2.0,
+                num_beams=4,
+            )
+        return [
+            summary.strip() for summary in self.tokenizer.batch_decode(
+                summary_ids, skip_special_tokens=True)]
+
+    def summarize(self, text, max_length, min_length,
+                  batch_size=constants.SUMMARY_BATCH_SIZE,
+                  progress_callback=None):
+        """
+        Summarizes text of any length. Windows are summarized into partial
+        summaries, which are merged and summarized again until they fit a
+        single window. Levels that don't reduce the number of windows are
+        summarized shorter, down to SUMMARY_PARTIAL_MIN_LENGTH tokens, then
+        the partial summaries are cut to fit a single window.
+        """
+        windows = self.split_into_windows(text)
+        partial_max_length = constants.SUMMARY_PARTIAL_MAX_LENGTH
+        # Every level summarizes the partial summaries of the previous one,
+        # the first level is most of the work.
+        progress_start, progress_end = 0, 80
+        while len(windows) > 1:
+            print(f"Summarizing {len(windows)} windows...")
+            partial_summaries = []
+            for first in range(0, len(windows), batch_size):
+                partial_summaries += self.summarize_batch(
+                    windows[first:first + batch_size],
+                    partial_max_length,
+                    min(constants.SUMMARY_PARTIAL_MIN_LENGTH,
+                        partial_max_length // 2))
+                if progress_callback:
+                    done = min(first + batch_size, len(windows))
+                    progress_callback(int(
+                        progress_start + (progress_end - progress_start)
+                        * done / len(windows)))
+            merged_windows = self.split_into_windows(
+                " ".join(partial_summaries))
+            if len(merged_windows) >= len(windows):
+                if partial_max_length > constants.SUMMARY_PARTIAL_MIN_LENGTH:
+                    # The partial summaries are not shorter
+                    partial_max_length //= 2
+                else:
+                    merged_windows = [self.fit_window(partial_summaries)]
+            windows = merged_windows
+            progress_start, progress_end = progress_end, (
+                progress_end + 100) // 2
+
+        print("Generating summary...")
+        summary = self.summarize_batch(windows, max_length, min_length)[0]
+        if progress_callback:
+            progress_callback(100)
+        return summary
+
+
+def get_summarizer(device=None, quantize=False):
+    """
+    Returns the resident summarization model, with int8 linear layers when
+    quantize is set and the device is the CPU.
+    """
+    if device is None:
+        device = models.get_device()
+    quantize = models.use_quantization(quantize, device)
+    return models.get_registry().get(
+        ("pegasus", MODEL_NAME, device, "int8" if quantize else "fp32"),
+        lambda: Summarizer(MODEL_NAME, device, quantize))
 
-    text_lines = []
-    for line in content:
-        if not re.match(r"^\d+$", line.strip()) and not re.match(r"^\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}$", line.strip()):
-            text_lines.append(line.strip())
 
-    extracted_text = " ".join(text_lines).replace("  ", " ").strip()
-    return extracted_text
+def read_srt_text(file_path):
+    """Extracts the text content from an SRT file, ignoring timestamps."""
+    return subtitles.SubtitleTrack.load(file_path).get_full_text()
 
-def summarize_srt(file_path, max_length=3000, min_length=200):
-    """Summarizes the extracted text from an SRT file using a pre-trained model and saves it as a .txt file."""
-    print("Loading model and tokenizer...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
 
+def summarize_srt(file_path, max_length=3000, min_length=200,
+                  quantize=False, progress_callback=None):
+    """
+    Summarizes the text of an SRT file and saves it as a .txt file next to
+    it. The whole transcript is summarized, whatever its length.
+    """
     # Extract text from SRT
     text = read_srt_text(file_path)
     print(f"Extracted text length: {len(text)} characters")
@@ -36,33 +199,10 @@ def summarize_srt(file_path, max_length=3000, min_length=200):
     base_name = os.path.splitext(file_path)[0]  # Removes .srt extension
     output_txt = f"{base_name}.txt"
 
-    # Check token length
-    num_tokens = len(tokenizer.tokenize(text))
-    print(f"Number of tokens: {num_tokens}")
-
-    if num_tokens > 1024:
-        print("Warning: Input text is too long and will be truncated.")
-
-    # Detect if a GPU is available
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Using device: {device}")
-
-    model = model.to(device)
-
-    # Tokenize input
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=1024).to(device)
-
-    print("Generating summary...")
-    summary_ids = model.generate(
-        inputs.input_ids,
-        max_length=max_length,
-        min_length=min_length,
-        length_penalty=2.0,
-        num_beams=4,
-    )
-
-    print("Decoding summary...")
-    summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+    summarizer = get_summarizer(quantize=quantize)
+    print(f"Using device: {summarizer.device}")
+    summary = summarizer.summarize(
+        text, max_length, min_length, progress_callback=progress_callback)
 
     # Save summary to a text file in the same directory as the .srt
     with open(output_txt, "w", encoding="utf-8") as file:
@@ -76,4 +216,4 @@ def summarize_srt(file_path, max_length=3000, min_length=200):
 if __name__ == "__main__":
     srt_file = "your_transcription.srt"  # Change this to your actual SRT file path
     summary = summarize_srt(srt_file)
-    print("\nFinal Summary Output:\n", summary)
\ No newline at end of file
+    print("\nFinal Summary Output:\n", summary)
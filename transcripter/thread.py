@@ -1,14 +1,10 @@
-import os
-import time
 from PySide6 import QtCore
 
-from transcripter import ffmpeg
-from transcripter import subtitles
-from transcripter import translate
-from transcripter import transcribe
-
-# Small delay for synchronization# Small delay for synchronization
-CORRECTION_OFFSET = 0.2
+from transcripter import constants
+from transcripter import server
+from transcripter import planner
+from transcripter import summerize
+from transcripter import processing
 
 
 class TranscriptionWorker(QtCore.QThread):
@@ -16,6 +12,11 @@ class TranscriptionWorker(QtCore.QThread):
     Worker thread for handling transcription without freezing the UI.
     """
     progress = QtCore.Signal(int)
+    # Estimated remaining seconds, -1 while unknown
+    eta = QtCore.Signal(float)
+    # Error of a job whose subtitles could not be translated, emitted
+    # before finished
+    translation_failed = QtCore.Signal(str)
     finished = QtCore.Signal(str, float)
 
     def __init__(
@@ -29,122 +30,155 @@ class TranscriptionWorker(QtCore.QThread):
         compression_threshold: float,
         force_new_srt: bool = True,
         target_language: str = None,
-        prompt=None
+        prompt=None,
+        chunk_mode: str = constants.CHUNK_MODE,
+        workers: int = constants.WORKERS,
+        skip_silence: bool = constants.SKIP_SILENCE,
+        batch_size: int = constants.BATCH_SIZE,
+        quantize: bool = constants.QUANTIZE,
+        backend: str = constants.ASR_BACKEND,
+        auto_plan: bool = constants.AUTO_PLAN
     ):
         super().__init__()
-        self.input_file = file_path
-        self.mode = mode
-        self.target_language = target_language
-        self.model_size = model_size
-        self.beam_size = beam_size
-        self.temperature = temperature
-        self.compression_threshold = compression_threshold
-        self.chunk_duration = chunk_duration
-        self.force_new_srt = force_new_srt
-        self.prompt = prompt
+        self.job = processing.TranscriptionJob(
+            file_path=file_path,
+            mode=mode,
+            model_size=model_size,
+            beam_size=beam_size,
+            temperature=temperature,
+            chunk_duration=chunk_duration,
+            compression_threshold=compression_threshold,
+            force_new_srt=force_new_srt,
+            target_language=target_language,
+            prompt=prompt,
+            chunk_mode=chunk_mode,
+            workers=workers,
+            skip_silence=skip_silence,
+            batch_size=batch_size,
+            quantize=quantize,
+            backend=backend,
+            auto_plan=auto_plan,
+            progress_callback=self.update_progress,
+            eta_callback=self.eta.emit)
 
     def run(self):
         """
         Executes the transcription process and emits progress signals.
+        The finished signal is always emitted, with an error message if
+        the job failed.
+        """
+        try:
+            final_srt = self.job.run()
+        except Exception as e:
+            print(f"Error transcribing {self.job.input_file}: {e}")
+            self.finish(f"Error: {type(e).__name__}: {e}", 0)
+            return
+        if final_srt is None:
+            self.finish(self.job.error, 0)
+            return
+        if self.job.translation_error:
+            self.translation_failed.emit(self.job.translation_error)
+        self.finish(final_srt, self.job.elapsed_time)
+
+    def update_progress(self, value: int):
         """
-        start_time = time.time()
-        self.update_progress(5)
-        temp_srt_files = None
-        existing_subtitle_file = None
+        Emits a progress update signal.
+        """
+        self.progress.emit(value)
 
-        if not self.force_new_srt:
-            existing_subtitle_file = subtitles.srt_exists(
-                original_video_path=self.input_file)
+    def finish(self, result: str, elapsed_time: float):
+        """
+        Emits the finished signal with the result and elapsed time.
+        """
+        self.progress.emit(100)
+        self.finished.emit(result, elapsed_time)
 
-        if not existing_subtitle_file or self.force_new_srt is True:
-            video_chunks = self.split_video()
-            if not video_chunks:
-                self.finish("Error: Video chunking failed.", 0)
-                return
 
-            temp_srt_files = self.process_chunks(video_chunks)
-            final_srt = self.merge_srt_files(temp_srt_files)
+class RemoteTranscriptionWorker(QtCore.QThread):
+    """
+    Worker thread submitting the job to the local transcription server and
+    relaying its progress, so the models stay resident in the server.
+    """
+    progress = QtCore.Signal(int)
+    # Estimated remaining seconds, -1 while unknown
+    eta = QtCore.Signal(float)
+    # Error of a job whose subtitles could not be translated, emitted
+    # before finished
+    translation_failed = QtCore.Signal(str)
+    finished = QtCore.Signal(str, float)
 
-        else:
-            # Bypass whisper transcription
-            final_srt = existing_subtitle_file
+    def __init__(self, priority: int = 0, **params):
+        super().__init__()
+        self.priority = priority
+        self.params = params
 
-        self.translate_srt(final_srt)
+    def run(self):
+        try:
+            job_id = server.submit_job(self.params, self.priority)
+            print(f">>> Job {job_id} submitted to the transcription server")
+            for job in server.iter_job_events(job_id):
+                if job["status"] == "done":
+                    if job["error"]:
+                        self.translation_failed.emit(job["error"])
+                    self.finish(
+                        job["result"], job["finished"] - job["started"])
+                    return
+                if job["status"] in server.FINAL_STATUSES:
+                    self.finish(job["error"] or "Error: Job cancelled.", 0)
+                    return
+                self.progress.emit(job["progress"])
+                if job["eta"] is not None:
+                    self.eta.emit(job["eta"])
+        except (OSError, ValueError) as e:
+            self.finish(f"Error: Transcription server unavailable: {e}", 0)
+            return
+        self.finish("Error: Lost connection to the transcription server.", 0)
 
-        if temp_srt_files:
-            self.cleanup(temp_srt_files)
-        self.finish(final_srt, time.time() - start_time)
+    def finish(self, result: str, elapsed_time: float):
+        self.progress.emit(100)
+        self.finished.emit(result, elapsed_time)
 
-    def split_video(self) -> list:
-        """
-        Splits the video into chunks and returns the list of chunk file paths.
-        """
-        return ffmpeg.split_video_into_chunks(
-            self.input_file, chunk_duration=self.chunk_duration)
 
-    def process_chunks(self, video_chunks: list) -> list:
-        """
-        Processes video chunks for transcription.
-        """
-        temp_srt_files = []
-
-        for i, chunk in enumerate(video_chunks):
-            self.update_progress(10 + int((i / len(video_chunks)) * 60))
-            chunk_start_time = (
-                i * self.chunk_duration + (CORRECTION_OFFSET if i > 0 else 0)
-                )
-            chunk_srt = transcribe.transcript(
-                input_file=chunk,
-                mode=self.mode,
-                model_size=self.model_size,
-                beam_size=self.beam_size,
-                temperature=self.temperature,
-                compression_ratio_threshold=self.compression_threshold,
-                chunk_start_time=chunk_start_time,
-                prompt=self.prompt
-                )
-
-            if chunk_srt:
-                temp_srt_files.append(chunk_srt)
-            os.remove(chunk)
-
-        return temp_srt_files
-
-    def merge_srt_files(self, temp_srt_files: list) -> str:
-        """
-        Merges temporary SRT files into a final output file.
-        """
-        self.update_progress(85)
-        return subtitles.merge_srt_files(
-            temp_srt_files,
-            self.input_file,
-            self.target_language)
+class PlanWorker(QtCore.QThread):
+    """
+    Worker thread probing a file and planning its job without freezing the
+    UI, so the estimated cost is shown before launching it.
+    """
+    planned = QtCore.Signal(object)
 
-    def translate_srt(self, srt_file: str):
-        """
-        Translates the SRT file if a language is specified.
-        """
-        self.update_progress(90)
-        print('Launch translation')
-        translate.translate_srt(
-            self.input_file, srt_file, self.target_language)
+    def __init__(self, file_path: str, **params):
+        super().__init__()
+        self.file_path = file_path
+        self.params = params
 
-    def cleanup(self, temp_srt_files: list):
-        """
-        Removes temporary SRT files after processing.
-        """
-        for temp_srt in temp_srt_files:
-            os.remove(temp_srt)
+    def run(self):
+        try:
+            plan = planner.plan_job(self.file_path, **self.params)
+        except Exception as e:
+            print(f"Error planning {self.file_path}: {e}")
+            plan = None
+        self.planned.emit(plan)
 
-    def update_progress(self, value: int):
-        """
-        Emits a progress update signal.
-        """
-        self.progress.emit(value)
 
-    def finish(self, result: str, elapsed_time: float):
-        """
-        Emits the finished signal with the result and elapsed time.
-        """
+class SummaryWorker(QtCore.QThread):
+    """
+    Worker thread summarizing an SRT file without freezing the UI.
+    """
+    progress = QtCore.Signal(int)
+    finished = QtCore.Signal(str)
+
+    def __init__(self, srt_file: str, quantize: bool = constants.QUANTIZE):
+        super().__init__()
+        self.srt_file = srt_file
+        self.quantize = quantize
+
+    def run(self):
+        try:
+            summary = summerize.summarize_srt(
+                self.srt_file, quantize=self.quantize,
+                progress_callback=self.progress.emit)
+        except Exception as e:
+            print(f"Error summarizing {self.srt_file}: {e}")
+            summary = f"Error: {e}"
         self.progress.emit(100)
-        self.finished.emit(result, elapsed_time)
+        self.finished.emit(summary or "")
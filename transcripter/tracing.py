@@ -0,0 +1,260 @@
+'''
+Records spans of the processing stages (wall time, CPU time, memory)
+and exports them as Chrome trace events (chrome://tracing, Perfetto) and as
+a JSON summary per job.
+'''
+import os
+import sys
+import json
+import time
+import threading
+import itertools
+import contextlib
+import functools
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+from transcripter import paths
+from transcripter import constants
+
+_local = threading.local()
+# Numbers the traces saved by the process, jobs can finish the same second
+_trace_counter = itertools.count(1)
+
+
+def get_rss():
+    """Current resident memory of the process in bytes, None if unknown."""
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            # Sizes in pages: total program size, then resident set size
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Not Linux
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def get_peak_rss():
+    """
+    Peak resident memory since the start of the process in bytes (a high
+    water mark, it never decreases), None if unknown.
+    """
+    if resource:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory_info = psutil.Process().memory_info()
+    return getattr(memory_info, "peak_wset", memory_info.rss)
+
+
+def get_children_cpu_time():
+    """CPU time of the finished child processes (FFmpeg), 0 on Windows."""
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class Tracer:
+    """
+    Collects the spans of one job. Spans can be recorded from any thread.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.start_time = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, category="", **args):
+        """
+        Records the wall time, the CPU time of the calling thread, the CPU
+        time of the child processes finished meanwhile, the resident memory
+        of the process at the start and at the end of the block and its
+        peak memory so far.
+        """
+        rss_start = get_rss()
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        children_cpu_start = get_children_cpu_time()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            record = {
+                "name": name,
+                "category": category,
+                "start": start - self._origin,
+                "wall_time": end - start,
+                "cpu_time": time.thread_time() - cpu_start,
+                "children_cpu_time": (
+                    get_children_cpu_time() - children_cpu_start),
+                "rss_start": rss_start,
+                "rss_end": get_rss(),
+                "process_peak_rss": get_peak_rss(),
+                "thread": threading.current_thread().name,
+                "thread_id": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.spans.append(record)
+
+    def get_summary(self):
+        """
+        Totals of the spans grouped by name, in order of first start.
+        max_rss is the highest resident memory sampled at the start or the
+        end of the spans of a stage, rss_growth the sum of their memory
+        increases.
+        """
+        stages = {}
+        for record in sorted(self.spans, key=lambda r: r["start"]):
+            stage = stages.setdefault(record["name"], {
+                "category": record["category"],
+                "count": 0,
+                "wall_time": 0.0,
+                "cpu_time": 0.0,
+                "children_cpu_time": 0.0,
+                "max_wall_time": 0.0,
+                "max_rss": None,
+                "rss_growth": None,
+            })
+            stage["count"] += 1
+            stage["wall_time"] += record["wall_time"]
+            stage["cpu_time"] += record["cpu_time"]
+            stage["children_cpu_time"] += record["children_cpu_time"]
+            stage["max_wall_time"] = max(
+                stage["max_wall_time"], record["wall_time"])
+            if record["rss_start"] is not None \
+                    and record["rss_end"] is not None:
+                stage["max_rss"] = max(
+                    stage["max_rss"] or 0,
+                    record["rss_start"], record["rss_end"])
+                stage["rss_growth"] = (stage["rss_growth"] or 0) + max(
+                    0, record["rss_end"] - record["rss_start"])
+        return {
+            "name": self.name,
+            "start_time": self.start_time,
+            "wall_time": time.perf_counter() - self._origin,
+            "process_peak_rss": get_peak_rss(),
+            "stages": stages,
+        }
+
+    def to_chrome_trace(self):
+        """Spans as complete events ("ph": "X") in microseconds."""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid,
+             "tid": thread_id, "args": {"name": thread}}
+            for thread_id, thread in {
+                r["thread_id"]: r["thread"] for r in self.spans}.items()]
+        for record in self.spans:
+            events.append({
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["wall_time"] * 1e6,
+                "pid": pid,
+                "tid": record["thread_id"],
+                "args": {
+                    **record["args"],
+                    "cpu_time": record["cpu_time"],
+                    "children_cpu_time": record["children_cpu_time"],
+                    "rss_start": record["rss_start"],
+                    "rss_end": record["rss_end"],
+                    "process_peak_rss": record["process_peak_rss"],
+                },
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, output_dir=None):
+        """
+        Writes <name>_<time>_<pid>-<number>.trace.json and .summary.json
+        files and returns their paths. The process id and number keep the
+        traces of concurrent jobs apart. Only the latest TRACES_MAX_COUNT
+        traces are kept.
+        """
+        output_dir = output_dir or get_traces_dir()
+        os.makedirs(output_dir, exist_ok=True)
+        base_name = os.path.join(output_dir, "{}_{}_{}-{}".format(
+            self.name, time.strftime(
+                "%Y%m%d_%H%M%S", time.localtime(self.start_time)),
+            os.getpid(), next(_trace_counter)))
+        trace_file = f"{base_name}.trace.json"
+        summary_file = f"{base_name}.summary.json"
+        with open(trace_file, "w", encoding="utf-8") as file:
+            json.dump(self.to_chrome_trace(), file)
+        with open(summary_file, "w", encoding="utf-8") as file:
+            json.dump(self.get_summary(), file, indent=4)
+        remove_old_traces(output_dir)
+        return trace_file, summary_file
+
+
+def get_traces_dir():
+    return os.path.join(paths.get_cache_dir(), "traces")
+
+
+def remove_old_traces(traces_dir, max_count=constants.TRACES_MAX_COUNT):
+    trace_files = sorted(
+        (os.path.join(traces_dir, file_name)
+         for file_name in os.listdir(traces_dir)
+         if file_name.endswith(".trace.json")),
+        key=os.path.getmtime)
+    for trace_file in trace_files[:-max_count]:
+        for path in (trace_file, trace_file.replace(
+                ".trace.json", ".summary.json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Removed by a concurrent job
+                pass
+
+
+def get_tracer():
+    """Returns the tracer of the job running in this thread, if any."""
+    return getattr(_local, "tracer", None)
+
+
+@contextlib.contextmanager
+def activate(tracer):
+    """Records the spans of the calling thread in tracer."""
+    previous_tracer = get_tracer()
+    _local.tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _local.tracer = previous_tracer
+
+
+def span(name, category="", **args):
+    """
+    Context manager recording a span in the tracer of the current thread.
+    Does nothing when no tracer is active.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, category, **args)
+
+
+def traced(name, category=""):
+    """Decorator recording every call of a function as a span."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,18 +1,20 @@
 import os
-import torch
-import whisper
-import tempfile
+from concurrent import futures
 
-from transcripter import subtitles
+from transcripter import models
+from transcripter import backends
 from transcripter import constants
+from transcripter import tracing
 
 
-def load_whisper_model(model_size: str = "small"):
-    """Loads the Whisper model."""
-    return whisper.load_model(model_size)
+def load_whisper_model(model_size: str = "small", device=None, fp16=None,
+                       quantize=False):
+    """Returns the resident Whisper model, loading it on first use."""
+    return models.get_whisper_model(
+        model_size, device=device, fp16=fp16, quantize=quantize)
 
 
-def transcript(
+def transcribe_segments(
     input_file,
     mode="transcribe",
     model_size="base",
@@ -21,13 +23,17 @@ def transcript(
     temperature=0.1,
     word_timestamps=False,
     fp16=None,
-    progress_callback=None,
     compression_ratio_threshold=2.0,
-    chunk_start_time=0,  # New parameter for time offset
     prompt=None,
+    decode_progress_callback=None,
+    quantize=False,
+    backend=constants.ASR_BACKEND,
+    cores=None,
 ):
     """
-    Transcribes or translates an audio file and generates an SRT file.
+    Transcribes or translates an audio file and returns its segments.
+    Timestamps are relative to the start of the file.
+
     Parameters:
     - input_file (str): Path to the input audio file.
     - mode (str): "translate" (English translation) or "transcribe"
@@ -42,99 +48,434 @@ def transcript(
     - word_timestamps (bool): Enables word-level timestamps.
     - fp16 (bool): Use mixed precision for faster CUDA inference
         (None = auto-detect).
-    - progress_callback (function): Function to update the progress bar in UI.
     - compression_ratio_threshold : lower this if text chunks are too big
-    - chunk_start_time (int): The starting timestamp of this chunk in seconds.
+    - prompt (str): Text conditioning the decoding of the first window.
+    - decode_progress_callback (function): Called with the seconds of
+        audio decoded after every window.
+    - quantize (bool): Run the model with int8 linear layers (CPU only),
+        faster with a small accuracy loss.
+    - backend (str): Speech recognition engine, one of
+        constants.ASR_BACKENDS.
+    - cores (int): CPU threads of the backend (default: all of them).
 
+    Returns:
+    - List of {"start", "end", "text"} segments, or None on error.
     """
-
     try:
         # Select device (CUDA if available, otherwise CPU)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = models.get_device()
         print(f'>>> Using device: {device}')
 
-        # Auto-select fp16 based on device
-        if fp16 is None:
-            fp16 = device == "cuda"
-
-        # Load the specified Whisper model
-        print(f">>> Loading Whisper model: {model_size}...")
+        # Load the specified model
+        print(f">>> Loading {backend} model: {model_size}...")
         print(f">>> using beam_size value: {beam_size}")
         print(f">>> using temperature value: {temperature}")
         print(">>> using compression ratio value: "
               f"{compression_ratio_threshold}")
-        model = whisper.load_model(model_size).to(device)
-
-        # Emit progress: model loaded
-        if progress_callback:
-            progress_callback(5)
+        asr_backend = backends.get_backend(
+            backend, model_size, device=device, fp16=fp16, quantize=quantize,
+            cores=cores)
 
         # Transcribe or translate
         print("Transcription in progress...")
-        result = model.transcribe(
+        return asr_backend.transcribe(
             input_file,
-            task=mode,
-            language=language,
-            beam_size=beam_size,
-            temperature=temperature,
-            word_timestamps=word_timestamps,
-            fp16=fp16,
-            compression_ratio_threshold=compression_ratio_threshold,
-            prompt=prompt,
-        )
-
-        # Emit progress: Transcription started
-        if progress_callback:
-            progress_callback(20)
-
-        # Convert to SRT format with time adjustments
-        srt_content = ""
-        total_segments = len(result["segments"])
-
-        for i, segment in enumerate(result["segments"]):
-            start_time = segment["start"] + chunk_start_time  # Apply offset
-            end_time = segment["end"] + chunk_start_time  # Apply offset
-            text = segment["text"]
-
-            # Format timestamps (HH:MM:SS,mmm)
-            start_time_srt = (
-                f"{int(start_time // 3600):02}:"
-                f"{int((start_time % 3600) // 60):02}:"
-                f"{int(start_time % 60):02},"
-                f"{int((start_time % 1) * 1000):03}"
-            )
-            end_time_srt = (
-                f"{int(end_time // 3600):02}:"
-                f"{int((end_time % 3600) // 60):02}:"
-                f"{int(end_time % 60):02},"
-                f"{int((end_time % 1) * 1000):03}"
-            )
-
-            # Append to SRT file format
-            srt_content += (
-                f"{i+1}\n{start_time_srt} --> {end_time_srt}\n{text}\n\n")
-
-            # Update progress
+            {
+                "mode": mode,
+                "language": language,
+                "beam_size": beam_size,
+                "temperature": temperature,
+                "word_timestamps": word_timestamps,
+                "compression_ratio_threshold": compression_ratio_threshold,
+                "prompt": prompt,
+            },
+            decode_progress_callback=decode_progress_callback)
+
+    except Exception as e:
+        print(f"Error during transcription: {e}")
+        return None
+
+
+def init_worker(num_threads, model_size, fp16=False, quantize=False):
+    """
+    Initializer of the transcription worker processes. Limits torch to its
+    share of intra-op threads and loads the model once for the lifetime of
+    the process.
+    """
+    import torch
+    torch.set_num_threads(num_threads)
+    load_whisper_model(
+        model_size, device="cpu", fp16=fp16, quantize=quantize)
+
+
+def get_threads_per_worker(workers, cores=None):
+    """Share the available cores between the worker processes."""
+    return max(1, (cores or os.cpu_count() or 1) // max(1, workers))
+
+
+def transcript_parallel(
+    chunks,
+    workers=2,
+    model_size="base",
+    progress_callback=None,
+    result_callback=None,
+    cores=None,
+    **options
+):
+    """
+    Transcribes chunks concurrently on CPU with a pool of worker processes,
+    each one keeping its own resident Whisper model.
+
+    Parameters:
+    - chunks (list): List of (chunk file path, chunk start time) tuples.
+    - workers (int): Number of worker processes.
+    - model_size (str): Whisper model size to use.
+    - progress_callback (function): Called with the number of finished
+        chunks every time a chunk completes.
+    - result_callback (function): Called with the chunk index and its
+        segments every time a chunk completes.
+    - cores (int): CPU cores shared by the workers (default: all of them).
+    - options: Other transcribe_segments() keyword arguments.
+
+    Returns:
+    - List of segments per chunk in timeline order (None for failed
+    chunks). Timestamps are relative to the start of each chunk.
+    """
+    workers = max(1, min(workers, len(chunks)))
+    threads_per_worker = get_threads_per_worker(workers, cores)
+    print(
+        f">>> Transcribing {len(chunks)} chunks with {workers} workers "
+        f"({threads_per_worker} threads each)")
+
+    chunk_segments = [None] * len(chunks)
+    with futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(threads_per_worker, model_size, False,
+                      options.get("quantize", False))) as executor:
+        jobs = {
+            executor.submit(
+                transcribe_segments,
+                input_file=chunk,
+                model_size=model_size,
+                fp16=False,
+                **options): i
+            for i, (chunk, _) in enumerate(chunks)
+        }
+
+        for done, job in enumerate(futures.as_completed(jobs), start=1):
+            chunk_segments[jobs[job]] = job.result()
+            if result_callback:
+                result_callback(jobs[job], chunk_segments[jobs[job]])
             if progress_callback:
-                progress_callback(int(((i + 1) / total_segments) * 80) + 10)
+                progress_callback(done)
 
-        # Save as an SRT file in the system's temp folder
-        temp_srt_dir = tempfile.gettempdir()
-        input_file_name = os.path.basename(input_file)
-        input_file_name_without_ext = os.path.splitext(input_file_name)[0]
-        srt_file = os.path.join(
-            temp_srt_dir, f"{input_file_name_without_ext}.srt")
+    # Results are stored by chunk index, so they are in timeline order
+    return chunk_segments
 
-        srt_file = subtitles.save_srt(srt_file, srt_content)
 
-        # Emit progress: Finalizing
-        if progress_callback:
-            progress_callback(100)
+# Thresholds of model.transcribe(): a window with a probability of no speech
+# above NO_SPEECH_THRESHOLD and an average log probability below
+# LOGPROB_THRESHOLD is silent. Otherwise a lower average log probability, or
+# a compression ratio above the threshold, falls back to the next
+# temperature.
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
 
-        return srt_file  # Return path to the generated SRT file
 
-    except Exception as e:
-        print(f"Error during transcription: {e}")
+class ChunkDecoding:
+    """
+    Decoding state of a chunk in batched transcription: its log-mel
+    spectrogram and the position (seek, in mel frames) of the next window,
+    advanced like model.transcribe() does.
+    """
+
+    def __init__(self, chunk_index, mel, content_frames):
+        self.chunk_index = chunk_index
+        self.mel = mel
+        self.content_frames = content_frames
+        self.seek = 0
+        self.language = None
+        self.segments = []
+
+    @property
+    def done(self):
+        return self.seek >= self.content_frames
+
+    def get_window(self):
+        """Returns the mel of the next window and its size in frames."""
+        import whisper
+
+        segment_size = min(
+            whisper.audio.N_FRAMES, self.content_frames - self.seek)
+        mel = self.mel[:, self.seek:self.seek + segment_size]
+        return whisper.pad_or_trim(mel, whisper.audio.N_FRAMES), segment_size
+
+
+def load_chunk_decodings(chunks, n_mels):
+    """Yields the ChunkDecoding of every chunk, loading one at a time."""
+    import whisper
+
+    for chunk_index, (chunk, _) in enumerate(chunks):
+        audio = whisper.load_audio(chunk)
+        # Padded with 30 seconds of silence, like model.transcribe()
+        mel = whisper.log_mel_spectrogram(
+            audio, n_mels=n_mels, padding=whisper.audio.N_SAMPLES)
+        yield ChunkDecoding(
+            chunk_index, mel, mel.shape[-1] - whisper.audio.N_FRAMES)
+
+
+def get_decoding_options(mode, language, beam_size, temperature, fp16,
+                         prompt):
+    """
+    Builds the decoding options the same way model.transcribe() does:
+    beam search is only used for deterministic (temperature 0) decoding.
+    """
+    import whisper
+
+    options = dict(
+        task=mode, language=language, temperature=temperature, fp16=fp16,
+        prompt=prompt)
+    if temperature == 0:
+        options["beam_size"] = beam_size
+    return whisper.DecodingOptions(**options)
+
+
+def get_temperatures(temperature):
+    """A single temperature (no fallback) or a fallback schedule."""
+    if isinstance(temperature, (int, float)):
+        return (temperature,)
+    return tuple(temperature)
+
+
+def needs_fallback(result, compression_ratio_threshold):
+    """The fallback rule of model.transcribe(), silent windows excepted."""
+    if (result.no_speech_prob > NO_SPEECH_THRESHOLD
+            and result.avg_logprob < LOGPROB_THRESHOLD):
+        return False
+    return (
+        (compression_ratio_threshold is not None
+         and result.compression_ratio > compression_ratio_threshold)
+        or result.avg_logprob < LOGPROB_THRESHOLD)
+
+
+def decode_batch(model, mels, mode, language, beam_size, temperature, fp16,
+                 compression_ratio_threshold, prompt):
+    """
+    Decodes a batch of mel windows in one encoder/decoder pass. Windows
+    needing a fallback (too repetitive or unlikely output) are decoded
+    again at the next temperature of the schedule, like model.transcribe().
+    """
+    import torch
+
+    batch = torch.stack(mels).to(model.device)
+    results = [None] * len(mels)
+    pending = list(range(len(mels)))
+    for current_temperature in get_temperatures(temperature):
+        decoded = model.decode(batch[pending], get_decoding_options(
+            mode, language, beam_size, current_temperature, fp16, prompt))
+        retry = []
+        for i, result in zip(pending, decoded):
+            results[i] = result
+            if needs_fallback(result, compression_ratio_threshold):
+                retry.append(i)
+        pending = retry
+        if not pending:
+            break
+    return results
+
+
+def get_window_segments(model, tokenizer, tokens, time_offset,
+                        segment_size):
+    """
+    Splits the tokens of a decoded window into segments at their timestamp
+    pairs, like model.transcribe().
+
+    Returns:
+    - (segments, number of mel frames consumed). A window that ends in the
+    middle of a segment is only consumed up to its last timestamp, the
+    next window starts there so words aren't cut at window edges.
+    """
+    import whisper
+
+    input_stride = whisper.audio.N_FRAMES // model.dims.n_audio_ctx
+    time_precision = (
+        input_stride * whisper.audio.HOP_LENGTH / whisper.audio.SAMPLE_RATE)
+    timestamp_begin = tokenizer.timestamp_begin
+    is_timestamp = [token >= timestamp_begin for token in tokens]
+    single_timestamp_ending = is_timestamp[-2:] == [False, True]
+    consecutive = [
+        i + 1 for i in range(len(tokens) - 1)
+        if is_timestamp[i] and is_timestamp[i + 1]]
+
+    segments = []
+
+    def add_segment(start, end, segment_tokens):
+        # The decoding drops the timestamp tokens
+        text = tokenizer.decode(segment_tokens)
+        if text.strip() and end > start:
+            segments.append({
+                "start": time_offset + start,
+                "end": time_offset + end,
+                "text": text,
+            })
+
+    if consecutive:
+        slices = consecutive + (
+            [len(tokens)] if single_timestamp_ending else [])
+        last_slice = 0
+        for current_slice in slices:
+            sliced_tokens = tokens[last_slice:current_slice]
+            add_segment(
+                (sliced_tokens[0] - timestamp_begin) * time_precision,
+                (sliced_tokens[-1] - timestamp_begin) * time_precision,
+                sliced_tokens)
+            last_slice = current_slice
+        consumed = segment_size
+        if not single_timestamp_ending:
+            consumed = (tokens[last_slice - 1] - timestamp_begin) * (
+                input_stride)
+    else:
+        duration = (
+            segment_size * whisper.audio.HOP_LENGTH
+            / whisper.audio.SAMPLE_RATE)
+        timestamps = [
+            token for token, timestamp in zip(tokens, is_timestamp)
+            if timestamp]
+        if timestamps and timestamps[-1] != timestamp_begin:
+            duration = (timestamps[-1] - timestamp_begin) * time_precision
+        add_segment(0.0, duration, tokens)
+        consumed = segment_size
+    # Always move forward
+    return segments, max(1, min(consumed, segment_size))
+
+
+def transcript_batched(
+    chunks,
+    batch_size=8,
+    mode="transcribe",
+    model_size="base",
+    language=None,
+    beam_size=8,
+    temperature=0.1,
+    fp16=None,
+    progress_callback=None,
+    result_callback=None,
+    compression_ratio_threshold=2.0,
+    prompt=None,
+    decode_progress_callback=None,
+    quantize=False,
+):
+    """
+    Transcribes chunks by decoding the current window of up to batch_size
+    chunks (or files) together, in one encoder/decoder pass per step.
+
+    Every chunk follows the rules of model.transcribe(): the next window
+    starts at the last timestamp of the previous one, silent windows are
+    skipped, the temperature falls back on repetitive or unlikely output and
+    the language is detected on the first window. Unlike model.transcribe(),
+    windows are not conditioned on the text of the previous window (the
+    windows of a batch share their decoding options), only on the prompt.
+    Batching is therefore opt-in (constants.BATCH_SIZE = 1) and its output
+    can differ slightly, see benchmarks/parity.py.
+
+    Parameters:
+    - chunks (list): List of (chunk file path, chunk start time) tuples.
+    - batch_size (int): Number of chunks decoded together.
+    - progress_callback (function): Called with the number of finished
+        chunks every time a chunk completes.
+    - result_callback (function): Called with the chunk index and its
+        segments every time a chunk completes, not in timeline order.
+    - decode_progress_callback (function): Called with the seconds of
+        audio decoded so far after every batch.
+    - Other parameters are the same as transcribe_segments().
+
+    Returns:
+    - List of segments per chunk in timeline order, in the same format as
+    transcribe_segments().
+    """
+    import whisper
+
+    device = models.get_device()
+    if fp16 is None:
+        fp16 = device == "cuda"
+    model = load_whisper_model(
+        model_size, device=device, fp16=fp16, quantize=quantize)
+
+    print(f">>> Transcribing {len(chunks)} chunks in batches of {batch_size}")
+    chunk_segments = [[] for _ in chunks]
+    seconds_per_frame = whisper.audio.HOP_LENGTH / whisper.audio.SAMPLE_RATE
+    decoded_audio = 0.0
+    completed_chunks = 0
+
+    def decode_step(decodings):
+        """Decodes the next window of every chunk, by language."""
+        nonlocal decoded_audio
+        windows = [decoding.get_window() for decoding in decodings]
+        by_language = {}
+        for i, decoding in enumerate(decodings):
+            by_language.setdefault(decoding.language or language, []).append(i)
+        results = [None] * len(decodings)
+        with models.get_registry().get_inference_lock(model), \
+                tracing.span("decode batch", "asr", windows=len(decodings)):
+            for window_language, indices in by_language.items():
+                decoded = decode_batch(
+                    model, [windows[i][0] for i in indices], mode,
+                    window_language, beam_size, temperature, fp16,
+                    compression_ratio_threshold, prompt)
+                for i, result in zip(indices, decoded):
+                    results[i] = result
+
+        for decoding, (_, segment_size), result in zip(
+                decodings, windows, results):
+            if decoding.language is None:
+                decoding.language = language or result.language
+            time_offset = decoding.seek * seconds_per_frame
+            if (result.no_speech_prob > NO_SPEECH_THRESHOLD
+                    and result.avg_logprob < LOGPROB_THRESHOLD):
+                # Silent window
+                consumed = segment_size
+            else:
+                tokenizer = whisper.tokenizer.get_tokenizer(
+                    model.is_multilingual,
+                    num_languages=model.num_languages,
+                    language=decoding.language,
+                    task=mode)
+                segments, consumed = get_window_segments(
+                    model, tokenizer, result.tokens, time_offset,
+                    segment_size)
+                decoding.segments.extend(segments)
+            decoding.seek += consumed
+            decoded_audio += consumed * seconds_per_frame
+        if decode_progress_callback:
+            decode_progress_callback(decoded_audio)
+
+    def complete_chunk(decoding):
+        nonlocal completed_chunks
+        chunk_segments[decoding.chunk_index] = decoding.segments
+        completed_chunks += 1
+        if result_callback:
+            result_callback(decoding.chunk_index, decoding.segments)
         if progress_callback:
-            progress_callback(0)  # Reset progress if there's an error
-        return None
+            progress_callback(completed_chunks)
+
+    pending = load_chunk_decodings(chunks, model.dims.n_mels)
+    active = []
+    while True:
+        # Short chunks are replaced by the next ones as they complete
+        for decoding in pending:
+            if decoding.done:
+                complete_chunk(decoding)
+                continue
+            active.append(decoding)
+            if len(active) == batch_size:
+                break
+        if not active:
+            break
+        decode_step(active)
+        for decoding in active:
+            if decoding.done:
+                complete_chunk(decoding)
+        active = [decoding for decoding in active if not decoding.done]
+
+    return chunk_segments
@@ -1,83 +1,424 @@
-import re
 import os
-from argostranslate import package
-from argostranslate import translate
-from langdetect import detect, DetectorFactory
-from langdetect.lang_detect_exception import LangDetectException
+import re
+import time
+import threading
 
 from transcripter import paths
+from transcripter import models
+from transcripter import tracing
+from transcripter import constants
+from transcripter import subtitles
+from transcripter import translation_memory
+
+# Argos Translate and langdetect are imported on first use, they are slow
+# to import and not needed to open the app.
+
+# Splits after sentence ending punctuation
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?\u2026])\s+")
+SENTENCE_END_CHARACTERS = ".!?\u2026\"'\u00bb)"
+
+_installed_pairs = None
+_index_refresh_thread = None
+# Concurrent jobs must not install the same package twice
+_install_lock = threading.Lock()
+
+
+class Translator:
+    """
+    Translates batches of sentences for one language pair. When the pair is
+    installed as a single Argos package, its CTranslate2 model is run
+    directly so sentences are translated in batches. Other pairs (e.g.
+    pivoting through English) fall back to Argos, one sentence at a time.
+    """
+
+    def __init__(self, from_code, to_code):
+        self.from_code = from_code
+        self.to_code = to_code
+        self.translator = None
+        self.tokenizer = None
+        self.target_prefix = ""
+        self.translation = None
+        # Translations of other model versions are not reused
+        self.model_version = "argos"
+
+        from argostranslate import package
+        from argostranslate import translate
+
+        argos_package = next(
+            (p for p in package.get_installed_packages()
+             if p.from_code == from_code and p.to_code == to_code), None)
+        if argos_package:
+            self.model_version = (
+                f"argos-{getattr(argos_package, 'package_version', '')}")
+            try:
+                self.load_ctranslate2(argos_package)
+                return
+            except Exception as e:
+                print(f"Error loading {from_code} -> {to_code} model: {e}")
+
+        self.translation = translate.get_translation_from_codes(
+            from_code, to_code)
+
+    def load_ctranslate2(self, argos_package):
+        import ctranslate2
+        import sentencepiece
+
+        package_path = str(argos_package.package_path)
+        self.translator = ctranslate2.Translator(
+            os.path.join(package_path, "model"),
+            device="cpu",
+            intra_threads=os.cpu_count() or 1)
+        self.tokenizer = sentencepiece.SentencePieceProcessor(
+            model_file=os.path.join(package_path, "sentencepiece.model"))
+        self.target_prefix = getattr(argos_package, "target_prefix", "")
+
+    def translate_batch(
+            self, sentences, batch_size=constants.TRANSLATION_BATCH_SIZE):
+        """
+        Translates a list of sentences, batch_size sentences per model pass.
+        """
+        if self.translator is None:
+            return [
+                self.translation.translate(sentence)
+                for sentence in sentences]
+
+        translated = []
+        for first in range(0, len(sentences), batch_size):
+            batch = sentences[first:first + batch_size]
+            tokens = self.tokenizer.encode(batch, out_type=str)
+            target_prefix = None
+            if self.target_prefix:
+                target_prefix = [[self.target_prefix]] * len(batch)
+            results = self.translator.translate_batch(
+                tokens,
+                target_prefix=target_prefix,
+                beam_size=constants.TRANSLATION_BEAM_SIZE,
+                max_batch_size=batch_size,
+                replace_unknowns=True)
+            for result in results:
+                text = self.tokenizer.decode(result.hypotheses[0])
+                if self.target_prefix and text.startswith(self.target_prefix):
+                    text = text[len(self.target_prefix):]
+                translated.append(text.strip())
+        return translated
+
+
+def get_translator(from_code, to_code):
+    """Returns the resident translator of a language pair."""
+    return models.get_registry().get(
+        ("argos", f"{from_code}-{to_code}", "cpu", "int8"),
+        lambda: Translator(from_code, to_code))
+
+
+def translate_sentences(translator, sentences, batch_size, memory=None):
+    """
+    Translates sentences. Identical sentences are translated once and,
+    with a translation memory, sentences translated in previous runs are
+    served from disk.
+    """
+    unique_sentences = list(dict.fromkeys(
+        translation_memory.normalize_text(sentence)
+        for sentence in sentences))
+
+    known = {}
+    if memory:
+        known = memory.get_many(
+            translator.from_code, translator.to_code, unique_sentences,
+            translator.model_version)
+
+    new_sentences = [
+        sentence for sentence in unique_sentences if sentence not in known]
+    new_translations = dict(zip(
+        new_sentences, translator.translate_batch(new_sentences, batch_size)))
+    if memory and new_translations:
+        memory.put_many(
+            translator.from_code, translator.to_code, new_translations,
+            translator.model_version)
+
+    print(
+        f">>> Translation memory: {len(sentences)} sentences, "
+        f"{len(sentences) - len(unique_sentences)} duplicates, "
+        f"{len(known)}/{len(unique_sentences)} unique sentences found "
+        f"({len(known) / max(1, len(unique_sentences)):.0%} hit rate)")
+
+    translations = {**known, **new_translations}
+    return [
+        translations[translation_memory.normalize_text(sentence)]
+        for sentence in sentences]
+
+
+def split_sentences(texts):
+    """
+    Groups the text of consecutive cues into sentences. A sentence can span
+    several cues and a cue can hold several sentences.
+
+    Parameters:
+    - texts (list): Cue texts.
+
+    Returns:
+    - (list of sentences, list of fragments per sentence). A fragment is a
+    (cue index, source text length) tuple.
+    """
+    sentences = []
+    sentence_fragments = []
+    current_text = []
+    current_fragments = []
+
+    def close_sentence():
+        if current_text:
+            sentences.append(" ".join(current_text))
+            sentence_fragments.append(list(current_fragments))
+            current_text.clear()
+            current_fragments.clear()
+
+    for cue_index, text in enumerate(texts):
+        text = " ".join(text.split())
+        if not text:
+            continue
+        for piece in SENTENCE_END_PATTERN.split(text):
+            current_text.append(piece)
+            current_fragments.append((cue_index, len(piece)))
+            if (piece.endswith(tuple(SENTENCE_END_CHARACTERS))
+                    or len(current_fragments)
+                    >= constants.TRANSLATION_MAX_SENTENCE_CUES):
+                close_sentence()
+    close_sentence()
+    return sentences, sentence_fragments
+
+
+def map_translations_to_cues(cue_count, translations, sentence_fragments):
+    """
+    Maps translated sentences back onto the original cues. The words of a
+    sentence spanning several cues are distributed in proportion to the
+    length of the source text of each cue.
+    """
+    cue_texts = [[] for _ in range(cue_count)]
+    for translation, fragments in zip(translations, sentence_fragments):
+        words = translation.split()
+        total_length = sum(length for _, length in fragments) or 1
+        first_word = 0
+        source_length = 0
+        for i, (cue_index, length) in enumerate(fragments):
+            source_length += length
+            if i == len(fragments) - 1:
+                last_word = len(words)
+            else:
+                last_word = round(len(words) * source_length / total_length)
+            if last_word > first_word:
+                cue_texts[cue_index].append(
+                    " ".join(words[first_word:last_word]))
+            first_word = max(first_word, last_word)
+    return [" ".join(texts) for texts in cue_texts]
+
+
+def get_installed_pairs(refresh=False):
+    """
+    Returns the set of installed (from_code, to_code) packages. The set is
+    built once per process, so checking a pair is a lookup in memory.
+    """
+    global _installed_pairs
+    if _installed_pairs is None or refresh:
+        from argostranslate import package
+        _installed_pairs = {
+            (p.from_code, p.to_code)
+            for p in package.get_installed_packages()}
+    return _installed_pairs
+
+
+def is_pair_available(from_code, to_code):
+    """A pair is translatable directly or by pivoting through English."""
+    installed = get_installed_pairs()
+    return (from_code, to_code) in installed or (
+        (from_code, "en") in installed and ("en", to_code) in installed)
+
+
+def is_offline():
+    offline = os.environ.get("TRANSCRIPTER_OFFLINE")
+    if offline is None:
+        return constants.OFFLINE
+    return offline.lower() not in ("", "0", "false")
+
+
+def get_mirror_dir():
+    return os.environ.get(
+        "TRANSCRIPTER_ARGOS_MIRROR", constants.ARGOS_MIRROR_DIR)
+
+
+def is_package_index_stale():
+    """The local copy of the Argos package index is older than its TTL."""
+    from argostranslate import settings as argos_settings
+    index_path = str(argos_settings.local_package_index)
+    if not os.path.exists(index_path):
+        return True
+    age = time.time() - os.path.getmtime(index_path)
+    return age > constants.ARGOS_INDEX_TTL_HOURS * 3600
+
+
+def refresh_package_index():
+    """
+    Updates the local Argos package index in a background thread when it
+    is stale, so jobs never wait for the network.
+    """
+    global _index_refresh_thread
+    if is_offline() or not is_package_index_stale():
+        return
+    if _index_refresh_thread and _index_refresh_thread.is_alive():
+        return
 
+    def update():
+        from argostranslate import package
+        try:
+            package.update_package_index()
+            print(">>> Argos package index updated.")
+        except Exception as e:
+            print(f"Error updating package index: {e}")
 
-# Ensure consistent detection
-DetectorFactory.seed = 0
+    _index_refresh_thread = threading.Thread(target=update, daemon=True)
+    _index_refresh_thread.start()
 
 
+def find_mirror_package(from_code, to_code):
+    """
+    Returns the path of a from_code -> to_code .argosmodel file in the
+    local mirror folder, or None.
+    """
+    mirror_dir = get_mirror_dir()
+    if not mirror_dir or not os.path.isdir(mirror_dir):
+        return None
+    prefix = f"translate-{from_code}_{to_code}"
+    return next(
+        (os.path.join(mirror_dir, file_name)
+         for file_name in sorted(os.listdir(mirror_dir), reverse=True)
+         if file_name.startswith(prefix)
+         and file_name.endswith(".argosmodel")), None)
+
+
+@tracing.traced("install translation model", "translation")
 def install_translation_model(from_code="en", to_code="fr"):
-    """Ensure the Argos Translate model is installed."""
+    """
+    Ensure the Argos Translate model is installed. Packages are installed
+    from the local mirror folder first. Downloads use the cached package
+    index and are disabled in offline mode.
+    """
+    from argostranslate import package
+    from argostranslate import settings as argos_settings
+
     try:
-        installed = [
-            lang.code for lang in translate.get_installed_languages()]
-        if from_code in installed and to_code in installed:
-            print("Translation model already installed.")
-            return
+        with _install_lock:
+            if is_pair_available(from_code, to_code):
+                print("Translation model already installed.")
+                return
+
+            mirror_package = find_mirror_package(from_code, to_code)
+            if mirror_package:
+                print(f"Installing {from_code} -> {to_code} from "
+                      f"{mirror_package}...")
+                package.install_from_path(mirror_package)
+                get_installed_pairs(refresh=True)
+                print("Model installed successfully.")
+                return
 
-        print(f"Checking for {from_code} -> {to_code} model...")
-        package.update_package_index()
-        available = package.get_available_packages()
+            if is_offline():
+                print(
+                    f"No {from_code} -> {to_code} model installed or in the "
+                    "mirror folder, and downloads are disabled (offline).")
+                return
 
-        model = next(
-            (p for p in available if p.from_code == from_code and
-             p.to_code == to_code), None)
+            if not os.path.exists(str(argos_settings.local_package_index)):
+                print(f"Checking for {from_code} -> {to_code} model...")
+                package.update_package_index()
+            else:
+                refresh_package_index()
+            available = package.get_available_packages()
 
-        if not model:
-            print(f"No model found for {from_code} -> {to_code}.")
-            return
+            model = next(
+                (p for p in available if p.from_code == from_code and
+                 p.to_code == to_code), None)
 
-        print(f"Downloading and installing {from_code} -> {to_code}...")
-        package.install_from_path(model.download())
-        print("Model installed successfully.")
+            if not model:
+                print(f"No model found for {from_code} -> {to_code}.")
+                return
+
+            print(f"Downloading and installing {from_code} -> {to_code}...")
+            package.install_from_path(model.download())
+            get_installed_pairs(refresh=True)
+            print("Model installed successfully.")
 
     except Exception as e:
         print(f"Error installing model: {e}")
 
 
+@tracing.traced("detect language", "translation")
 def detect_language(text):
     """Detect the language of a given text using langdetect."""
+    from langdetect import detect, DetectorFactory
+    from langdetect.lang_detect_exception import LangDetectException
+
+    # Ensure consistent detection
+    DetectorFactory.seed = 0
     try:
         return detect(text)
     except LangDetectException:
         return "unknown"
 
 
-def extract_text_for_detection(srt_lines, max_lines=10):
+def extract_text_for_detection(track, max_lines=10):
     """
     Extracts a longer sample of subtitle text to improve language detection.
-    Skips timecodes and numbers.
+
+    Parameters:
+    - track (SubtitleTrack): Subtitles to sample.
+    - max_lines (int): Maximum number of text lines in the sample.
     """
     extracted_lines = []
-    for line in srt_lines:
-        line = line.strip()
-        if not line or re.match(r'^\d+$', line) or re.match(
-                r'^\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}', line):
-            continue
-        extracted_lines.append(line)
-        if len(extracted_lines) >= max_lines:
-            break
+    for text in track.texts():
+        for line in text.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            extracted_lines.append(line)
+            if len(extracted_lines) >= max_lines:
+                return " ".join(extracted_lines)
     return " ".join(extracted_lines)
 
 
-def translate_srt(input_file, input_srt, target_language="fr"):
+@tracing.traced("translate", "translation")
+def translate_texts(texts, from_code, to_code,
+                    batch_size=constants.TRANSLATION_BATCH_SIZE,
+                    memory=None):
+    """
+    Translates cue texts sentence by sentence and returns the translated
+    text of each cue.
+
+    Parameters:
+    - texts (list): Cue texts.
+    - from_code, to_code (str): Language pair, its model must be installed.
+    - batch_size (int): Number of sentences per model pass.
+    - memory (TranslationMemory): Optional translation memory.
+    """
+    sentences, sentence_fragments = split_sentences(texts)
+    print(f">>> Translating {len(sentences)} sentences of {len(texts)} cues")
+    translator = get_translator(from_code, to_code)
+    translations = translate_sentences(
+        translator, sentences, batch_size, memory)
+    return map_translations_to_cues(
+        len(texts), translations, sentence_fragments)
+
+
+def translate_srt(input_file, input_srt, target_language="fr",
+                  batch_size=constants.TRANSLATION_BATCH_SIZE,
+                  use_translation_memory=True):
     """
     Translate an SRT file while preserving timestamps and auto-detecting
     the input language. Skips translation if source and target languages
-    are the same.
+    are the same. Cue texts are grouped into sentences translated in
+    batches of batch_size. With use_translation_memory, sentences already
+    translated in a previous run are not translated again.
     """
-
-    with open(input_srt, "r", encoding="utf-8") as file:
-        lines = file.readlines()
+    track = subtitles.SubtitleTrack.load(input_srt)
 
     # Extract text for better language detection
-    sample_text = extract_text_for_detection(lines)
+    sample_text = extract_text_for_detection(track)
 
     if not sample_text:
         print("No valid text found for language detection.")
@@ -95,26 +436,19 @@ def translate_srt(input_file, input_srt, target_language="fr"):
 
     install_translation_model(src_lang, target_language)
 
-    translated = []
-    for line in lines:
-        if re.match(r'^\d+$', line) or re.match(
-                r'^\d{2}:\d{2}:\d{2},\d{3} --> '
-                r'\d{2}:\d{2}:\d{2},\d{3}', line):
-            translated.append(line)
-        elif line.strip() == "":
-            translated.append(line)
-        else:
-            translated.append(
-                translate.translate(
-                    line.strip(),
-                    src_lang,
-                    target_language) + "\n"
-            )
+    memory = None
+    if use_translation_memory:
+        memory = translation_memory.TranslationMemory()
+    try:
+        translated = translate_texts(
+            track.texts(), src_lang, target_language, batch_size, memory)
+    finally:
+        if memory:
+            memory.close()
     file_basename, file_dirname = paths.get_filename_without_ext(input_file)
     output_srt_filename = f"{file_basename}.{target_language}.srt"
     output_srt = os.path.join(file_dirname, output_srt_filename)
 
-    with open(output_srt, "w", encoding="utf-8") as file:
-        file.writelines(translated)
+    track.with_texts(translated).save(output_srt)
 
     print(f"Translated SRT saved as {output_srt}")
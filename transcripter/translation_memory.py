@@ -0,0 +1,89 @@
+'''
+Persistent translation memory, so repeated lines are translated only once.
+'''
+import os
+import time
+import sqlite3
+import threading
+
+from transcripter import paths
+
+# SQLite limits the number of variables of a query
+QUERY_BATCH_SIZE = 500
+
+
+def normalize_text(text):
+    """Collapses whitespace so layout differences don't cause misses."""
+    return " ".join(text.split())
+
+
+class TranslationMemory:
+    """
+    SQLite-backed store of translations keyed by
+    (source language, target language, normalized text, model version).
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(
+            paths.get_cache_dir(), "translation_memory.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "from_code TEXT, to_code TEXT, source_text TEXT, "
+                "model_version TEXT, translation TEXT, last_used REAL, "
+                "PRIMARY KEY (from_code, to_code, source_text, model_version))"
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, from_code, to_code, texts, model_version):
+        """
+        Returns a {normalized text: translation} dictionary of the texts
+        found in the memory.
+        """
+        texts = list({normalize_text(text) for text in texts})
+        found = {}
+        with self._lock:
+            for first in range(0, len(texts), QUERY_BATCH_SIZE):
+                batch = texts[first:first + QUERY_BATCH_SIZE]
+                rows = self._connection.execute(
+                    "SELECT source_text, translation FROM translations "
+                    "WHERE from_code = ? AND to_code = ? "
+                    "AND model_version = ? AND source_text IN "
+                    f"({', '.join('?' * len(batch))})",
+                    (from_code, to_code, model_version, *batch))
+                found.update(rows)
+
+            if found:
+                with self._connection:
+                    self._connection.executemany(
+                        "UPDATE translations SET last_used = ? "
+                        "WHERE from_code = ? AND to_code = ? "
+                        "AND source_text = ? AND model_version = ?",
+                        [(time.time(), from_code, to_code, text,
+                          model_version) for text in found])
+
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, from_code, to_code, translations, model_version):
+        """Stores a {source text: translation} dictionary."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO translations VALUES "
+                "(?, ?, ?, ?, ?, ?)",
+                [(from_code, to_code, normalize_text(text), model_version,
+                  translation, time.time())
+                 for text, translation in translations.items()])
+
+    def get_hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        self._connection.close()
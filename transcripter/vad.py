@@ -0,0 +1,156 @@
+'''
+Energy based voice activity detection used to plan chunk boundaries.
+'''
+import wave
+import numpy as np
+
+from transcripter import tracing
+from transcripter import constants
+
+
+def compute_frame_energies(
+        audio_file, frame_duration=constants.VAD_FRAME_DURATION):
+    """
+    Computes the energy (dBFS) of consecutive frames of a 16-bit mono wav
+    file. The file is read block by block to keep memory bounded.
+
+    Returns:
+    - (numpy array of frame energies, frame duration in seconds)
+    """
+    with wave.open(audio_file, "rb") as source:
+        frame_size = int(frame_duration * source.getframerate())
+        frame_duration = frame_size / source.getframerate()
+        frames_per_block = frame_size * 1000
+
+        energies = []
+        while True:
+            block = np.frombuffer(
+                source.readframes(frames_per_block), dtype=np.int16)
+            if not block.size:
+                break
+            # Zero pad the last incomplete frame
+            padding = (-block.size) % frame_size
+            block = np.pad(block.astype(np.float32), (0, padding))
+            frames = block.reshape(-1, frame_size) / 32768.0
+            rms = np.sqrt(np.mean(frames ** 2, axis=1))
+            energies.append(20 * np.log10(np.maximum(rms, 1e-10)))
+
+    if not energies:
+        return np.zeros(0, dtype=np.float32), frame_duration
+    return np.concatenate(energies), frame_duration
+
+
+def detect_speech_frames(energies):
+    """
+    Flags the frames louder than the adaptive speech threshold: a margin
+    above the noise floor, never below an absolute minimum level.
+    """
+    if not energies.size:
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(energies, constants.VAD_NOISE_PERCENTILE)
+    threshold = max(
+        noise_floor + constants.VAD_THRESHOLD_MARGIN_DB,
+        constants.VAD_MIN_SPEECH_DB)
+    return energies > threshold
+
+
+def get_speech_regions(speech_frames, frame_duration):
+    """
+    Groups speech frames into (start, end) regions in seconds. Pauses
+    shorter than VAD_MIN_SILENCE are bridged, regions shorter than
+    VAD_MIN_SPEECH are dropped and every region is padded with VAD_PADDING.
+    """
+    if not speech_frames.any():
+        return []
+
+    # Rising and falling edges of the speech mask
+    edges = np.diff(np.concatenate(([0], speech_frames.astype(np.int8), [0])))
+    starts = (np.flatnonzero(edges == 1) * frame_duration).tolist()
+    ends = (np.flatnonzero(edges == -1) * frame_duration).tolist()
+    total_duration = speech_frames.size * frame_duration
+
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < constants.VAD_MIN_SILENCE:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    padded_regions = []
+    for start, end in regions:
+        if end - start < constants.VAD_MIN_SPEECH:
+            continue
+        start = max(0.0, start - constants.VAD_PADDING)
+        end = min(total_duration, end + constants.VAD_PADDING)
+        if padded_regions and start <= padded_regions[-1][1]:
+            padded_regions[-1] = (padded_regions[-1][0], end)
+        else:
+            padded_regions.append((start, end))
+    return padded_regions
+
+
+def split_long_region(start, end, energies, frame_duration, chunk_duration):
+    """
+    Splits a region longer than chunk_duration at its quietest frames, looking
+    for the pause in the last quarter of each chunk.
+    """
+    regions = []
+    while end - start > chunk_duration:
+        search_start = int((start + chunk_duration * 0.75) / frame_duration)
+        search_end = int((start + chunk_duration) / frame_duration)
+        window = energies[search_start:search_end]
+        if window.size:
+            cut = (search_start + int(np.argmin(window))) * frame_duration
+        else:
+            cut = start + chunk_duration
+        regions.append((start, cut))
+        start = cut
+    regions.append((start, end))
+    return regions
+
+
+@tracing.traced("plan chunks", "vad")
+def plan_chunks(audio_file, chunk_duration=constants.CHUNK_DURATION):
+    """
+    Plans chunk boundaries in the pauses of the speech and drops the regions
+    without speech.
+
+    Parameters:
+    - audio_file (str): Path to a 16-bit mono wav file.
+    - chunk_duration (int): Maximum duration per chunk in seconds.
+
+    Returns:
+    - List of (start, end) chunk regions in seconds. When less than
+    VAD_MIN_SPEECH_RATIO of the audio is detected as speech, speech over a
+    loud background for instance, the whole audio is cut in chunks of
+    chunk_duration.
+    """
+    energies, frame_duration = compute_frame_energies(audio_file)
+    speech_regions = get_speech_regions(
+        detect_speech_frames(energies), frame_duration)
+
+    # Pack close speech regions into chunks, cutting in the pauses. Long
+    # silences between chunks are never decoded.
+    chunks = []
+    for start, end in speech_regions:
+        if (chunks
+                and start - chunks[-1][1] < constants.VAD_MAX_PAUSE
+                and end - chunks[-1][0] <= chunk_duration):
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.extend(split_long_region(
+                start, end, energies, frame_duration, chunk_duration))
+
+    total_duration = energies.size * frame_duration
+    speech_duration = sum(end - start for start, end in chunks)
+    if speech_duration < total_duration * constants.VAD_MIN_SPEECH_RATIO:
+        print(
+            f">>> Voice activity: {speech_duration:.1f} sec of speech out of "
+            f"{total_duration:.1f} sec, transcribing the whole audio")
+        return [
+            (start, min(start + chunk_duration, total_duration))
+            for start in np.arange(0, total_duration, chunk_duration).tolist()]
+    print(
+        f">>> Voice activity: {speech_duration:.1f} sec of speech kept "
+        f"out of {total_duration:.1f} sec in {len(chunks)} chunks")
+    return chunks